@@ -8,11 +8,42 @@
 #
 # *************************************
 
+import importlib
+
 from ._version import __version__  # noqa: F401
 from .config import setup_backend, switch_backend  # noqa: F401
-from .devices import Camera, GroundCamera, LightSensor, RangeSensor  # noqa: F401
-from .robot import Robot, Scribbler  # noqa: F401
-from .utils import Color, gallery, load_world  # noqa: F401
-from .world import Bulb, Wall, World  # noqa: F401
+
+# The rest is imported when first used, as it imports numpy:
+LAZY_NAMES = {
+    "Camera": "devices",
+    "GroundCamera": "devices",
+    "LightSensor": "devices",
+    "RangeSensor": "devices",
+    "Robot": "robot",
+    "Scribbler": "robot",
+    "Color": "utils",
+    "gallery": "utils",
+    "load_world": "utils",
+    "load_worlds": "utils",
+    "Bulb": "world",
+    "Wall": "world",
+    "World": "world",
+}
+
+__all__ = ["__version__", "setup_backend", "switch_backend"] + list(LAZY_NAMES)
+
+
+def __getattr__(name):
+    if name not in LAZY_NAMES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    module = importlib.import_module("." + LAZY_NAMES[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_NAMES))
+
 
 setup_backend()  # checks os.environ
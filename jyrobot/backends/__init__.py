@@ -43,6 +43,10 @@ def make_backend(width, height, scale):
         except Exception:
             print("Failed to make canvas backend")
             return None
+    elif BACKEND == "record":
+        from .record import RecordingBackend
+
+        return RecordingBackend(width, height, scale, **ARGS)
     elif BACKEND == "debug":
         from .debug import DebugBackend
 
@@ -94,17 +94,27 @@ class Backend:
 
     # HIGH-LEVEL Drawing API
 
-    def draw_image(self, image, x, y):
+    def draw_image(self, image, x, y, version=None):
+        """
+        Draw an image. The version, if given, changes whenever the
+        image's pixels do, for backends that keep images to draw later.
+        """
         pass
 
     def draw_lines(self, points, stroke_style=None):
+        """
+        Draw a polyline through points, an (N, 2) array-like of
+        (x, y) coordinates, as a single stroke.
+        """
         if stroke_style is not None:
             self.set_stroke_style(stroke_style)
-        for i in range(len(points)):
-            if i < len(points) - 2:
-                self.draw_line(
-                    points[i][0], points[i][1], points[i + 1][0], points[i + 1][1]
-                )
+        if len(points) < 2:
+            return
+        self.begin_path()
+        self.move_to(points[0][0], points[0][1])
+        for x, y in points[1:]:
+            self.line_to(x, y)
+        self.make_stroke()
 
     def set_stroke_style(self, color):
         self.stroke_style = color.to_hexcode()
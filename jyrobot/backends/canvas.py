@@ -57,8 +57,9 @@ class CanvasBackend(Canvas, Backend):
     def draw_lines(self, points, stroke_style=None):
         if stroke_style:
             self.strokeStyle(stroke_style, 1)
-        data = np.array(points)
-        self.stroke_lines(data)
+        if len(points) < 2:
+            return
+        self.stroke_lines(np.ascontiguousarray(points, dtype=float))
 
     def text(self, t, x, y):
         self.fill_text(t, x, y + self.char_height - 1)
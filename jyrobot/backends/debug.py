@@ -32,10 +32,10 @@ class DebugBackend(Backend):
 
     # High-level API (jyrobot draw API)
 
-    def draw_image(self, image, x, y):
+    def draw_image(self, image, x, y, version=None):
         if self.show_high:
             print("draw_image%r" % ((image, x, y)))
-        super().draw_image(image, x, y)
+        super().draw_image(image, x, y, version)
 
     def draw_lines(self, points, stroke_style=None):
         if self.show_high:
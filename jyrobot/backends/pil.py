@@ -11,9 +11,9 @@
 import io
 import math
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
-from ..utils import Color, arange, distance
+from ..utils import Color, arange
 from .base import Backend
 
 DEFAULT_FONT_NAMES = (
@@ -25,6 +25,30 @@ DEFAULT_FONT_NAMES = (
     "/Library/Fonts/Arial.ttf",
 )
 
+# Loaded fonts (or None, if none was found), by size:
+FONTS = {}
+
+
+def load_font(size):
+    """
+    Load the first of the DEFAULT_FONT_NAMES that can be found, at a
+    size. Fonts are only loaded once per process.
+
+    Args:
+        * size: (int) the font size
+    """
+    if size not in FONTS:
+        from PIL import ImageFont
+
+        FONTS[size] = None
+        for font_string_name in DEFAULT_FONT_NAMES:
+            try:
+                FONTS[size] = ImageFont.truetype(font_string_name, size)
+                break
+            except OSError:
+                continue
+    return FONTS[size]
+
 
 class PILBackend(Backend):
     # Specific to this class:
@@ -34,16 +58,17 @@ class PILBackend(Backend):
         super().__init__(*args, **kwargs)
 
     def initialize(self, **kwargs):
-        self.matrix = []
+        # Composed 2x3 affine transform (a, b, c, d, e, f), in the
+        # same order as the canvas set_transform():
+        #     x' = a * x + c * y + e
+        #     y' = b * x + d * y + f
+        self.matrix = (self._scale, 0.0, 0.0, self._scale, 0.0, 0.0)
+        self.matrix_stack = []
         self.kwargs = kwargs
-        self.font = None
+        # The font is loaded when it is first needed:
+        self._font = None
+        self._font_loaded = False
         self.font_size = kwargs.get("font_size", int(12 * self._scale))
-        for font_string_name in DEFAULT_FONT_NAMES:
-            try:
-                self.font = ImageFont.truetype(font_string_name, self.font_size)
-                break
-            except OSError:
-                continue
 
         self.mode = kwargs.get("mode", "RGB")  # "RGBA" or "RGB"
         self.format = kwargs.get(
@@ -59,13 +84,48 @@ class PILBackend(Backend):
             size=(int(self.width * self._scale), int(self.height * self._scale)),
         )
         self.draw = ImageDraw.Draw(self.image, "RGBA")
-        if self.font:
-            text_width, text_height = self.draw.textsize("0", self.font)
-            self.char_width = text_width / self._scale
-            self.char_height = text_height / self._scale
+
+    def _load_font(self):
+        self._font = load_font(self.font_size)
+        self._font_loaded = True
+        if self._font:
+            left, top, right, bottom = self.draw.textbbox((0, 0), "0", self._font)
+            self._char_width = right / self._scale
+            self._char_height = bottom / self._scale
         else:
-            self.char_width = 5.8
-            self.char_height = 10
+            self._char_width = 5.8
+            self._char_height = 10
+
+    @property
+    def font(self):
+        if not self._font_loaded:
+            self._load_font()
+        return self._font
+
+    @font.setter
+    def font(self, font):
+        self._font = font
+        self._font_loaded = True
+
+    @property
+    def char_width(self):
+        if not self._font_loaded:
+            self._load_font()
+        return self._char_width
+
+    @char_width.setter
+    def char_width(self, char_width):
+        self._char_width = char_width
+
+    @property
+    def char_height(self):
+        if not self._font_loaded:
+            self._load_font()
+        return self._char_height
+
+    @char_height.setter
+    def char_height(self, char_height):
+        self._char_height = char_height
 
     def update_dimensions(self, width, height, scale):
         if width != self.width or height != self.height or self._scale != scale:
@@ -102,7 +162,7 @@ class PILBackend(Backend):
 
     # High-level API:
 
-    def draw_image(self, image, x, y):
+    def draw_image(self, image, x, y, version=None):
         self.image.paste(image, (x, y))
 
     def get_color(self, color):
@@ -124,36 +184,53 @@ class PILBackend(Backend):
 
     def p(self, x, y):
         # Transform a point
-        for matrix in self.matrix:
-            for transform in reversed(matrix):
-                if transform[0] == "translate":
-                    x += transform[1]
-                    y += transform[2]
-                elif transform[0] == "rotate":
-                    dist = distance(0, 0, x, y)
-                    angle2 = math.atan2(-x, y)
-                    angle = transform[1]
-                    x = dist * math.cos(angle2 + angle + math.pi / 2)
-                    y = dist * math.sin(angle2 + angle + math.pi / 2)
-        return x * self._scale, y * self._scale
+        a, b, c, d, e, f = self.matrix
+        return a * x + c * y + e, b * x + d * y + f
+
+    def transform_points(self, points):
+        """
+        Transform a sequence of (x, y) points in one operation.
+        Returns a flat list [x1, y1, x2, y2, ...] suitable for
+        ImageDraw.
+        """
+        a, b, c, d, e, f = self.matrix
+        if isinstance(points, (list, tuple)):
+            # Faster than making an array of them (and doesn't need numpy):
+            flat = []
+            for x, y in points:
+                flat.append(a * x + c * y + e)
+                flat.append(b * x + d * y + f)
+            return flat
+        import numpy as np
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        xs = points[:, 0]
+        ys = points[:, 1]
+        transformed = np.empty_like(points)
+        transformed[:, 0] = a * xs + c * ys + e
+        transformed[:, 1] = b * xs + d * ys + f
+        return transformed.ravel().tolist()
 
     def r(self, angle):
         # Transform an angle
-        for matrix in self.matrix:
-            for transform in reversed(matrix):
-                if transform[0] == "translate":
-                    pass
-                elif transform[0] == "rotate":
-                    angle += transform[1]
-        return angle
+        a, b, c, d, e, f = self.matrix
+        return angle + math.atan2(b, a)
+
+    def get_matrix_scale(self):
+        # Length scale of the current transform (assumes no shear)
+        a, b, c, d, e, f = self.matrix
+        return math.sqrt(a * a + b * b)
 
     def draw_lines(self, points, stroke_style=None):
-        self.stroke_style = stroke_style
-        for i in range(len(points)):
-            if i < len(points) - 2:
-                self.draw_line(
-                    points[i][0], points[i][1], points[i + 1][0], points[i + 1][1]
-                )
+        if stroke_style is not None:
+            self.stroke_style = stroke_style
+        if len(points) < 2:
+            return
+        self.draw.line(
+            self.transform_points(points),
+            fill=self.get_style("stroke"),
+            width=self.get_line_width(),
+        )
 
     def draw_line(self, x1, y1, x2, y2):
         p1x, p1y = self.p(x1, y1)
@@ -173,36 +250,42 @@ class PILBackend(Backend):
         self.draw.text((x, y), t, fill=self.get_style("fill"), font=self.font)
 
     def pushMatrix(self):
-        self.matrix.append([])
+        self.matrix_stack.append(self.matrix)
 
     def popMatrix(self):
-        self.matrix.pop()
+        self.matrix = self.matrix_stack.pop()
 
     def scale(self, x, y):
-        pass
+        a, b, c, d, e, f = self.matrix
+        self.matrix = (a * x, b * x, c * y, d * y, e, f)
 
     def resetScale(self):
-        pass
+        self.matrix = (self._scale, 0.0, 0.0, self._scale, 0.0, 0.0)
 
     def draw_rect(self, x, y, width, height):
-        p1x, p1y = self.p(x, y)
-        p2x, p2y = self.p(x + width, y)
-        p3x, p3y = self.p(x + width, y + height)
-        p4x, p4y = self.p(x, y + height)
+        points = self.transform_points(
+            ((x, y), (x + width, y), (x + width, y + height), (x, y + height))
+        )
+        self.draw.polygon(
+            points, fill=self.get_style("fill"), outline=self.get_style("outline"),
+        )
 
+    def draw_polygon(self, points):
         self.draw.polygon(
-            (p1x, p1y, p2x, p2y, p3x, p3y, p4x, p4y),
+            self.transform_points(points),
             fill=self.get_style("fill"),
-            outline=self.get_style("outline"),
+            outline=self.get_style("stroke"),
         )
+        self.noStroke()
 
     def draw_ellipse(self, x, y, radiusX, radiusY):
         # Given as center and radius
         if radiusX == radiusY:
             x, y = self.p(x, y)
+            scale = self.get_matrix_scale()
 
-            p1x, p1y = (x - radiusX * self._scale, y - radiusY * self._scale)
-            p2x, p2y = (x + radiusX * self._scale, y + radiusY * self._scale)
+            p1x, p1y = (x - radiusX * scale, y - radiusY * scale)
+            p2x, p2y = (x + radiusX * scale, y + radiusY * scale)
 
             minx = min(p1x, p2x)
             miny = min(p1y, p2y)
@@ -218,21 +301,19 @@ class PILBackend(Backend):
             self.draw_arc(x, y, radiusX, radiusY, 0, math.pi * 2, 12)
 
     def draw_arc(self, x, y, width, height, startAngle, endAngle, segments=5):
-        points = [self.p(x, y)]
+        points = [(x, y)]
 
         for angle in arange(startAngle, endAngle, (endAngle - startAngle) / segments):
-            point = (
-                x + height * math.cos(angle),
-                y + width * math.sin(angle),
-            )
-            points.append(self.p(point[0], point[1]))
+            points.append((x + height * math.cos(angle), y + width * math.sin(angle)))
+
+        points = self.transform_points(points)
 
         self.draw.polygon(
             points, fill=self.get_style("fill"),
         )
 
         self.draw.line(
-            points[1:], fill=self.get_style("stroke"), width=self.get_line_width()
+            points[2:], fill=self.get_style("stroke"), width=self.get_line_width()
         )
 
     def beginShape(self):
@@ -240,14 +321,28 @@ class PILBackend(Backend):
 
     def endShape(self):
         self.draw.polygon(
-            self.points, fill=self.get_style("fill"), outline=self.get_style("stroke")
+            self.transform_points(self.points),
+            fill=self.get_style("fill"),
+            outline=self.get_style("stroke"),
         )
 
     def vertex(self, x, y):
-        self.points.append(self.p(x, y))
+        # Collect untransformed; transformed all at once in endShape()
+        self.points.append((x, y))
 
     def translate(self, x, y):
-        self.matrix[-1].append(("translate", x, y))
+        a, b, c, d, e, f = self.matrix
+        self.matrix = (a, b, c, d, a * x + c * y + e, b * x + d * y + f)
 
     def rotate(self, angle):
-        self.matrix[-1].append(("rotate", angle))
+        a, b, c, d, e, f = self.matrix
+        cos = math.cos(angle)
+        sin = math.sin(angle)
+        self.matrix = (
+            a * cos + c * sin,
+            b * cos + d * sin,
+            c * cos - a * sin,
+            d * cos - b * sin,
+            e,
+            f,
+        )
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import json
+import math
+from array import array
+
+import numpy as np
+
+from ..utils import Color
+from .base import Backend
+
+# Opcodes of the display list; the index is the numeric opcode:
+OPS = [
+    "clear",
+    "set_fill",
+    "set_fill_style",
+    "set_stroke_style",
+    "strokeStyle",
+    "lineWidth",
+    "noStroke",
+    "noFill",
+    "draw_line",
+    "draw_lines",
+    "draw_rect",
+    "draw_circle",
+    "draw_ellipse",
+    "draw_arc",
+    "draw_polygon",
+    "beginShape",
+    "endShape",
+    "vertex",
+    "pushMatrix",
+    "popMatrix",
+    "translate",
+    "rotate",
+    "scale",
+    "text",
+    "set_font",
+    "draw_image",
+]
+(
+    CLEAR,
+    SET_FILL,
+    SET_FILL_STYLE,
+    SET_STROKE_STYLE,
+    STROKE_STYLE,
+    LINE_WIDTH,
+    NO_STROKE,
+    NO_FILL,
+    DRAW_LINE,
+    DRAW_LINES,
+    DRAW_RECT,
+    DRAW_CIRCLE,
+    DRAW_ELLIPSE,
+    DRAW_ARC,
+    DRAW_POLYGON,
+    BEGIN_SHAPE,
+    END_SHAPE,
+    VERTEX,
+    PUSH_MATRIX,
+    POP_MATRIX,
+    TRANSLATE,
+    ROTATE,
+    SCALE,
+    TEXT,
+    SET_FONT,
+    DRAW_IMAGE,
+) = range(len(OPS))
+
+NO_COLOR = (math.nan, math.nan, math.nan, math.nan)
+
+
+def encode_color(color):
+    if color is None:
+        return NO_COLOR
+    if not isinstance(color, Color):
+        color = Color(color)
+    return (color.red, color.green, color.blue, color.alpha)
+
+
+def decode_color(values):
+    if math.isnan(values[0]):
+        return None
+    return Color(*values)
+
+
+class DisplayList:
+    """
+    A compact list of drawing commands: one numeric opcode per command,
+    with all numeric arguments packed into a single array of doubles.
+    Strings and images are kept in side tables and referred to by index;
+    images are copied when recorded, once per version.
+
+    Commands are grouped into frames, one per World.draw().
+    """
+
+    def __init__(self, width, height, scale):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.ops = array("B")
+        self.offsets = array("L")  # start of each command's args
+        self.args = array("d")
+        self.frames = array("L")  # end (exclusive) of each frame, in ops
+        self.strings = []
+        self.images = []
+        self._string_index = {}
+        self._image_index = {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return "<DisplayList frames=%r, commands=%r>" % (len(self.frames), len(self.ops))
+
+    def clear(self):
+        self.__init__(self.width, self.height, self.scale)
+
+    def add(self, op, args=()):
+        self.ops.append(op)
+        self.offsets.append(len(self.args))
+        self.args.extend(args)
+
+    def add_points(self, points):
+        # Add to the last command's args, copied in one go:
+        self.args.frombytes(np.ascontiguousarray(points, dtype=np.float64).tobytes())
+
+    def end_frame(self):
+        start = self.frames[-1] if len(self.frames) > 0 else 0
+        if len(self.ops) > start:
+            self.frames.append(len(self.ops))
+
+    def string_index(self, string):
+        if string not in self._string_index:
+            self._string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return self._string_index[string]
+
+    def image_index(self, image, version=None):
+        # Images can change after they are drawn, so keep a copy of each
+        # version (and of every image without one):
+        if version is None or version not in self._image_index:
+            index = len(self.images)
+            self.images.append(image.copy())
+            if version is None:
+                return index
+            self._image_index[version] = index
+        return self._image_index[version]
+
+    def get_frame_range(self, frame):
+        if frame < 0:
+            frame += len(self.frames)
+        if not (0 <= frame < len(self.frames)):
+            raise IndexError("no such frame: %r" % frame)
+        start = self.frames[frame - 1] if frame > 0 else 0
+        return start, self.frames[frame]
+
+    def replay(self, backend, frame=-1):
+        """
+        Replay a recorded frame into a backend.
+
+        Args:
+            * backend: any jyrobot Backend
+            * frame: (int) index of the frame to replay
+        """
+        start, stop = self.get_frame_range(frame)
+        args = self.args
+        with backend:
+            for i in range(start, stop):
+                name = OPS[self.ops[i]]
+                a = self.offsets[i]
+                b = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(args)
+                if name in ("set_fill", "set_fill_style", "set_stroke_style"):
+                    color = decode_color(args[a:b])
+                    if color is not None or name == "set_fill":
+                        getattr(backend, name)(color)
+                elif name == "strokeStyle":
+                    backend.strokeStyle(decode_color(args[a : a + 4]), args[a + 4])
+                elif name in ("draw_lines", "draw_polygon"):
+                    if name == "draw_lines":
+                        stroke_style = decode_color(args[a : a + 4])
+                        a += 4
+                    points = np.frombuffer(args[a:b], dtype=float).reshape(-1, 2)
+                    if name == "draw_lines":
+                        backend.draw_lines(points, stroke_style)
+                    else:
+                        backend.draw_polygon(points.tolist())
+                elif name == "text":
+                    backend.text(self.strings[int(args[a])], args[a + 1], args[a + 2])
+                elif name == "set_font":
+                    backend.set_font(self.strings[int(args[a])])
+                elif name == "draw_image":
+                    backend.draw_image(
+                        self.images[int(args[a])], int(args[a + 1]), int(args[a + 2])
+                    )
+                else:
+                    getattr(backend, name)(*args[a:b])
+
+    def take_picture(self, frame=-1, scale=None, **kwargs):
+        """
+        Rasterize a recorded frame with the PIL backend.
+
+        Args:
+            * frame: (int) index of the frame to rasterize
+            * scale: (number) scale to draw at; defaults to the recorded scale
+        """
+        from .pil import PILBackend
+
+        backend = PILBackend(
+            self.width, self.height, scale if scale is not None else self.scale, **kwargs
+        )
+        self.replay(backend, frame)
+        return backend.take_picture(None)
+
+    def save(self, filename):
+        """
+        Save the display list to a NumPy .npz file.
+        """
+        images = {
+            "image_%s" % i: np.asarray(image) for i, image in enumerate(self.images)
+        }
+        np.savez_compressed(
+            filename,
+            size=np.array([self.width, self.height, self.scale], dtype=float),
+            ops=np.frombuffer(self.ops, dtype=np.uint8),
+            offsets=np.array(self.offsets, dtype=np.int64),
+            args=np.frombuffer(self.args, dtype=float),
+            frames=np.array(self.frames, dtype=np.int64),
+            strings=np.array(json.dumps(self.strings)),
+            **images
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a display list saved with DisplayList.save().
+        """
+        from PIL import Image
+
+        data = np.load(filename)
+        width, height, scale = data["size"].tolist()
+        display_list = cls(width, height, scale)
+        display_list.ops = array("B", data["ops"].tobytes())
+        display_list.offsets = array("L", data["offsets"].tolist())
+        display_list.args = array("d", data["args"].tobytes())
+        display_list.frames = array("L", data["frames"].tolist())
+        display_list.strings = json.loads(str(data["strings"]))
+        count = len([name for name in data.files if name.startswith("image_")])
+        display_list.images = [
+            Image.fromarray(data["image_%s" % i]) for i in range(count)
+        ]
+        return display_list
+
+
+class RecordingBackend(Backend):
+    """
+    A backend that does not draw, but records the high-level drawing
+    commands into a DisplayList for later replay into any other backend.
+    """
+
+    def initialize(self, **kwargs):
+        self.display_list = DisplayList(self.width, self.height, self._scale)
+        self.widget_backend = None
+
+    def update_dimensions(self, width, height, scale):
+        self.width = width
+        self.height = height
+        self._scale = scale
+        self.display_list.width = width
+        self.display_list.height = height
+        self.display_list.scale = scale
+
+    def flush(self):
+        self.display_list.end_frame()
+
+    def take_picture(self, time):
+        if len(self.display_list) == 0:
+            return None
+        return self.display_list.take_picture()
+
+    def watch(self):
+        from .pil import PILBackend
+
+        if self.widget_backend is None:
+            self.widget_backend = PILBackend(self.width, self.height, self._scale)
+        self.draw_watcher()
+        return self.widget_backend.watch()
+
+    def draw_watcher(self):
+        if self.widget_backend is not None and len(self.display_list) > 0:
+            self.display_list.replay(self.widget_backend)
+            self.widget_backend.draw_watcher()
+
+    # High-level API (jyrobot draw API):
+
+    def clear(self):
+        self.display_list.add(CLEAR)
+
+    def set_fill(self, color):
+        self.display_list.add(SET_FILL, encode_color(color))
+
+    def set_fill_style(self, color):
+        self.display_list.add(SET_FILL_STYLE, encode_color(color))
+
+    def set_stroke_style(self, color):
+        self.display_list.add(SET_STROKE_STYLE, encode_color(color))
+
+    def strokeStyle(self, color, width):
+        self.display_list.add(STROKE_STYLE, encode_color(color) + (width,))
+
+    def lineWidth(self, width):
+        self.display_list.add(LINE_WIDTH, (width,))
+
+    def noStroke(self):
+        self.display_list.add(NO_STROKE)
+
+    def noFill(self):
+        self.display_list.add(NO_FILL)
+
+    def draw_line(self, x1, y1, x2, y2):
+        self.display_list.add(DRAW_LINE, (x1, y1, x2, y2))
+
+    def draw_lines(self, points, stroke_style=None):
+        self.display_list.add(DRAW_LINES, encode_color(stroke_style))
+        self.display_list.add_points(points)
+
+    def draw_rect(self, x, y, width, height):
+        self.display_list.add(DRAW_RECT, (x, y, width, height))
+
+    def draw_circle(self, x, y, radius):
+        self.display_list.add(DRAW_CIRCLE, (x, y, radius))
+
+    def draw_ellipse(self, x, y, radiusX, radiusY):
+        self.display_list.add(DRAW_ELLIPSE, (x, y, radiusX, radiusY))
+
+    def draw_arc(self, x, y, width, height, startAngle, endAngle):
+        self.display_list.add(DRAW_ARC, (x, y, width, height, startAngle, endAngle))
+
+    def draw_polygon(self, points):
+        self.display_list.add(DRAW_POLYGON)
+        self.display_list.add_points(points)
+
+    def beginShape(self):
+        self.display_list.add(BEGIN_SHAPE)
+
+    def endShape(self):
+        self.display_list.add(END_SHAPE)
+
+    def vertex(self, x, y):
+        self.display_list.add(VERTEX, (x, y))
+
+    def pushMatrix(self):
+        self.display_list.add(PUSH_MATRIX)
+
+    def popMatrix(self):
+        self.display_list.add(POP_MATRIX)
+
+    def translate(self, x, y):
+        self.display_list.add(TRANSLATE, (x, y))
+
+    def rotate(self, angle):
+        self.display_list.add(ROTATE, (angle,))
+
+    def scale(self, xscale, yscale):
+        self.display_list.add(SCALE, (xscale, yscale))
+
+    def resetScale(self):
+        pass
+
+    def text(self, t, x, y):
+        self.display_list.add(TEXT, (self.display_list.string_index(t), x, y))
+
+    def set_font(self, style):
+        self.display_list.add(SET_FONT, (self.display_list.string_index(style),))
+
+    def draw_image(self, image, x, y, version=None):
+        index = self.display_list.image_index(image, version)
+        self.display_list.add(DRAW_IMAGE, (index, x, y))
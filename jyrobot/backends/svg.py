@@ -72,6 +72,21 @@ class SVGBackend(Backend):
             picture = picture.convert("RGBA")
         return picture
 
+    # High-level API:
+
+    def draw_lines(self, points, stroke_style=None):
+        if stroke_style is not None:
+            self.set_stroke_style(stroke_style)
+        if len(points) < 2:
+            return
+        style = self.get_style("stroke", "stroke-width", "stroke-opacity")
+        self.stack[-1].add(
+            self.stack[0].polyline(
+                points=[(round(float(x), 2), round(float(y), 2)) for x, y in points],
+                style=style + ";fill:none",
+            )
+        )
+
     # Low-level API:
 
     def set_stroke_style(self, color):
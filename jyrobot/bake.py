@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+"""
+Bake the static walls of a world into a table of what a ray sees
+from every pose, so that robots only have to cast rays at each other.
+
+From the command line:
+
+    python -m jyrobot.bake two-scribblers two-scribblers-table
+
+Then, in a program:
+
+    world.set_depth_table("two-scribblers-table")
+"""
+
+import copy
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from .fields import HIT_TOLERANCE, OccupancyGrid, RayHits, intersect_lines
+from .utils import distance, intersect_hit
+
+# The per-process state of the baking workers:
+_BAKE = {}
+
+
+def get_walls_key(walls, width, height):
+    """
+    Get a key for the static walls (walls that aren't robots) of a
+    world; a DepthTable can only be used in worlds with the same key.
+
+    Args:
+        * walls: (list) the world's walls; robots' walls are skipped
+        * width: (number) the width of the world, in CM
+        * height: (number) the height of the world, in CM
+    """
+    items = [width, height]
+    for wall in walls:
+        if wall.robot is None:
+            items.append(wall.color.to_tuple())
+            for line in wall.lines:
+                items.append((line.p1.x, line.p1.y, line.p2.x, line.p2.y))
+    return hashlib.sha1(repr(items).encode("utf-8")).hexdigest()
+
+
+def bake_rays(lines, x, y, angles, max_range):
+    """
+    Find the closest line that each of a fan of rays hits, the same way
+    as utils.intersect_hit().
+
+    Args:
+        * lines: (ndarray) the lines, shaped (n, 4) as x1, y1, x2, y2
+        * x: (number) the x coordinate of the start of the rays, in CM
+        * y: (number) the y coordinate of the start of the rays, in CM
+        * angles: (ndarray) the directions of the rays, as in robot.cast_ray()
+        * max_range: (number) the length of the rays, in CM
+
+    Returns the distances to the closest hits (inf for none), and the
+    indices of the lines hit (-1 for none).
+    """
+    x2 = (np.sin(angles) * max_range + x)[:, np.newaxis]
+    y2 = (np.cos(angles) * max_range + y)[:, np.newaxis]
+    hx, hy, ok = intersect_lines(x, y, x2, y2, lines)
+    dist = np.where(ok, np.hypot(hx - x, hy - y), np.inf)
+    if dist.shape[1] == 0:
+        return np.full(len(angles), np.inf), np.full(len(angles), -1)
+    closest = np.argmin(dist, axis=1)
+    dist = dist[np.arange(len(angles)), closest]
+    return dist, np.where(np.isfinite(dist), closest, -1)
+
+
+def _init_bake(lines, line_walls, resolution, nx, angles, max_range):
+    _BAKE.update(
+        lines=lines,
+        line_walls=line_walls,
+        resolution=resolution,
+        nx=nx,
+        angles=angles,
+        max_range=max_range,
+    )
+
+
+def _bake_row(i):
+    lines, line_walls = _BAKE["lines"], _BAKE["line_walls"]
+    resolution, nx = _BAKE["resolution"], _BAKE["nx"]
+    angles = np.arange(_BAKE["angles"]) * (2 * math.pi / _BAKE["angles"])
+    max_range = _BAKE["max_range"]
+    y = i * resolution
+    # Only the lines in reach of this row, and then of each point on it:
+    low = np.minimum(lines[:, 1], lines[:, 3])
+    high = np.maximum(lines[:, 1], lines[:, 3])
+    near = (low <= y + max_range) & (high >= y - max_range)
+    lines, line_walls = lines[near], line_walls[near]
+    low = np.minimum(lines[:, 0], lines[:, 2])
+    high = np.maximum(lines[:, 0], lines[:, 2])
+    walls = np.empty((nx, len(angles)), dtype=np.int32)
+    for j in range(nx):
+        x = j * resolution
+        near = (low <= x + max_range) & (high >= x - max_range)
+        dist, closest = bake_rays(lines[near], x, y, angles, max_range)
+        walls[j] = np.where(closest >= 0, line_walls[near][closest], -1)
+    return i, walls
+
+
+def bake_world(
+    world, path, resolution=5.0, angles=360, max_range=1000.0, processes=None
+):
+    """
+    Bake a world's static walls (walls that aren't robots) into a
+    DepthTable, saved in a directory. For every pose (x, y, direction)
+    on a grid, it holds which static wall a ray hits first. The rows
+    of the grid are baked in parallel, on all of the CPUs by default.
+
+    Args:
+        * world: (World) the world to bake
+        * path: (str) the directory to save the table in
+        * resolution: (number) the spacing of the grid points, in CM
+        * angles: (int) the number of ray directions at each grid point
+        * max_range: (number) the length of the rays, in CM
+        * processes: (int) how many processes to use; 1 bakes in this one
+
+    Returns the DepthTable.
+    """
+    static_walls = [wall for wall in world.walls if wall.robot is None]
+    lines = []
+    line_walls = []
+    for index, wall in enumerate(static_walls):
+        for line in wall.lines:
+            lines.append((line.p1.x, line.p1.y, line.p2.x, line.p2.y))
+            line_walls.append(index)
+    lines = np.array(lines, dtype=float).reshape((-1, 4))
+    line_walls = np.array(line_walls, dtype=np.int32)
+    nx = int(math.floor(world.width / resolution)) + 1
+    ny = int(math.floor(world.height / resolution)) + 1
+
+    os.makedirs(path, exist_ok=True)
+    header_filename = os.path.join(path, "table.json")
+    if os.path.exists(header_filename):
+        os.remove(header_filename)
+    dtype = np.int16 if len(static_walls) < 2 ** 15 else np.int32
+    walls = np.lib.format.open_memmap(
+        os.path.join(path, "wall.npy"), mode="w+", dtype=dtype, shape=(ny, nx, angles)
+    )
+    args = (lines, line_walls, resolution, nx, angles, max_range)
+    if processes == 1:
+        _init_bake(*args)
+        results = map(_bake_row, range(ny))
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_bake, initargs=args)
+        results = pool.imap_unordered(_bake_row, range(ny))
+    try:
+        for i, row_walls in results:
+            walls[i] = row_walls
+    finally:
+        if pool is not None:
+            pool.terminate()
+    walls.flush()
+    del walls
+
+    # The header goes last, so a table is only loaded once it's complete:
+    header = {
+        "key": get_walls_key(world.walls, world.width, world.height),
+        "resolution": resolution,
+        "angles": angles,
+        "max_range": max_range,
+    }
+    temp_filename = "%s.%s.tmp" % (header_filename, os.getpid())
+    with open(temp_filename, "w") as fp:
+        json.dump(header, fp)
+    os.replace(temp_filename, header_filename)
+    return DepthTable(path)
+
+
+class DepthTable:
+    """
+    A table of the first static wall (wall that isn't a robot) that a
+    ray hits from each pose on a grid, made by bake_world(). The table
+    is memory-mapped, so processes share one copy of it.
+
+    A ray is intersected with the walls that the 8 poses around it in
+    the table see first, and then, as those poses can see past walls
+    in front of it (from their side of them, or around their ends),
+    with the walls in the cells of the OccupancyGrid that it passes
+    through before the closest of those hits. So its cost depends on
+    how far it goes rather than on the number of walls. Rays that those
+    poses see no wall for are left to be cast exactly. Robots are still
+    intersected exactly.
+
+    Args:
+        * path: (str) the directory that bake_world() saved the table in
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "table.json")) as fp:
+            header = json.load(fp)
+        self.path = path
+        self.key = header["key"]
+        self.resolution = header["resolution"]
+        self.angles = header["angles"]
+        self.max_range = header["max_range"]
+        self.walls = np.load(os.path.join(path, "wall.npy"), mmap_mode="r")
+        # The world's static walls that the table's indices refer to
+        # (None if they don't match), and the version of them that
+        # was checked (see World.get_depth_table()):
+        self.static_walls = None
+        self.version = None
+        self.grid = OccupancyGrid(self.resolution)
+
+    def __repr__(self):
+        return "<DepthTable %r resolution=%r, angles=%r>" % (
+            self.path,
+            self.resolution,
+            self.angles,
+        )
+
+    def copy(self):
+        """
+        Get a copy that shares the table, to bind to another world's
+        walls (like a World.clone()'s).
+        """
+        table = copy.copy(self)
+        table.grid = self.grid.copy()
+        return table
+
+    def bind(self, walls, width, height, version=None):
+        """
+        Use the static walls of a world that the table was baked from.
+
+        Args:
+            * walls: (list) the world's walls; robots' walls are skipped
+            * width: (number) the width of the world, in CM
+            * height: (number) the height of the world, in CM
+            * version: the version of the walls
+        """
+        self.static_walls = [wall for wall in walls if wall.robot is None]
+        self.grid.build(walls, width, height, version)
+        self.version = version
+
+    def find_walls(self, x, y, a):
+        """
+        Get the indices of the static walls that the poses around a ray
+        see first, -1 meaning no wall, or None if the ray starts off the
+        grid.
+
+        Args:
+            * x: (number) the x coordinate of the start, in CM
+            * y: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, as in robot.cast_ray()
+        """
+        ny, nx, na = self.walls.shape
+        fx = x / self.resolution
+        fy = y / self.resolution
+        if not (0 <= fx <= nx - 1 and 0 <= fy <= ny - 1):
+            return None
+        j = int(fx)
+        i = int(fy)
+        k = int((a % (2 * math.pi)) / (2 * math.pi) * na) % na
+        return set(self.walls[i : i + 2, j : j + 2][..., [k, (k + 1) % na]].flat)
+
+    def _find_closest(self, x1, y1, x2, y2, walls):
+        """
+        Get the (distance, wall, line) of the closest of the walls' lines
+        that a segment hits, or None, and the number of lines tested.
+        """
+        closest = None
+        tested = 0
+        for wall in walls:
+            tested += len(wall.lines)
+            for line in wall.lines:
+                pos = intersect_hit(
+                    x1, y1, x2, y2, line.p1.x, line.p1.y, line.p2.x, line.p2.y
+                )
+                if pos is not None:
+                    dist = distance(pos[0], pos[1], x1, y1)
+                    if closest is None or dist < closest[0]:
+                        closest = (dist, wall, line)
+        return closest, tested
+
+    def cast_ray(
+        self, x1, y1, a, max_range, robots=(), robot=None, mode="all", profiler=None
+    ):
+        """
+        Cast a ray, like robot.cast_ray(), except that only the first
+        static wall is hit. Returns None if the table can't answer,
+        because the ray starts off the grid, is too long, or misses all
+        of the walls seen around it (or there are none).
+
+        Args:
+            * x1: (number) the x coordinate of the start, in CM
+            * y1: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, as in robot.cast_ray()
+            * max_range: (number) the length of the ray, in CM
+            * robots: (list) the robots that can be hit
+            * robot: (Robot) a robot to ignore, like the one casting the ray
+            * mode: (str) which hits to return, as in RayHits
+            * profiler: (Profiler) counts the ray, if given
+
+        Returns list of hits, furthest away first (back to front)
+        """
+        if max_range > self.max_range:
+            return None
+        indices = self.find_walls(x1, y1, a)
+        if indices is None:
+            return None
+        # Find the first wall hit along the whole length of the table's
+        # rays, which might be past the end of this one:
+        x2 = math.sin(a) * self.max_range + x1
+        y2 = math.cos(a) * self.max_range + y1
+        walls = [self.static_walls[index] for index in indices if index >= 0]
+        closest, tested = self._find_closest(x1, y1, x2, y2, walls)
+        if closest is None:
+            # Even if the poses around it hit nothing, a small wall can
+            # be between their rays:
+            return None
+        # The poses around it can see past a wall in front of this ray
+        # (from the other side of it, or around its end), so intersect
+        # the walls in the cells before that hit too (and a little
+        # behind the start, where rays also hit):
+        dx = math.sin(a) * HIT_TOLERANCE
+        dy = math.cos(a) * HIT_TOLERANCE
+        reach = closest[0] + HIT_TOLERANCE
+        walls = self.grid.find_walls(
+            x1 - dx,
+            y1 - dy,
+            x1 + math.sin(a) * reach,
+            y1 + math.cos(a) * reach,
+        )
+        nearer, count = self._find_closest(x1, y1, x2, y2, walls)
+        tested += count
+        if nearer is not None and nearer[0] < closest[0]:
+            closest = nearer
+
+        query = RayHits(x1, y1, mode, profiler)
+        query.tested = tested + 1
+        x2 = math.sin(a) * max_range + x1
+        y2 = math.cos(a) * max_range + y1
+        # Intersect again with this ray, for the same results as
+        # robot.cast_ray() gets:
+        dist, wall, line = closest
+        pos = intersect_hit(x1, y1, x2, y2, line.p1.x, line.p1.y, line.p2.x, line.p2.y)
+        if pos is not None:
+            query.add(pos, wall)
+        if not query.done:
+            query.add_robots(x2, y2, robots, robot)
+        return query.get_hits()
+
+
+def main(args=None):
+    import argparse
+
+    from .utils import load_world
+
+    parser = argparse.ArgumentParser(
+        prog="python -m jyrobot.bake", description="Bake a world into a DepthTable."
+    )
+    parser.add_argument("world", help="the name or filename of the world")
+    parser.add_argument("path", help="the directory to save the table in")
+    parser.add_argument("--resolution", type=float, default=5.0)
+    parser.add_argument("--angles", type=int, default=360)
+    parser.add_argument("--max-range", type=float, default=1000.0)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(args)
+    world = load_world(args.world)
+    table = bake_world(
+        world,
+        args.path,
+        args.resolution,
+        args.angles,
+        args.max_range,
+        args.processes,
+    )
+    print("Baked %s" % table)
+
+
+if __name__ == "__main__":
+    main()
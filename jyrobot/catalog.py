@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import fnmatch
+import json
+import os
+
+from .config import get_jyrobot_search_paths
+
+# Catalogs, by absolute search path:
+CATALOGS = {}
+
+
+class CatalogEntry:
+    """
+    A file found in a catalog.
+    """
+
+    def __init__(self, path, size, mtime):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self._header = None
+        self._header_key = None
+
+    def __repr__(self):
+        return "<CatalogEntry %r>" % self.path
+
+    def get_header(self):
+        """
+        Get a summary of a world file: its top-level settings, with
+        lists (like robots and walls) replaced by their lengths. The
+        file is only parsed again if it has changed.
+        """
+        stat = os.stat(self.path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self._header_key != key:
+            with open(self.path) as fp:
+                config = json.load(fp)
+            self._header = {
+                name: len(value) if isinstance(value, (list, dict)) else value
+                for name, value in config.items()
+            }
+            self._header_key = key
+        return self._header
+
+
+class Catalog:
+    """
+    An index of all of the files under a search path, by their
+    relative names (like "test1/w1.json"). The index is built on first
+    use; a directory is scanned again only when its modification time
+    changes (when files are added, removed, or renamed in it).
+
+    Args:
+        * path: (str) the directory to index
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.dirs = {}  # relative directory: mtime
+        self.entries = {}  # relative filename: CatalogEntry
+
+    def __repr__(self):
+        return "<Catalog %r files=%r>" % (self.path, len(self.entries))
+
+    def _scan(self, directory):
+        full_path = os.path.join(self.path, directory)
+        self._forget(directory, recursive=False)
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+            items = list(os.scandir(full_path))
+        except OSError:
+            self._forget(directory)
+            return
+        self.dirs[directory] = mtime
+        subdirs = set()
+        for item in items:
+            name = os.path.join(directory, item.name) if directory else item.name
+            if item.is_dir():
+                subdirs.add(name)
+                if name not in self.dirs:
+                    self._scan(name)
+            elif item.is_file():
+                stat = item.stat()
+                self.entries[name] = CatalogEntry(
+                    item.path, stat.st_size, stat.st_mtime_ns
+                )
+        # Forget subdirectories that are gone:
+        for name in list(self.dirs):
+            if name and os.path.dirname(name) == directory and name not in subdirs:
+                self._forget(name)
+
+    def _forget(self, directory, recursive=True):
+        """
+        Drop the entries in a directory (and, if recursive, the
+        directory and everything below it).
+        """
+        prefix = directory + os.sep if directory else ""
+        for name in list(self.entries):
+            if os.path.dirname(name) == directory or (
+                recursive and name.startswith(prefix)
+            ):
+                del self.entries[name]
+        if recursive:
+            for name in list(self.dirs):
+                if name == directory or name.startswith(prefix):
+                    del self.dirs[name]
+
+    def _check(self, directory):
+        """
+        Scan the closest indexed directory to this one again, if it
+        has changed.
+        """
+        if "" not in self.dirs:
+            self._scan("")
+            return
+        while directory and directory not in self.dirs:
+            directory = os.path.dirname(directory)
+        try:
+            mtime = os.stat(os.path.join(self.path, directory)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.dirs[directory]:
+            self._scan(directory)
+
+    def refresh(self):
+        """
+        Scan every directory that has changed since it was indexed.
+        """
+        self._check("")
+        for directory in sorted(self.dirs, key=lambda name: name.count(os.sep)):
+            if directory in self.dirs:
+                self._check(directory)
+
+    def find(self, filename):
+        """
+        Find a file by its name relative to the catalog's path.
+
+        Args:
+            * filename: (str) the relative filename
+
+        Returns a CatalogEntry, or None.
+        """
+        filename = os.path.normpath(filename)
+        self._check(os.path.dirname(filename))
+        return self.entries.get(filename)
+
+    def names(self, pattern="*"):
+        """
+        List the relative filenames that match a pattern, like "*.json".
+
+        Args:
+            * pattern: (str) a shell-style wildcard pattern
+        """
+        self.refresh()
+        return [name for name in self.entries if fnmatch.fnmatch(name, pattern)]
+
+
+def get_catalog(path):
+    """
+    Get the catalog for a search path.
+    """
+    path = os.path.abspath(path)
+    if path not in CATALOGS:
+        CATALOGS[path] = Catalog(path)
+    return CATALOGS[path]
+
+
+def find_file(filename):
+    """
+    Find a file on the jyrobot search paths. Returns the absolute path
+    of the first match, or None.
+
+    Args:
+        * filename: (str) the filename, relative to a search path
+    """
+    relative = not os.path.isabs(filename) and not os.path.normpath(
+        filename
+    ).startswith(os.pardir)
+    for path in get_jyrobot_search_paths():
+        if relative:
+            entry = get_catalog(path).find(filename)
+            if entry is not None:
+                return entry.path
+        else:
+            path_filename = os.path.abspath(os.path.join(path, filename))
+            if os.path.exists(path_filename):
+                return path_filename
+    return None
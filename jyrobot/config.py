@@ -8,13 +8,15 @@
 #
 # *************************************
 
-import ast
 import os
 
 JYROBOTPATH = None
+CACHE_DIR = None
+# Images at least this many bytes are memory-mapped from the cache:
+MMAP_THRESHOLD = 16 * 1024 * 1024
 BACKEND = "pil"  # or any valid backends
 ARGS = {}
-VALID_BACKENDS = ["canvas", "svg", "debug", "pil"]
+VALID_BACKENDS = ["canvas", "svg", "debug", "pil", "record"]
 
 
 def get_jyrobot_search_paths():
@@ -41,11 +43,54 @@ def set_jyrobot_path(path):
     JYROBOTPATH = path
 
 
+def get_jyrobot_cache_dir(subdir=None):
+    """
+    Get the jyrobot cache directory (or a subdirectory of it),
+    creating it if needed.
+    """
+    cache_dir = os.environ.get("JYROBOT_CACHE", CACHE_DIR)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser("~"), ".jyrobot")
+        if not os.access(cache_dir, os.W_OK) and not os.access(
+            os.path.dirname(cache_dir), os.W_OK
+        ):
+            cache_dir = os.path.join("/tmp", ".jyrobot")
+    if subdir is not None:
+        cache_dir = os.path.join(cache_dir, subdir)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def set_jyrobot_cache_dir(path):
+    """
+    Set a custom directory for jyrobot's cached files
+    """
+    global CACHE_DIR
+    CACHE_DIR = path
+
+
+def get_mmap_threshold():
+    """
+    Get the size, in bytes, at which images are memory-mapped
+    """
+    return MMAP_THRESHOLD
+
+
+def set_mmap_threshold(nbytes):
+    """
+    Set the size, in bytes, at which images are memory-mapped
+    """
+    global MMAP_THRESHOLD
+    MMAP_THRESHOLD = nbytes
+
+
 def setup_backend():
     global BACKEND, ARGS
 
     BACKEND = os.environ.get("JYROBOT_BACKEND", BACKEND)
     if ":" in BACKEND:
+        import ast
+
         BACKEND, ARGS = BACKEND.split(":", 1)
         ARGS = ast.literal_eval(ARGS)
     else:
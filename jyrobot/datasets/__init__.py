@@ -8,22 +8,15 @@
 #
 # *************************************
 
-import os
-
-_jyrobot_base_dir = os.path.expanduser("~")
-if not os.access(_jyrobot_base_dir, os.W_OK):
-    _jyrobot_base_dir = "/tmp"
-
-_jyrobot_dir = os.path.join(_jyrobot_base_dir, ".jyrobot")
-
-if not os.path.exists(_jyrobot_dir):
-    try:
-        os.makedirs(_jyrobot_dir)
-    except OSError:
-        pass
-
 
 def get_dataset(dataset):
+    """
+    Get the function that returns a dataset's images. Datasets are only
+    downloaded (and their directories created) when first asked for.
+
+    Args:
+        * dataset: (str) "coil20" or "coil100"
+    """
     get = None
     if dataset == "coil20":
         from .coil20 import get
@@ -12,7 +12,7 @@ import os
 
 from PIL import Image
 
-from .utils import get_file, round_to_nearest
+from .utils import get_file, load_atlas, round_to_nearest
 
 _filename = get_file(
     "coil-100-no-background.zip",
@@ -37,6 +37,16 @@ def get_range():
 def get(obj_num, degree):
     slice = degree % 360  # map into range 0 to 360
     slice = min(max(round_to_nearest(slice, 5), 0), 355)  # get the nearest 5th degree
-    filename = os.path.join(DATA_DIR, "obj%s__%s.png" % (obj_num, slice))
-    image = Image.open(filename)
-    return image
+    return Image.fromarray(get_atlas(obj_num)[int(slice // 5)])
+
+
+def get_atlas(obj_num):
+    """
+    Get all 72 views of an object as an atlas (see
+    datasets.utils.load_atlas()); view i was taken at i * 5 degrees.
+    """
+    filenames = [
+        os.path.join(DATA_DIR, "obj%s__%s.png" % (obj_num, slice))
+        for slice in range(0, 360, 5)
+    ]
+    return load_atlas("coil100-obj%s" % obj_num, filenames)
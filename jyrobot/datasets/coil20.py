@@ -12,7 +12,7 @@ import os
 
 from PIL import Image
 
-from .utils import get_file, round_to_nearest
+from .utils import get_file, load_atlas, round_to_nearest
 
 _filename = get_file(
     "coil-20-no-background.zip",
@@ -38,6 +38,16 @@ def get(obj_num, degree):
     slice = max(
         min(round(round_to_nearest(slice, 10) / 10), 71), 0
     )  # get the nearest 1/10 unit
-    filename = os.path.join(DATA_DIR, "obj%s__%s.png" % (obj_num, slice))
-    image = Image.open(filename)
-    return image
+    return Image.fromarray(get_atlas(obj_num)[slice])
+
+
+def get_atlas(obj_num):
+    """
+    Get all 72 views of an object as an atlas (see
+    datasets.utils.load_atlas()); view i was taken at i * 5 degrees.
+    """
+    filenames = [
+        os.path.join(DATA_DIR, "obj%s__%s.png" % (obj_num, slice))
+        for slice in range(72)
+    ]
+    return load_atlas("coil20-obj%s" % obj_num, filenames)
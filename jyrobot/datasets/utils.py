@@ -16,14 +16,21 @@
 # ==============================================================================
 
 import hashlib
+import json
 import os
 import shutil
 import sys
 import tarfile
+import tempfile
 import zipfile
+from contextlib import contextmanager
 from urllib.error import HTTPError, URLError
 from urllib.request import urlretrieve
 
+import numpy as np
+
+from ..config import get_jyrobot_cache_dir
+
 try:
     from tqdm import tqdm as Progbar
 except ImportError:
@@ -40,10 +47,68 @@ except ImportError:
             print()
 
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Atlases, by name:
+ATLASES = {}
+
+
 def round_to_nearest(x, base):
     return base * round(x / base)
 
 
+def load_atlas(name, filenames):
+    """Loads a list of same-sized images as one packed RGBA atlas.
+
+    The images are decoded once, packed into a uint8 array with shape
+    (len(filenames), height, width, 4), and saved in the jyrobot cache
+    (see config.get_jyrobot_cache_dir()). After that, the atlas is
+    memory-mapped read-only from there, so processes share its pages.
+
+    Arguments:
+        name: Name of the atlas, like "coil20-obj1".
+        filenames: Paths to the images, in order.
+
+    Returns:
+        The atlas array; atlas[i] is the image in filenames[i].
+    """
+    from PIL import Image
+
+    if name in ATLASES:
+        return ATLASES[name]
+
+    hasher = hashlib.sha1(name.encode("utf-8"))
+    for filename in filenames:
+        stat = os.stat(filename)
+        key = "%s:%s:%s" % (filename, stat.st_mtime_ns, stat.st_size)
+        hasher.update(key.encode("utf-8"))
+    cache_filename = os.path.join(
+        get_jyrobot_cache_dir("atlas"), "%s-%s.npy" % (name, hasher.hexdigest())
+    )
+    atlas = None
+    if not os.path.exists(cache_filename):
+        atlas = np.stack(
+            [np.asarray(Image.open(filename).convert("RGBA")) for filename in filenames]
+        )
+        temp_filename = "%s.%s.tmp" % (cache_filename, os.getpid())
+        try:
+            with open(temp_filename, "wb") as fp:
+                np.save(fp, atlas)
+            os.replace(temp_filename, cache_filename)
+            atlas = None
+        except OSError:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+    if atlas is None:
+        atlas = np.load(cache_filename, mmap_mode="r")
+    ATLASES[name] = atlas
+    return atlas
+
+
 def get_file(
     fname,
     origin,
@@ -66,6 +131,11 @@ def get_file(
     Passing a hash will verify the file after download. The command line
     programs `shasum` and `sha256sum` can compute the hash.
 
+    What was extracted is recorded in a manifest next to the archive, so
+    later calls return right away, without extracting or hashing again.
+    Downloading and extracting are done under a file lock, so processes
+    can safely ask for the same file at the same time.
+
     Arguments:
         fname: Name of the file. If an absolute path `/path/to/file.txt` is
             specified the file will be saved at that location.
@@ -87,13 +157,14 @@ def get_file(
             The default 'auto' is ['tar', 'zip'].
             None or an empty list will return no matches found.
         cache_dir: Location to store cached files, when None it
-            defaults to the Jyrobot default.
+            defaults to the Jyrobot default (see
+            config.get_jyrobot_cache_dir()).
 
     Returns:
         Path to the downloaded file
     """
     if cache_dir is None:
-        cache_dir = os.path.join(os.path.expanduser("~"), ".jyrobot")
+        cache_dir = get_jyrobot_cache_dir()
     if md5_hash is not None and file_hash is None:
         file_hash = md5_hash
         hash_algorithm = "md5"
@@ -105,6 +176,26 @@ def get_file(
 
     fpath = os.path.join(datadir, fname)
 
+    if extract and _check_manifest(fpath, datadir, file_hash):
+        return fpath
+
+    # Only one process at a time downloads or extracts:
+    with _file_lock(fpath + ".lock"):
+        if extract and _check_manifest(fpath, datadir, file_hash):
+            return fpath
+        _download_file(fpath, origin, file_hash, hash_algorithm)
+        if extract:
+            _extract_archive_once(fpath, datadir, archive_format)
+
+    return fpath
+
+
+def _download_file(fpath, origin, file_hash, hash_algorithm):
+    """Downloads a file from a URL, unless a valid copy is already there.
+
+    The file is downloaded next to fpath, and only moved there when it is
+    complete.
+    """
     download = False
     if os.path.exists(fpath):
         # File found; verify integrity if a hash was provided.
@@ -139,24 +230,127 @@ def get_file(
                 ProgressTracker.progbar.update(count * block_size)
 
         error_msg = "URL fetch failure on {}: {} -- {}"
+        temp_path = fpath + ".part"
         try:
             try:
-                urlretrieve(origin, fpath, dl_progress)
+                urlretrieve(origin, temp_path, dl_progress)
             except HTTPError as e:
                 raise Exception(error_msg.format(origin, e.code, e.msg))
             except URLError as e:
                 raise Exception(error_msg.format(origin, e.errno, e.reason))
         except (Exception, KeyboardInterrupt):
-            if os.path.exists(fpath):
-                os.remove(fpath)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             raise
-        ProgressTracker.progbar.close()
-        ProgressTracker.progbar = None
+        os.replace(temp_path, fpath)
+        if ProgressTracker.progbar is not None:
+            ProgressTracker.progbar.close()
+            ProgressTracker.progbar = None
 
-    if extract:
-        _extract_archive(fpath, datadir, archive_format)
 
-    return fpath
+@contextmanager
+def _file_lock(lock_path):
+    """Holds an exclusive lock on a file, across processes.
+
+    Arguments:
+        lock_path: path of the lock file; created if needed
+
+    On systems without fcntl, no lock is taken.
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _check_manifest(fpath, path, file_hash=None):
+    """Checks whether an archive has already been extracted.
+
+    Arguments:
+        fpath: path to the archive file
+        path: path the archive was extracted to
+        file_hash: if given, the archive's expected sha256 or md5 hash
+
+    Returns:
+        True if the manifest written by `_extract_archive_once` matches
+        the archive's size and modification time (and hash, if given),
+        and the files that it extracted are still there.
+    """
+    try:
+        stat = os.stat(fpath)
+        with open(fpath + ".manifest.json") as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    if (manifest.get("size"), manifest.get("mtime_ns")) != (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        return False
+    if file_hash is not None and file_hash not in (
+        manifest.get("sha256"),
+        manifest.get("md5"),
+    ):
+        return False
+    return all(
+        os.path.exists(os.path.join(path, name))
+        for name in manifest.get("top_level", [])
+    )
+
+
+def _extract_archive_once(fpath, path, archive_format="auto"):
+    """Extracts an archive, and records what was extracted in a manifest.
+
+    The archive is first extracted into a temporary directory, and its
+    top-level files and directories are then moved into place, so other
+    processes never see a partial extraction. A directory being replaced
+    is first renamed aside, and only deleted once the new one is in
+    place. The manifest (next to the archive, as
+    `<archive>.manifest.json`) is written last.
+
+    Arguments:
+        fpath: path to the archive file
+        path: path to extract the archive file
+        archive_format: Archive format to try for extracting the file.
+    """
+    temp_dir = tempfile.mkdtemp(prefix=".extract-", dir=path)
+    old_dir = tempfile.mkdtemp(prefix=".old-", dir=path)
+    try:
+        if not _extract_archive(fpath, temp_dir, archive_format):
+            return
+        files = []
+        for root, dirs, filenames in os.walk(temp_dir):
+            for filename in filenames:
+                files.append(
+                    os.path.relpath(os.path.join(root, filename), temp_dir)
+                )
+        top_level = sorted(os.listdir(temp_dir))
+        for name in top_level:
+            target = os.path.join(path, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                os.rename(target, os.path.join(old_dir, name))
+            os.replace(os.path.join(temp_dir, name), target)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    stat = os.stat(fpath)
+    manifest = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": _hash_file(fpath, "sha256"),
+        "md5": _hash_file(fpath, "md5"),
+        "top_level": top_level,
+        "files": sorted(files),
+    }
+    temp_path = fpath + ".manifest.json.tmp"
+    with open(temp_path, "w") as fp:
+        json.dump(manifest, fp)
+    os.replace(temp_path, fpath + ".manifest.json")
 
 
 def _makedirs_exist_ok(datadir):
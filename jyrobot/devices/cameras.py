@@ -10,7 +10,40 @@
 
 import math
 
-from ..utils import Color
+import numpy as np
+
+from ..utils import Color, LRUCache
+
+# Dataset images are views taken every SPRITE_ANGLE_STEP degrees:
+SPRITE_ANGLE_STEP = 5
+
+# Scaled dataset images, by (dataset, object, degrees, width):
+SPRITE_CACHE = LRUCache(64 * 1024 * 1024, lambda array: array.nbytes)
+
+
+def paste_sprite(array, sprite, x, y):
+    """
+    Alpha-blend an RGBA sprite into an RGBA array, like PIL's
+    image.paste(sprite, (x, y), sprite).
+
+    Args:
+        * array: (ndarray) an (H, W, 4) uint8 array, changed in place
+        * sprite: (ndarray) an (h, w, 4) uint8 array
+        * x: (int) column of the sprite's left edge; may be off the array
+        * y: (int) row of the sprite's top edge; may be off the array
+    """
+    height, width = array.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2 = min(x + sprite.shape[1], width)
+    y2 = min(y + sprite.shape[0], height)
+    if x1 >= x2 or y1 >= y2:
+        return
+    src = sprite[y1 - y : y2 - y, x1 - x : x2 - x].astype(np.uint32)
+    dst = array[y1:y2, x1:x2]
+    alpha = src[..., 3:]
+    # Rounded division by 255, as PIL does it:
+    tmp = dst * (255 - alpha) + src * alpha + 128
+    dst[:] = ((tmp >> 8) + tmp) >> 8
 
 
 class Camera:
@@ -76,6 +109,7 @@ class Camera:
         self.reflectGround = True
         self.reflectSky = False
         self.set_fov(60)  # degrees
+        self._floor_offsets = None
         self.reset()
 
     def reset(self):
@@ -142,27 +176,6 @@ class Camera:
     def step(self, time_step):
         pass
 
-    def _get_visible_area(self):
-        """
-        What are the ranges of the field of view?
-        Return a list of (p1, p2) that represent lines
-        across the background, from front to back,
-        down the edges of the field of view.
-        """
-        step = 1
-        all_points = []
-        for angle in [self.angle / 2, -self.angle / 2]:
-            points = []
-            dx, dy = self.robot.rotate_around(0, 0, step, self.robot.direction + angle)
-            cx, cy = self.robot.x, self.robot.y
-            x, y = cx, cy
-            for i in range(0, self.max_range, step):
-                points.append((x, y))
-                x += dx
-                y += dy
-            all_points.append(points)
-        return zip(*all_points)
-
     def update(self, draw_list=None):
         """
         Cameras operate in a lazy way: they don't actually update
@@ -216,62 +229,71 @@ class Camera:
             return hit.distance
         return float("inf")
 
-    def get_ground_color(self, area, i, j):
-        if self.robot.world.ground_image is not None and area is not None:
-            # i is width ray (camera width),
-            # j is distance (height of camera/2, 64 to 128)
-            dist = round(
-                ((self.cameraShape[1] - j) / self.cameraShape[1] / 3) * len(area)
+    def _get_floor_offsets(self):
+        """
+        The spot on the floor seen by each pixel in the lower half of
+        the image, relative to the camera at (0,0) facing along the
+        x axis. Only recomputed when the camera geometry changes.
+        """
+        width, height = self.cameraShape
+        key = (width, height, self.angle, self.max_range)
+        if self._floor_offsets is None or self._floor_offsets[0] != key:
+            # j is distance (height of camera/2, 64 to 128):
+            rows = np.arange(height // 2, height)
+            distance = np.round((height - rows) / height / 3 * self.max_range)
+            # i is width ray (camera width), left edge to right edge:
+            t = 1.0 - np.arange(width) / width
+            half = self.angle / 2
+            ux = np.full(width, math.cos(half))
+            uy = math.sin(half) - 2 * math.sin(half) * t
+            self._floor_offsets = (
+                key,
+                distance[:, np.newaxis] * ux,
+                distance[:, np.newaxis] * uy,
             )
-            visible_width_points = area[dist]
-            p1, p2 = visible_width_points
-            # get a position i/width on line
-            # minx, maxx = sorted([p1[0], p2[0]])
-            # miny, maxy = sorted([p1[1], p2[1]])
-            spanx = abs(p1[0] - p2[0])
-            spany = abs(p1[1] - p2[1])
-            if p1[0] < p2[0]:
-                x = round(
-                    (p1[0] + spanx * (1.0 - i / self.cameraShape[0]))
-                    * self.robot.world.scale
-                )
-            else:
-                x = round(
-                    (p1[0] - spanx * (1.0 - i / self.cameraShape[0]))
-                    * self.robot.world.scale
-                )
-            if p1[1] < p2[1]:
-                y = round(
-                    (p1[1] + spany * (1.0 - i / self.cameraShape[0]))
-                    * self.robot.world.scale
-                )
-            else:
-                y = round(
-                    (p1[1] - spany * (1.0 - i / self.cameraShape[0]))
-                    * self.robot.world.scale
-                )
-            # find that pixel
-            if (0 <= x < (self.robot.world.width - 1) * self.robot.world.scale) and (
-                0 <= y < (self.robot.world.height - 1) * self.robot.world.scale
-            ):
-                # c = Color(*self.robot.world.ground_image_pixels[(x, y)])
-                # self.robot.world.ground_image_pixels[(x, y)] = (0, 0, 0)
-                # return c
-
-                sum = Color(0)
-                count = 0
-                # Need more sampling as distance increases:
-                for j in range(self.samples):
-                    try:
-                        c = Color(*self.robot.world.ground_image_pixels[(x + j, y)])
-                        # self.robot.world.ground_image_pixels[(x + j, y)] = (0, 0, 0)
-                        count += 1
-                    except Exception:
-                        continue
-                    sum += c
-                return sum / count
-
-        return self.robot.world.ground_color
+        return self._floor_offsets[1:]
+
+    def get_ground_colors(self):
+        """
+        Get the ground colors seen by the camera, as a (height, width, 4)
+        array of RGBA values. Only the lower half of the image (the
+        ground) comes from the world's ground image; the rest is the
+        world's ground_color.
+        """
+        world = self.robot.world
+        width, height = self.cameraShape
+        colors = np.empty((height, width, 4), dtype=np.uint8)
+        colors[:] = world.ground_color.to_tuple()
+        ground = world.ground_array
+        if ground is None:
+            return colors
+
+        # Place the floor offsets at the robot's pose:
+        fx, fy = self._get_floor_offsets()
+        cos = math.cos(self.robot.direction)
+        sin = math.sin(self.robot.direction)
+        x = np.round((self.robot.x + fx * cos - fy * sin) * world.scale).astype(int)
+        y = np.round((self.robot.y + fx * sin + fy * cos) * world.scale).astype(int)
+        image_height, image_width = ground.shape[:2]
+        inside = (
+            (0 <= x)
+            & (x < (world.width - 1) * world.scale)
+            & (0 <= y)
+            & (y < min((world.height - 1) * world.scale, image_height))
+        )
+        # Need more sampling as distance increases:
+        xs = x[..., np.newaxis] + np.arange(self.samples)
+        valid = inside[..., np.newaxis] & (xs < image_width)
+        pixels = ground[
+            np.where(valid, y[..., np.newaxis], 0), np.where(valid, xs, 0), :3
+        ]
+        total = (pixels * valid[..., np.newaxis]).sum(axis=2)
+        count = valid.sum(axis=2)
+        seen = count > 0
+        band = colors[height // 2 :]
+        band[seen, :3] = total[seen] / count[seen, np.newaxis]
+        band[seen, 3] = 255
+        return colors
 
     def take_picture(self, type="color"):
         try:
@@ -282,79 +304,68 @@ class Camera:
 
         # Lazy; only get the data when we need it:
         self._update()
-        if self.robot.world.ground_image is not None:
-            area = list(self._get_visible_area())
-        else:
-            area = None
-        pic = Image.new("RGBA", (self.cameraShape[0], self.cameraShape[1]))
-        pic_pixels = pic.load()
+        width, height = self.cameraShape
+        pic = np.zeros((height, width, 4), dtype=np.uint8)
         # FIXME: probably should have a specific size rather than scale it to world
         size = max(self.robot.world.width, self.robot.world.height)
-        hcolor = None
         # draw non-robot walls first:
-        for i in range(self.cameraShape[0]):
+        columns = []
+        highs = []
+        hcolors = []
+        for i in range(width):
             hits = [hit for hit in self.hits[i] if hit.height == 1.0]  # only walls
             if len(hits) == 0:
                 continue
             hit = hits[-1]  # get closest
-            high = None
-            hcolor = None
-            if hit:
-                # FIXME: need to figure out what height would actually be at this distance
-                distance_ratio = max(min(1.0 - hit.distance / size, 1.0), 0.0)
-                s = max(
-                    min(1.0 - hit.distance / size * self.sizeFadeWithDistance, 1.0), 0.0
-                )
-                sc = max(
-                    min(1.0 - hit.distance / size * self.colorsFadeWithDistance, 1.0),
-                    0.0,
-                )
-                if type == "color":
-                    r = hit.color.red * sc
-                    g = hit.color.green * sc
-                    b = hit.color.blue * sc
-                elif type == "depth":
-                    r = 255 * distance_ratio
-                    g = 255 * distance_ratio
-                    b = 255 * distance_ratio
-                else:
-                    avg = (hit.color.red + hit.color.green + hit.color.blue) / 3.0
-                    r = avg * sc
-                    g = avg * sc
-                    b = avg * sc
-                hcolor = Color(r, g, b)
-                high = (1.0 - s) * self.cameraShape[1]
+            # FIXME: need to figure out what height would actually be at this distance
+            distance_ratio = max(min(1.0 - hit.distance / size, 1.0), 0.0)
+            s = max(min(1.0 - hit.distance / size * self.sizeFadeWithDistance, 1.0), 0.0)
+            sc = max(
+                min(1.0 - hit.distance / size * self.colorsFadeWithDistance, 1.0), 0.0,
+            )
+            if type == "color":
+                r = hit.color.red * sc
+                g = hit.color.green * sc
+                b = hit.color.blue * sc
+            elif type == "depth":
+                r = 255 * distance_ratio
+                g = 255 * distance_ratio
+                b = 255 * distance_ratio
             else:
-                high = 0
-
-            horizon = self.cameraShape[1] / 2
-            for j in range(self.cameraShape[1]):
-                dist = max(min(abs(j - horizon) / horizon, 1.0), 0.0)
-                if j < high / 2:  # sky
-                    if type == "depth":
-                        if self.reflectSky:
-                            color = Color(255 * dist)
-                        else:
-                            color = Color(0)
-                    elif type == "color":
-                        color = Color(0, 0, 128)
-                    else:
-                        color = Color(128 / 3)
-                    pic_pixels[i, j] = color.to_tuple()
-                elif j < self.cameraShape[1] - high / 2:  # hit
-                    if hcolor is not None:
-                        pic_pixels[i, j] = hcolor.to_tuple()
-                else:  # ground
-                    if type == "depth":
-                        if self.reflectGround:
-                            color = Color(255 * dist)
-                        else:
-                            color = Color(0)
-                    elif type == "color":
-                        color = self.get_ground_color(area, i, j)
-                    else:
-                        color = Color(128 / 3)
-                    pic_pixels[i, j] = color.to_tuple()
+                avg = (hit.color.red + hit.color.green + hit.color.blue) / 3.0
+                r = avg * sc
+                g = avg * sc
+                b = avg * sc
+            columns.append(i)
+            highs.append((1.0 - s) * height)
+            hcolors.append(Color(r, g, b).to_tuple())
+
+        if len(columns) > 0:
+            horizon = height / 2
+            rows = np.arange(height)
+            dist = np.clip(np.abs(rows - horizon) / horizon, 0.0, 1.0)
+            # One row of colors for the sky and ground, by distance:
+            if type == "depth":
+                sky = np.zeros((height, 1, 4))
+                ground = np.zeros((height, 1, 4))
+                if self.reflectSky:
+                    sky[:, 0, :3] = (255 * dist)[:, np.newaxis]
+                if self.reflectGround:
+                    ground[:, 0, :3] = (255 * dist)[:, np.newaxis]
+                sky[..., 3] = ground[..., 3] = 255
+            elif type == "color":
+                sky = np.array([[Color(0, 0, 128).to_tuple()]] * height)
+                ground = self.get_ground_colors()[:, columns]
+            else:
+                sky = ground = np.array([[Color(128 / 3).to_tuple()]] * height)
+            highs = np.array(highs)
+            is_sky = rows[:, np.newaxis] < highs / 2
+            is_ground = rows[:, np.newaxis] >= height - highs / 2
+            pic[:, columns] = np.where(
+                is_sky[..., np.newaxis],
+                sky,
+                np.where(is_ground[..., np.newaxis], ground, np.array(hcolors)),
+            )
 
         # Other robots, draw on top of walls:
         self.obstacles = {}
@@ -399,14 +410,21 @@ class Camera:
                     self.cameraShape[1] - height - 1 - 1 - round(distance_to),
                 )
                 if not hit.robot.has_image():
-                    for j in range(height):
-                        pic_pixels[
-                            i, self.cameraShape[1] - j - 1 - round(distance_to)
-                        ] = hcolor.to_tuple()
+                    rows = self.cameraShape[1] - 1 - round(distance_to)
+                    pic[rows - np.arange(height), i] = hcolor.to_tuple()
         self.show_obstacles(pic)
-        return pic
+        return Image.fromarray(pic)
 
     def show_obstacles(self, image):
+        """
+        Paste the images of the visible robots that have them.
+
+        Args:
+            * image: (Image or ndarray) a picture, or an (H, W, 4) uint8
+                array that is changed in place
+        """
+        from PIL import Image
+
         # FIXME: show back to front
         # FIXME: how to show when partially behind wall?
         for data in self.obstacles.values():
@@ -420,18 +438,41 @@ class Camera:
                     + data["robot"].direction
                 )
                 degrees = round(radians * 180 / math.pi)
-                picture = data["robot"].get_image(degrees)  # degrees
                 x1, y1 = data["min_x"], data["min_y"]  # noqa: F841
                 x2, y2 = data["max_x"], data["max_y"]
                 try:  # like too small
-                    picture.thumbnail((x2 - x1, 10000))  # to keep aspect ratio
-                    # picture = picture.resize((x2 - x1, y2 - y1))
-                    x3 = x2 - picture.height
-                    y3 = y2 - picture.width
-                    image.paste(picture, (x3, y3), picture)
+                    sprite = self.get_sprite(data["robot"], degrees, x2 - x1)
+                    x3 = x2 - sprite.shape[0]
+                    y3 = y2 - sprite.shape[1]
+                    if isinstance(image, np.ndarray):
+                        paste_sprite(image, sprite, x3, y3)
+                    else:
+                        picture = Image.fromarray(sprite)
+                        image.paste(picture, (x3, y3), picture)
                 except Exception:
                     print("Exception in processing image")
 
+    def get_sprite(self, robot, degrees, width):
+        """
+        Get a robot's image, seen from an angle and scaled down (keeping
+        its aspect ratio) to at most the given width, as an (H, W, 4)
+        uint8 array. Sprites are kept in SPRITE_CACHE.
+
+        Args:
+            * robot: (Robot) a robot that has an image
+            * degrees: (number) the angle the robot is seen from
+            * width: (int) the width in pixels
+        """
+        degrees = round(degrees / SPRITE_ANGLE_STEP) * SPRITE_ANGLE_STEP % 360
+        key = (robot.image_data[0], robot.image_data[1], degrees, width)
+        sprite = SPRITE_CACHE.get(key)
+        if sprite is None:
+            picture = robot.get_image(degrees).convert("RGBA")
+            picture.thumbnail((width, 10000))  # to keep aspect ratio
+            sprite = np.asarray(picture)
+            SPRITE_CACHE.put(key, sprite)
+        return sprite
+
     def record_obstacle(self, robot, x, y1, y2):
         if robot.name not in self.obstacles:
             self.obstacles[robot.name] = {
@@ -490,6 +531,8 @@ class Camera:
         self.angle = angle * math.pi / 180.0
         # self.sizeFadeWithDistance = scale
         self.reset()
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_size(self, width, height):
         """
@@ -502,6 +545,8 @@ class Camera:
         self.cameraShape[0] = width
         self.cameraShape[1] = height
         self.reset()
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_angle(self, angle):
         """
@@ -520,6 +565,8 @@ class Camera:
             * max_range: (number) distance (in CM) the camera can see
         """
         self.max_range = max_range
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_width(self, width):
         """
@@ -530,6 +577,8 @@ class Camera:
         """
         self.cameraShape[0] = width
         self.reset()
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_height(self, height):
         """
@@ -540,6 +589,8 @@ class Camera:
         """
         self.cameraShape[1] = height
         self.reset()
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_name(self, name):
         """
@@ -549,6 +600,8 @@ class Camera:
             * name: (str) the name of the camera
         """
         self.name = name
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def get_name(self):
         """
@@ -666,18 +719,43 @@ class GroundCamera:
         backend.draw_line(right, lower, left, lower)
         backend.draw_line(left, lower, left, upper)
 
-    def take_picture(self):
-        # FIXME: would be faster to trim image down
-        # before rotating
-        center = (
-            self.robot.x * self.robot.world.scale,
-            self.robot.y * self.robot.world.scale,
-        )
-        rotated_image = self.robot.world.ground_image.rotate(
-            (self.robot.direction - math.pi / 4 * 6) * (180 / math.pi), center=center,
-        )
-        left = center[0] - self.cameraShape[0] // 2
-        right = center[0] + self.cameraShape[0] // 2
-        upper = center[1] - self.cameraShape[1] // 2
-        lower = center[1] + self.cameraShape[1] // 2
-        return rotated_image.crop((left, upper, right, lower))
+    def take_picture(self, as_array=False):
+        """
+        Take a picture of the ground under the robot, turned so that
+        the robot faces up.
+
+        Args:
+            * as_array: (bool) return a NumPy array rather than an image
+        """
+        world = self.robot.world
+        ground = world.ground_array
+        if ground is None:
+            return None
+
+        center = (self.robot.x * world.scale, self.robot.y * world.scale)
+        left = round(center[0] - self.cameraShape[0] // 2)
+        right = round(center[0] + self.cameraShape[0] // 2)
+        upper = round(center[1] - self.cameraShape[1] // 2)
+        lower = round(center[1] + self.cameraShape[1] // 2)
+        # Only sample the patch: map the center of each of its pixels
+        # back through the rotation to the nearest ground pixel
+        degrees = (self.robot.direction - math.pi / 4 * 6) * (180 / math.pi)
+        angle = -math.radians(degrees % 360.0)
+        cos, sin = math.cos(angle), math.sin(angle)
+        x = np.arange(left, right) + 0.5 - center[0]
+        y = np.arange(upper, lower)[:, np.newaxis] + 0.5 - center[1]
+        sx = np.floor(cos * x + sin * y + center[0]).astype(int)
+        sy = np.floor(-sin * x + cos * y + center[1]).astype(int)
+        height, width = ground.shape[:2]
+        inside = (0 <= sx) & (sx < width) & (0 <= sy) & (sy < height)
+        # Parts of the patch off the edge of the ground are empty:
+        inside &= (x + center[0] < width) & (y + center[1] < height)
+        inside &= (x + center[0] >= 0) & (y + center[1] >= 0)
+        patch = np.zeros(inside.shape + ground.shape[2:], dtype=ground.dtype)
+        patch[inside] = ground[sy[inside], sx[inside]]
+        if as_array:
+            return patch
+
+        from PIL import Image
+
+        return Image.fromarray(patch)
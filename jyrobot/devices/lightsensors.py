@@ -11,6 +11,7 @@
 import math
 
 from ..colors import PURPLE, YELLOW
+from ..fields import LightField, RayHits
 from ..utils import distance
 
 
@@ -66,7 +67,14 @@ class LightSensor:
             self.dist_from_center,
             self.robot.direction + self.dir_from_center + math.pi / 2,
         )
-        for bulb in self.robot.world.bulbs:  # for each light source:
+        world = self.robot.world
+        field = world.get_light_field()
+        # Any hit blocks the light, but draw them all when debugging:
+        mode = "any"
+        if world.debug and draw_list is not None:
+            field = None  # cast every ray, to draw them
+            mode = "all"
+        for bulb in world.bulbs:  # for each light source:
             x, y, z, brightness, light_color = (  # noqa: F841
                 bulb.x,
                 bulb.y,
@@ -78,8 +86,25 @@ class LightSensor:
 
             angle = math.atan2(x - p[0], y - p[1])
             dist = distance(x, y, p[0], p[1])
-            hits = self.robot.cast_ray(p[0], p[1], angle, dist)
-            if self.robot.world.debug and draw_list is not None:
+            if field is None:
+                light = LightField.CHECK
+            else:
+                light = field.get_light(p[0], p[1], bulb)
+            if light == LightField.DARK:
+                continue  # behind a static wall
+            elif light == LightField.LIT:
+                # Only robots can be in the way:
+                query = RayHits(p[0], p[1], mode, world.profiler)
+                query.add_robots(
+                    math.sin(angle) * dist + p[0],
+                    math.cos(angle) * dist + p[1],
+                    world._robots,
+                    self.robot,
+                )
+                hits = query.get_hits()
+            else:
+                hits = self.robot.cast_ray(p[0], p[1], angle, dist, mode)
+            if world.debug and draw_list is not None:
                 draw_list.append(("draw_circle", (p[0], p[1], 2)))
                 draw_list.append(("draw_circle", (x, y, 2)))
 
@@ -137,3 +162,5 @@ class LightSensor:
         # Get location of sensor, doesn't change once position is set:
         self.dist_from_center = distance(0, 0, self.position[0], self.position[1])
         self.dir_from_center = math.atan2(-self.position[0], self.position[1])
+        if self.robot is not None:
+            self.robot._settings_changed()
@@ -128,14 +128,16 @@ class RangeSensor:
             draw_list.append(("draw_ellipse", (p[0], p[1], 2, 2)))
 
         self.set_reading(1.0)
+        world = self.robot.world
+        if world.get_clearance(p[0], p[1], self.robot) > self.max:
+            return  # nothing within range
         if self.width != 0:
             for incr in arange(-self.width / 2, self.width / 2, self.width / 2):
-                hits = self.robot.cast_ray(
-                    p[0],
-                    p[1],
-                    -self.robot.direction + math.pi / 2.0 + incr - self.direction,
-                    self.max,
-                )
+                a = -self.robot.direction + math.pi / 2.0 + incr - self.direction
+                clear = world.get_clear_distance(p[0], p[1], a, self.max, self.robot)
+                if clear >= self.max:
+                    continue  # nothing along this ray
+                hits = self.robot.cast_ray(p[0], p[1], a, self.max, "closest")
                 if hits:
                     if self.robot.world.debug and draw_list is not None:
                         draw_list.append(
@@ -145,12 +147,11 @@ class RangeSensor:
                     if hits[-1].distance < self.get_distance():
                         self.set_distance(hits[-1].distance)
         else:
-            hits = self.robot.cast_ray(
-                p[0],
-                p[1],
-                -self.robot.direction + math.pi / 2.0 - self.direction,
-                self.max,
-            )
+            a = -self.robot.direction + math.pi / 2.0 - self.direction
+            clear = world.get_clear_distance(p[0], p[1], a, self.max, self.robot)
+            if clear >= self.max:
+                return  # nothing along this ray
+            hits = self.robot.cast_ray(p[0], p[1], a, self.max, "closest")
             if hits:
                 if self.robot.world.debug and draw_list is not None:
                     draw_list.append(("draw_ellipse", (hits[-1].x, hits[-1].y, 2, 2)))
@@ -240,6 +241,8 @@ class RangeSensor:
             * name: (str) the name of the range sensor
         """
         self.name = name
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_distance(self, distance):
         """
@@ -271,6 +274,8 @@ class RangeSensor:
             * max: (number) max distance in CM the sensor can sense.
         """
         self.max = max
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_position(self, position):
         """
@@ -290,6 +295,8 @@ class RangeSensor:
         self.position = position
         self.dist_from_center = distance(0, 0, self.position[0], self.position[1])
         self.dir_from_center = math.atan2(-self.position[0], self.position[1])
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_direction(self, direction):
         """
@@ -299,6 +306,8 @@ class RangeSensor:
             * direction: (number) the angle of the direction of sensor in degrees
         """
         self.direction = direction * math.pi / 180  # save as radians
+        if self.robot is not None:
+            self.robot._settings_changed()
 
     def set_width(self, width):
         """
@@ -316,3 +325,5 @@ class RangeSensor:
             self.type = "laser"
         else:
             self.type = "ir"
+        if self.robot is not None:
+            self.robot._settings_changed()
@@ -0,0 +1,889 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import copy
+import math
+
+from .hit import Hit
+from .utils import distance, intersect_hit
+
+# Rays hit a wall up to this far past its ends (see utils.intersect_hit):
+HIT_TOLERANCE = 0.2
+
+
+def segment_distances(xs, ys, x1, y1, x2, y2):
+    """
+    Get the distances from grid points to a line segment.
+
+    Args:
+        * xs: (ndarray) x coordinates, shaped (1, nx)
+        * ys: (ndarray) y coordinates, shaped (ny, 1)
+        * x1, y1, x2, y2: (number) the ends of the segment
+    """
+    import numpy as np
+
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        t = 0.0
+    else:
+        t = np.clip(((xs - x1) * dx + (ys - y1) * dy) / length2, 0.0, 1.0)
+    return np.hypot(xs - (x1 + t * dx), ys - (y1 + t * dy))
+
+
+def grid_crossings(x1, y1, x2, y2, resolution):
+    """
+    Get the grid cells that a line segment passes through, in order.
+    Returns the fractions of the way along the segment (0 to 1) at
+    which it enters each cell, and the cells' columns and rows.
+
+    Args:
+        * x1, y1, x2, y2: (number) the ends of the segment
+        * resolution: (number) the size of a grid cell
+    """
+    import numpy as np
+
+    dx, dy = x2 - x1, y2 - y1
+    ts = [np.array([0.0, 1.0])]
+    # Where the segment crosses the vertical and horizontal grid lines:
+    for start, delta in [(x1, dx), (y1, dy)]:
+        if delta != 0:
+            low, high = sorted([start, start + delta])
+            lines = np.arange(
+                math.ceil(low / resolution), math.floor(high / resolution) + 1
+            )
+            ts.append((lines * resolution - start) / delta)
+    ts = np.unique(np.clip(np.concatenate(ts), 0.0, 1.0))
+    middles = (ts[:-1] + ts[1:]) / 2
+    if len(middles) == 0:  # a point
+        middles = ts
+    columns = np.floor((x1 + middles * dx) / resolution).astype(int)
+    rows = np.floor((y1 + middles * dy) / resolution).astype(int)
+    return ts[: len(middles)], columns, rows
+
+
+def intersect_lines(x1, y1, x2, y2, lines):
+    """
+    Intersect segments with lines, the same way as utils.intersect_hit(),
+    but for arrays of them. Returns the x and y coordinates of the
+    intersections, and whether each one is on both.
+
+    Args:
+        * x1, y1, x2, y2: (ndarray or number) the ends of the segments,
+            shaped to broadcast against a row of lines, like (m, 1)
+        * lines: (ndarray) the lines, shaped (n, 4) as x1, y1, x2, y2
+    """
+    import numpy as np
+
+    x3, y3, x4, y4 = lines.T
+    # See utils.coefs() and utils.intersect_coefs():
+    a1, b1, c1 = y1 - y2, x2 - x1, -(x1 * y2 - x2 * y1)
+    a2, b2, c2 = y3 - y4, x4 - x3, -(x3 * y4 - x4 * y3)
+    d = a1 * b2 - b1 * a2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hx = (c1 * b2 - b1 * c2) / d
+        hy = (a1 * c2 - c1 * a2) / d
+    ok = (
+        (d != 0)
+        & (np.minimum(x1, x2) - 0.1 <= hx)
+        & (hx <= np.maximum(x1, x2) + 0.1)
+        & (np.minimum(y1, y2) - 0.1 <= hy)
+        & (hy <= np.maximum(y1, y2) + 0.1)
+        & (np.minimum(x3, x4) - 0.1 <= hx)
+        & (hx <= np.maximum(x3, x4) + 0.1)
+        & (np.minimum(y3, y4) - 0.1 <= hy)
+        & (hy <= np.maximum(y3, y4) + 0.1)
+    )
+    return hx, hy, ok
+
+
+class RayHits:
+    """
+    Collect the hits of a ray, for robot.cast_ray(). The mode picks
+    which ones are kept:
+
+    * "all": every hit, sorted furthest away first (back to front)
+    * "closest": only the closest hit
+    * "any": only the first hit found; then the ray is done
+
+    A Hit is only made for the hits that are kept. Whatever casts the
+    ray adds the number of line segments it tests to query.tested.
+
+    Args:
+        * x1: (number) the x coordinate of the start of the ray, in CM
+        * y1: (number) the y coordinate of the start of the ray, in CM
+        * mode: (str) "all", "closest", or "any"
+        * profiler: (Profiler) counts the ray, if given
+    """
+
+    MODES = ("all", "closest", "any")
+
+    def __init__(self, x1, y1, mode="all", profiler=None):
+        if mode not in self.MODES:
+            raise ValueError("unknown ray query mode: %r" % mode)
+        self.x1 = x1
+        self.y1 = y1
+        self.mode = mode
+        self.profiler = profiler
+        self.tested = 0
+        self.made = 0
+        # How far away a hit has to be closer than to be kept:
+        self.limit = float("inf")
+        self.done = False
+        self.hits = []
+        self.closest = None
+
+    def add(self, pos, wall=None, robot=None):
+        """
+        Add a hit on a wall, or on a robot.
+
+        Args:
+            * pos: (list) the x and y coordinates of the hit, in CM
+            * wall: (Wall) the wall hit, which may be a robot's
+            * robot: (Robot) the robot hit, if not a wall
+        """
+        dist = distance(pos[0], pos[1], self.x1, self.y1)
+        if self.mode == "all":
+            self.hits.append(self._make_hit(pos, wall, robot, dist))
+        elif dist <= self.limit:  # the last of equals, like sorting does
+            self.closest = (pos, wall, robot, dist)
+            self.limit = dist
+            self.done = self.mode == "any"
+
+    def add_robots(self, x2, y2, robots, robot=None):
+        """
+        Intersect the ray with robots.
+
+        Args:
+            * x2: (number) the x coordinate of the end of the ray, in CM
+            * y2: (number) the y coordinate of the end of the ray, in CM
+            * robots: (list) the robots that can be hit
+            * robot: (Robot) a robot to ignore, like the one casting the ray
+        """
+        for other in robots:
+            if other is robot:
+                continue
+            self.tested += len(other.bounding_lines)
+            for line in other.bounding_lines:
+                pos = intersect_hit(
+                    self.x1,
+                    self.y1,
+                    x2,
+                    y2,
+                    line.p1.x,
+                    line.p1.y,
+                    line.p2.x,
+                    line.p2.y,
+                )
+                if pos is not None:
+                    self.add(pos, robot=other)
+                    if self.done:
+                        return
+
+    def _make_hit(self, pos, wall, robot, dist):
+        if wall is not None:
+            robot = wall.robot
+            boundary = len(wall.lines) == 1
+        else:
+            boundary = False
+        if robot is None:
+            height, color = 1.0, wall.color
+        else:
+            height, color = robot.height, robot.color
+        x, y = pos
+        self.made += 1
+        return Hit(robot, height, x, y, dist, color, self.x1, self.y1, boundary)
+
+    def get_hits(self):
+        """
+        Get the list of hits kept, furthest away first (back to front).
+        """
+        if self.mode == "all":
+            hits = self.hits
+            hits.sort(
+                key=lambda a: a.distance, reverse=True
+            )  # further away first, back to front
+        elif self.closest is None:
+            hits = []
+        else:
+            hits = [self._make_hit(*self.closest)]
+        if self.profiler is not None:
+            self.profiler.count_ray(self.tested, self.made)
+        return hits
+
+
+class DistanceField:
+    """
+    A grid of the distances from each cell's center to the closest
+    static wall (a wall that isn't a robot), negative inside box walls.
+    Distances are only computed out to max_distance; cells further
+    away than that hold max_distance.
+
+    Args:
+        * resolution: (number) the size of a grid cell, in CM
+        * max_distance: (number) how far out to compute distances, in CM
+    """
+
+    def __init__(self, resolution=5.0, max_distance=200.0):
+        self.resolution = resolution
+        self.max_distance = max_distance
+        self.version = None
+        self.field = None
+        # The distances and boxes without signs, and the static walls
+        # (with their lines) that they are for:
+        self.distances = None
+        self.inside = None
+        self.static_walls = []
+
+    def __repr__(self):
+        return "<DistanceField resolution=%r, max_distance=%r>" % (
+            self.resolution,
+            self.max_distance,
+        )
+
+    def copy(self):
+        """
+        Get a copy that shares what was computed, until it is computed
+        again for other walls (like for a World.clone()).
+        """
+        return copy.copy(self)
+
+    def build(self, walls, width, height, version=None):
+        """
+        Compute the distances to the static walls. If the walls are the
+        ones it was last computed for with more added, only the new
+        ones are computed.
+
+        Args:
+            * walls: (list) the world's walls; robots' walls are skipped
+            * width: (number) the width of the world, in CM
+            * height: (number) the height of the world, in CM
+            * version: the version of the walls this is for
+        """
+        import numpy as np
+
+        res = self.resolution
+        nx = max(int(math.ceil(width / res)), 1)
+        ny = max(int(math.ceil(height / res)), 1)
+        static_walls = []
+        for wall in walls:
+            if wall.robot is None:
+                lines = [
+                    (line.p1.x, line.p1.y, line.p2.x, line.p2.y) for line in wall.lines
+                ]
+                static_walls.append((wall, lines))
+        count = len(self.static_walls)
+        if (
+            self.field is not None
+            and self.field.shape == (ny, nx)
+            and static_walls[:count] == self.static_walls
+        ):
+            # Copies, as a World.clone() can share the arrays:
+            distances = self.distances.copy()
+            inside = self.inside.copy()
+        else:
+            distances = np.full((ny, nx), self.max_distance, dtype=np.float32)
+            inside = np.zeros((ny, nx), dtype=bool)
+            count = 0
+        for wall, lines in static_walls[count:]:
+            self._add_wall(distances, inside, lines)
+        self.distances = distances
+        self.inside = inside
+        self.static_walls = static_walls
+        self.field = np.where(inside, -distances, distances)
+        self.version = version
+
+    def _add_wall(self, distances, inside, lines):
+        """
+        Add a wall's lines (as x1, y1, x2, y2) to the distances, and
+        mark the cells inside it if it is a box.
+        """
+        import numpy as np
+
+        res = self.resolution
+        ny, nx = distances.shape
+        reach = self.max_distance
+        for x1, y1, x2, y2 in lines:
+            # Only cells within max_distance of the line can change:
+            i1, i2 = self._cells(min(y1, y2) - reach, max(y1, y2) + reach, ny)
+            j1, j2 = self._cells(min(x1, x2) - reach, max(x1, x2) + reach, nx)
+            if i1 >= i2 or j1 >= j2:
+                continue
+            xs = ((np.arange(j1, j2) + 0.5) * res)[np.newaxis, :]
+            ys = ((np.arange(i1, i2) + 0.5) * res)[:, np.newaxis]
+            np.minimum(
+                distances[i1:i2, j1:j2],
+                segment_distances(xs, ys, x1, y1, x2, y2),
+                out=distances[i1:i2, j1:j2],
+            )
+        if len(lines) == 4:
+            # Walls with 4 lines are boxes:
+            xs = [line[0] for line in lines]
+            ys = [line[1] for line in lines]
+            i1, i2 = self._cells(min(ys), max(ys), ny)
+            j1, j2 = self._cells(min(xs), max(xs), nx)
+            inside[i1:i2, j1:j2] = True
+
+    def _cells(self, low, high, count):
+        """
+        The range of cells whose centers are between low and high.
+        """
+        start = int(math.ceil(low / self.resolution - 0.5))
+        stop = int(math.floor(high / self.resolution - 0.5)) + 1
+        return max(start, 0), min(stop, count)
+
+    def get_distance(self, x, y):
+        """
+        Get the distance from a point to the closest static wall. The
+        distance is exact at the center of a cell, and no more than
+        half a cell's diagonal off elsewhere. Points off the grid are
+        -inf away.
+
+        Args:
+            * x: (number) the x coordinate, in CM
+            * y: (number) the y coordinate, in CM
+        """
+        ny, nx = self.field.shape
+        i = math.floor(y / self.resolution)
+        j = math.floor(x / self.resolution)
+        if 0 <= i < ny and 0 <= j < nx:
+            return float(self.field[i, j])
+        return float("-inf")
+
+    def get_clearance(self, x, y):
+        """
+        Get a distance from a point that no ray can travel without
+        hitting a static wall. It is never more than the true distance.
+
+        Args:
+            * x: (number) the x coordinate, in CM
+            * y: (number) the y coordinate, in CM
+        """
+        margin = self.resolution * math.sqrt(0.5) + HIT_TOLERANCE
+        return self.get_distance(x, y) - margin
+
+
+class OccupancyGrid:
+    """
+    A grid marking the cells that the static walls (walls that aren't
+    robots) pass through. A ray walks the cells it passes through, and
+    is only intersected with the walls it finds there, so its cost
+    depends on its length rather than on the number of walls. Finer
+    cells make rays slower, but test fewer walls.
+
+    Args:
+        * resolution: (number) the size of a grid cell, in CM
+    """
+
+    def __init__(self, resolution=1.0):
+        self.resolution = resolution
+        self.version = None
+        self.grid = None
+        self.walls = []
+        self.shared = {}
+
+    def __repr__(self):
+        return "<OccupancyGrid resolution=%r>" % self.resolution
+
+    def copy(self):
+        """
+        Get a copy that shares what was computed, until it is computed
+        again for other walls (like for a World.clone()).
+        """
+        return copy.copy(self)
+
+    def build(self, walls, width, height, version=None):
+        """
+        Mark the cells of the static walls.
+
+        Args:
+            * walls: (list) the world's walls; robots' walls are skipped
+            * width: (number) the width of the world, in CM
+            * height: (number) the height of the world, in CM
+            * version: the version of the walls this is for
+        """
+        import numpy as np
+
+        # Walls on the far edges (like boundary walls) are in the last cells:
+        nx = int(math.floor(width / self.resolution)) + 1
+        ny = int(math.floor(height / self.resolution)) + 1
+        # 0 is empty, -1 is a cell shared by walls (listed in
+        # self.shared), otherwise 1 + the index of a wall in self.walls:
+        grid = np.zeros((ny, nx), dtype=np.int32)
+        shared = {}
+        self.walls = [wall for wall in walls if wall.robot is None]
+        for index, wall in enumerate(self.walls):
+            for line in wall.lines:
+                # Rays hit a little past the ends, so mark cells there too:
+                x1, y1, x2, y2 = line.p1.x, line.p1.y, line.p2.x, line.p2.y
+                length = distance(x1, y1, x2, y2)
+                if length > 0:
+                    dx = (x2 - x1) / length * HIT_TOLERANCE
+                    dy = (y2 - y1) / length * HIT_TOLERANCE
+                    x1, y1, x2, y2 = x1 - dx, y1 - dy, x2 + dx, y2 + dy
+                ts, columns, rows = grid_crossings(x1, y1, x2, y2, self.resolution)
+                ok = (columns >= 0) & (columns < nx) & (rows >= 0) & (rows < ny)
+                rows, columns = rows[ok], columns[ok]
+                owners = grid[rows, columns]
+                free = owners == 0
+                grid[rows[free], columns[free]] = index + 1
+                taken = ~free & (owners != index + 1)
+                for row, column, owner in zip(
+                    rows[taken].tolist(),
+                    columns[taken].tolist(),
+                    owners[taken].tolist(),
+                ):
+                    if owner > 0:
+                        shared[row, column] = [owner - 1]
+                        grid[row, column] = -1
+                    if index not in shared[row, column]:
+                        shared[row, column].append(index)
+        self.grid = grid
+        self.shared = shared
+        self.version = version
+
+    def find_walls(self, x1, y1, x2, y2):
+        """
+        Get the static walls in the cells that a line segment passes
+        through.
+
+        Args:
+            * x1, y1, x2, y2: (number) the ends of the segment
+        """
+        ts, columns, rows = grid_crossings(x1, y1, x2, y2, self.resolution)
+        ny, nx = self.grid.shape
+        ok = (columns >= 0) & (columns < nx) & (rows >= 0) & (rows < ny)
+        rows, columns = rows[ok], columns[ok]
+        owners = self.grid[rows, columns]
+        indices = set((owners[owners > 0] - 1).tolist())
+        crowded = owners < 0
+        for row, column in zip(rows[crowded].tolist(), columns[crowded].tolist()):
+            indices.update(self.shared[row, column])
+        return [self.walls[index] for index in sorted(indices)]
+
+    def cast_ray(
+        self, x1, y1, a, max_range, robots=(), robot=None, mode="all", profiler=None
+    ):
+        """
+        Cast a ray, like robot.cast_ray().
+
+        Args:
+            * x1: (number) the x coordinate of the start, in CM
+            * y1: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, as in robot.cast_ray()
+            * max_range: (number) the length of the ray, in CM
+            * robots: (list) the robots that can be hit
+            * robot: (Robot) a robot to ignore, like the one casting the ray
+            * mode: (str) which hits to return, as in RayHits
+            * profiler: (Profiler) counts the ray, if given
+
+        Returns list of hits, furthest away first (back to front)
+        """
+        query = RayHits(x1, y1, mode, profiler)
+        x2 = math.sin(a) * max_range + x1
+        y2 = math.cos(a) * max_range + y1
+        # Rays hit a little past their ends, so look a little further:
+        dx = math.sin(a) * HIT_TOLERANCE
+        dy = math.cos(a) * HIT_TOLERANCE
+        if mode == "all":
+            walls = self.find_walls(x1 - dx, y1 - dy, x2 + dx, y2 + dy)
+            self._add_hits(query, x2, y2, walls)
+        else:
+            self._add_closest_hits(query, x2, y2, dx, dy, max_range)
+        if not query.done:
+            query.add_robots(x2, y2, robots, robot)
+        return query.get_hits()
+
+    def _add_hits(self, query, x2, y2, walls):
+        for wall in walls:
+            query.tested += len(wall.lines)
+            for line in wall.lines:
+                pos = intersect_hit(
+                    query.x1,
+                    query.y1,
+                    x2,
+                    y2,
+                    line.p1.x,
+                    line.p1.y,
+                    line.p2.x,
+                    line.p2.y,
+                )
+                if pos is not None:
+                    query.add(pos, wall)
+                    if query.done:
+                        return
+
+    def _add_closest_hits(self, query, x2, y2, dx, dy, max_range):
+        """
+        Visit the walls in the cells a ray passes through in order,
+        until the cells are further away than the closest hit.
+        """
+        import numpy as np
+
+        x1, y1 = query.x1, query.y1
+        ts, columns, rows = grid_crossings(
+            x1 - dx, y1 - dy, x2 + dx, y2 + dy, self.resolution
+        )
+        ny, nx = self.grid.shape
+        ok = (columns >= 0) & (columns < nx) & (rows >= 0) & (rows < ny)
+        ts, rows, columns = ts[ok], rows[ok], columns[ok]
+        owners = self.grid[rows, columns]
+        length = max_range + 2 * HIT_TOLERANCE
+        seen = set()
+        for k in np.flatnonzero(owners).tolist():
+            # How far along the ray the cell starts:
+            if ts[k] * length - HIT_TOLERANCE > query.limit:
+                return
+            owner = int(owners[k])
+            if owner > 0:
+                indices = [owner - 1]
+            else:
+                indices = self.shared[int(rows[k]), int(columns[k])]
+            walls = [self.walls[index] for index in indices if index not in seen]
+            seen.update(indices)
+            self._add_hits(query, x2, y2, walls)
+            if query.done:
+                return
+
+
+class LightField:
+    """
+    For each bulb, a grid of whether its light reaches the cells past
+    the static walls (walls that aren't robots): DARK if one line
+    blocks it from all four corners of a cell, LIT if no line can block
+    it from anywhere in the cell, and CHECK if a ray has to be cast to
+    tell, like at the edge of a shadow, in a cell that a wall passes
+    through, or behind the end of a wall (even one shorter than a
+    cell). Only the robots have to be checked in LIT cells.
+
+    Args:
+        * resolution: (number) the size of a grid cell, in CM
+    """
+
+    DARK, LIT, CHECK = 0, 1, 2
+
+    def __init__(self, resolution=2.0):
+        self.resolution = resolution
+        self.version = None
+        self.lines = None
+        self.grid = OccupancyGrid(resolution)
+        # The grid of each bulb, by position:
+        self.bulbs = {}
+
+    def __repr__(self):
+        return "<LightField resolution=%r>" % self.resolution
+
+    def copy(self):
+        """
+        Get a copy that shares what was computed, until it is computed
+        again for other walls or bulbs (like for a World.clone()).
+        """
+        field = copy.copy(self)
+        field.grid = self.grid.copy()
+        field.bulbs = dict(self.bulbs)
+        return field
+
+    def update(self, walls, bulbs, width, height, version=None):
+        """
+        Compute the grids of any new bulbs, or of all of them if the
+        static walls have changed.
+
+        Args:
+            * walls: (list) the world's walls; robots' walls are skipped
+            * bulbs: (list) the world's bulbs
+            * width: (number) the width of the world, in CM
+            * height: (number) the height of the world, in CM
+            * version: the version of the walls this is for
+        """
+        import numpy as np
+
+        if self.lines is None or self.version != version:
+            self.lines = np.array(
+                [
+                    (line.p1.x, line.p1.y, line.p2.x, line.p2.y)
+                    for wall in walls
+                    if wall.robot is None
+                    for line in wall.lines
+                ],
+                dtype=float,
+            ).reshape((-1, 4))
+            self.grid.build(walls, width, height, version)
+            self.bulbs = {}
+            self.version = version
+        if len(self.bulbs) != len(bulbs) or any(
+            (bulb.x, bulb.y) not in self.bulbs for bulb in bulbs
+        ):
+            self.bulbs = {
+                (bulb.x, bulb.y): self.bulbs.get((bulb.x, bulb.y))
+                for bulb in bulbs
+            }
+            for key, states in self.bulbs.items():
+                if states is None:
+                    self.bulbs[key] = self._get_states(*key)
+
+    def _get_states(self, x, y):
+        """
+        Compute the grid of a bulb at (x, y).
+        """
+        import numpy as np
+
+        res = self.resolution
+        ny, nx = self.grid.grid.shape
+        xs = np.arange(nx + 1) * res
+        lines = self.lines
+        # Which lines block the ray from each corner of the cells to the
+        # bulb, as bits:
+        blocked = np.zeros((ny + 1, nx + 1, (len(lines) + 7) // 8), dtype=np.uint8)
+        # Rays from the corners of the cells to the bulb, a few rows at
+        # a time, against the lines in reach of them:
+        rows = max(1, 250000 // ((nx + 1) * max(len(lines), 1)))
+        for i in range(0, ny + 1, rows):
+            ys = np.arange(i, min(i + rows, ny + 1)) * res
+            low_x, high_x = min(x, 0), max(x, xs[-1])
+            low_y, high_y = min(y, ys[0]), max(y, ys[-1])
+            near = (
+                (np.maximum(lines[:, 0], lines[:, 2]) >= low_x - 0.1)
+                & (np.minimum(lines[:, 0], lines[:, 2]) <= high_x + 0.1)
+                & (np.maximum(lines[:, 1], lines[:, 3]) >= low_y - 0.1)
+                & (np.minimum(lines[:, 1], lines[:, 3]) <= high_y + 0.1)
+            )
+            px = np.tile(xs, len(ys))[:, np.newaxis]
+            py = np.repeat(ys, len(xs))[:, np.newaxis]
+            hx, hy, ok = intersect_lines(px, py, x, y, lines[near])
+            hits = np.zeros((len(px), len(lines)), dtype=bool)
+            hits[:, near] = ok
+            blocked[i : i + len(ys)] = np.packbits(hits, axis=1).reshape(
+                (len(ys), len(xs), -1)
+            )
+        corners = [
+            blocked[:-1, :-1],
+            blocked[1:, :-1],
+            blocked[:-1, 1:],
+            blocked[1:, 1:],
+        ]
+        # Lit if no line blocks any corner, and dark if one line blocks
+        # them all (so it blocks every ray from the cell in between):
+        lit = ~(corners[0] | corners[1] | corners[2] | corners[3]).any(axis=2)
+        dark = (corners[0] & corners[1] & corners[2] & corners[3]).any(axis=2)
+        # Lines can still block rays from inside a cell whose corners
+        # are lit: lines in or next to the cell, and lines ending in the
+        # shadow that the cell casts (or that end within the tolerance of
+        # a ray). Those cells have to be checked:
+        check = self.grid.grid != 0
+        check |= self._get_shadows(x, y, ny, nx)
+        check = self._grow(check)
+        states = np.full((ny, nx), self.CHECK, dtype=np.uint8)
+        states[lit & ~check] = self.LIT
+        states[dark & ~check] = self.DARK
+        return states
+
+    def _get_shadows(self, x, y, ny, nx):
+        """
+        Get the cells that see the end of a line between them and a
+        bulb at (x, y), or all of them if a line passes by the bulb.
+        """
+        import numpy as np
+
+        res = self.resolution
+        shadows = np.zeros((ny, nx), dtype=bool)
+        lines = self.lines
+        if len(lines) == 0:
+            return shadows
+        x1, y1, x2, y2 = lines.T
+        dx, dy = x2 - x1, y2 - y1
+        length2 = np.maximum(dx * dx + dy * dy, 1e-12)
+        t = np.clip(((x - x1) * dx + (y - y1) * dy) / length2, 0.0, 1.0)
+        if np.hypot(x1 + t * dx - x, y1 + t * dy - y).min() <= HIT_TOLERANCE:
+            shadows[:] = True
+            return shadows
+        reach = math.hypot(max(x, nx * res - x), max(y, ny * res - y))
+        ends = np.unique(np.concatenate([lines[:, :2], lines[:, 2:]]), axis=0)
+        for ex, ey in ends.tolist():
+            dist = math.hypot(ex - x, ey - y)
+            a = math.atan2(ey - y, ex - x)
+            # Rays no more than a cell apart, across the angle that the
+            # end's tolerance covers:
+            spread = math.asin(min(1.0, HIT_TOLERANCE / dist))
+            count = int(math.ceil(2 * spread * reach / res)) + 2
+            for angle in np.linspace(a - spread, a + spread, count).tolist():
+                ux, uy = math.cos(angle), math.sin(angle)
+                start = dist - HIT_TOLERANCE
+                ts, columns, rows = grid_crossings(
+                    x + ux * start,
+                    y + uy * start,
+                    x + ux * reach,
+                    y + uy * reach,
+                    res,
+                )
+                ok = (columns >= 0) & (columns < nx) & (rows >= 0) & (rows < ny)
+                shadows[rows[ok], columns[ok]] = True
+        return shadows
+
+    def _grow(self, cells):
+        """
+        Add the neighbors of cells to them.
+        """
+        grown = cells.copy()
+        grown[1:] |= cells[:-1]
+        grown[:-1] |= cells[1:]
+        wide = grown.copy()
+        wide[:, 1:] |= grown[:, :-1]
+        wide[:, :-1] |= grown[:, 1:]
+        return wide
+
+    def get_light(self, x, y, bulb):
+        """
+        Get whether a bulb's light reaches a point past the static
+        walls: LightField.DARK, LIT, or CHECK.
+
+        Args:
+            * x: (number) the x coordinate, in CM
+            * y: (number) the y coordinate, in CM
+            * bulb: (Bulb) the bulb, which must be in the field
+        """
+        states = self.bulbs.get((bulb.x, bulb.y))
+        if states is None:
+            return self.CHECK
+        ny, nx = states.shape
+        i = math.floor(y / self.resolution)
+        j = math.floor(x / self.resolution)
+        if 0 <= i < ny and 0 <= j < nx:
+            return states[i, j]
+        return self.CHECK
+
+
+class Panorama:
+    """
+    The static walls (walls that aren't robots) that a ray cast from
+    around a point can hit, by the direction of the ray. The lines of
+    the walls are sorted into slices of directions, widened enough to
+    hold for a ray starting anywhere within a radius of the point, so
+    that turning in place, or moving a little, doesn't change them. A
+    ray is only intersected with the lines in its slice.
+
+    Args:
+        * x: (number) the x coordinate of the point, in CM
+        * y: (number) the y coordinate of the point, in CM
+        * radius: (number) how far from the point rays can start, in CM
+        * resolution: (number) the size of a slice of directions, in degrees
+    """
+
+    def __init__(self, x, y, radius, resolution=1.0):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.resolution = resolution
+        self.version = None
+        # The lines close enough to be hit in any direction, and the
+        # lines in each slice, as (distance, wall, line) closest first:
+        self.near = []
+        self.slices = []
+
+    def __repr__(self):
+        return "<Panorama x=%r, y=%r, radius=%r, resolution=%r>" % (
+            self.x,
+            self.y,
+            self.radius,
+            self.resolution,
+        )
+
+    def build(self, walls, version=None):
+        """
+        Sort the lines of the static walls into slices.
+
+        Args:
+            * walls: (list) the world's walls; robots' walls are skipped
+            * version: the version of the walls this is for
+        """
+        count = max(int(round(360 / self.resolution)), 1)
+        size = 2 * math.pi / count
+        reach = self.radius + HIT_TOLERANCE
+        self.near = []
+        self.slices = [[] for i in range(count)]
+        for wall in walls:
+            if wall.robot is not None:
+                continue
+            for line in wall.lines:
+                x1, y1, x2, y2 = line.p1.x, line.p1.y, line.p2.x, line.p2.y
+                closest = float(
+                    segment_distances(self.x, self.y, x1, y1, x2, y2)
+                ) - HIT_TOLERANCE
+                if closest <= reach:
+                    self.near.append((closest, wall, line))
+                    continue
+                # The directions the line is seen in from the point,
+                # widened by how much a ray's start can move them:
+                a1 = math.atan2(x1 - self.x, y1 - self.y)
+                a2 = math.atan2(x2 - self.x, y2 - self.y)
+                span = (a2 - a1 + math.pi) % (2 * math.pi) - math.pi
+                low = a1 + min(span, 0.0)
+                extra = math.asin(min(reach / closest, 1.0))
+                # Rays hit a little past the ends of a line:
+                extra += math.atan2(HIT_TOLERANCE, closest)
+                first = math.floor((low - extra) / size)
+                last = math.floor((low + abs(span) + extra) / size)
+                for i in range(first, min(last, first + count - 1) + 1):
+                    self.slices[i % count].append((closest, wall, line))
+        self.near.sort(key=lambda item: item[0])
+        for lines in self.slices:
+            lines.sort(key=lambda item: item[0])
+        self.version = version
+
+    def covers(self, x, y):
+        """
+        Can rays starting at (x, y) use this panorama?
+
+        Args:
+            * x: (number) the x coordinate, in CM
+            * y: (number) the y coordinate, in CM
+        """
+        return distance(x, y, self.x, self.y) <= self.radius
+
+    def cast_ray(
+        self, x1, y1, a, max_range, robots=(), robot=None, mode="all", profiler=None
+    ):
+        """
+        Cast a ray, like robot.cast_ray(). The ray must start where
+        the panorama covers (see Panorama.covers()).
+
+        Args:
+            * x1: (number) the x coordinate of the start, in CM
+            * y1: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, as in robot.cast_ray()
+            * max_range: (number) the length of the ray, in CM
+            * robots: (list) the robots that can be hit
+            * robot: (Robot) a robot to ignore, like the one casting the ray
+            * mode: (str) which hits to return, as in RayHits
+            * profiler: (Profiler) counts the ray, if given
+
+        Returns list of hits, furthest away first (back to front)
+        """
+        query = RayHits(x1, y1, mode, profiler)
+        x2 = math.sin(a) * max_range + x1
+        y2 = math.cos(a) * max_range + y1
+        index = int((a % (2 * math.pi)) / (2 * math.pi) * len(self.slices))
+        # Lines further from the point than the ray reaches, or than the
+        # closest hit so far, can't be hit (first):
+        reach = max_range + self.radius + HIT_TOLERANCE
+        for lines in [self.near, self.slices[index % len(self.slices)]]:
+            for closest, wall, line in lines:
+                if closest > reach or closest - self.radius > query.limit:
+                    break
+                query.tested += 1
+                pos = intersect_hit(
+                    x1, y1, x2, y2, line.p1.x, line.p1.y, line.p2.x, line.p2.y
+                )
+                if pos is not None:
+                    query.add(pos, wall)
+                    if query.done:
+                        return query.get_hits()
+
+        query.add_robots(x2, y2, robots, robot)
+        return query.get_hits()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import time
+
+
+class Profiler:
+    """
+    Time the phases of world.step(), for each robot and device, and
+    count the work done casting rays. Use world.profile() to make one:
+
+        with world.profile() as profiler:
+            world.steps(100, show=False)
+        print(profiler)
+
+    The phases are:
+
+    * "controllers": running the functions given to world.steps()
+    * "kinematics": moving the robots, and their bounding boxes
+    * "collision": checking the robots' moves against the walls
+    * "device <class>": stepping and updating each class of device
+    * "rays": casting rays, for the devices (so also part of theirs)
+    * "ground": robot.update_ground_image(), like drawing with a pen
+    * "draw": drawing the world
+    * "watchers": updating the watchers
+    * "step": all of world.step()
+
+    The counters are the "rays" cast, the wall and robot line
+    "segments" tested against them, and the "hits" (Hit objects) made.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.seconds = 0.0
+        self.phases = {}
+        self.robots = {}
+        self.counters = {"rays": 0, "segments": 0, "hits": 0}
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def stop(self):
+        if self._start is not None:
+            self.seconds += time.perf_counter() - self._start
+            self._start = None
+
+    def add(self, phase, seconds, robot=None):
+        """
+        Add time spent in a phase.
+
+        Args:
+            * phase: (str) the name of the phase
+            * seconds: (number) how long it took
+            * robot: (Robot) the robot it was for, if any
+        """
+        totals = self.phases.get(phase)
+        if totals is None:
+            totals = self.phases[phase] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+        if robot is not None:
+            # By the robot itself, as robots can share a name:
+            phases = self.robots.setdefault(robot, {})
+            totals = phases.get(phase)
+            if totals is None:
+                totals = phases[phase] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def count_ray(self, segments, hits):
+        """
+        Count a ray cast.
+
+        Args:
+            * segments: (int) the number of line segments tested
+            * hits: (int) the number of Hits made
+        """
+        counters = self.counters
+        counters["rays"] += 1
+        counters["segments"] += segments
+        counters["hits"] += hits
+
+    def get_report(self):
+        """
+        Get the results as a dictionary of the "steps" run, the
+        "seconds" profiled, the totals of the "phases" (each with its
+        "calls", "seconds", and "percent" of the time profiled), a list
+        of the same for each robot (its "name" and "phases") under
+        "robots", and the "counters".
+        """
+        seconds = self.seconds
+        if self._start is not None:
+            seconds += time.perf_counter() - self._start
+
+        def get_phases(phases):
+            return {
+                phase: {
+                    "calls": calls,
+                    "seconds": total,
+                    "percent": 100 * total / seconds if seconds > 0 else 0.0,
+                }
+                for phase, (calls, total) in sorted(
+                    phases.items(), key=lambda item: item[1][1], reverse=True
+                )
+            }
+
+        return {
+            "steps": self.steps,
+            "seconds": seconds,
+            "phases": get_phases(self.phases),
+            "robots": [
+                {"name": robot.name, "phases": get_phases(phases)}
+                for robot, phases in self.robots.items()
+            ],
+            "counters": dict(self.counters),
+        }
+
+    def __str__(self):
+        report = self.get_report()
+        lines = [
+            "%d steps in %.3f seconds" % (report["steps"], report["seconds"]),
+            "%-24s %10s %12s %7s" % ("phase", "calls", "seconds", "%"),
+        ]
+        for phase, totals in report["phases"].items():
+            lines.append(
+                "%-24s %10d %12.6f %6.1f%%"
+                % (phase, totals["calls"], totals["seconds"], totals["percent"])
+            )
+        lines.append(
+            ", ".join(
+                "%s: %d" % (name, value) for name, value in report["counters"].items()
+            )
+        )
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<Profiler steps=%d>" % self.steps
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import threading
+import time
+
+
+def take_snapshot(world, previous=None):
+    """
+    Copy just the parts of a world needed to draw it: the
+    robot poses, traces, speech, simple device values, and
+    ground.
+
+    Args:
+        * world: (World) the world to copy
+        * previous: (tuple) an earlier snapshot of the world, whose
+            copy of the ground is used if the ground hasn't changed
+    """
+    time_step = world.time_step
+    robots = []
+    for robot in world._robots:
+        max_trace_length = int(1.0 / time_step * robot.max_trace_length)
+        robots.append(
+            (
+                robot.x,
+                robot.y,
+                robot.direction,
+                robot.stalled,
+                robot.color,
+                robot.trace_color,
+                robot.trace[-max_trace_length:],
+                robot.text_trace[-1:],
+                [
+                    {
+                        key: value
+                        for key, value in vars(device).items()
+                        if isinstance(value, (bool, int, float))
+                    }
+                    for device in robot._devices
+                ],
+            )
+        )
+    ground_version = world._ground_version
+    if previous is not None and previous[3] == ground_version:
+        ground_image = previous[2]
+    else:
+        # Bring the ground image up to date here, on the simulation
+        # thread, and copy it, as it shares the ground array's memory:
+        ground_image = world.ground_image
+        if ground_image is not None:
+            ground_image = ground_image.copy()
+    return (
+        world.time,
+        list(world.draw_list),
+        ground_image,
+        ground_version,
+        robots,
+    )
+
+
+class RenderWorker(threading.Thread):
+    """
+    Background thread that draws the latest snapshot of a world.
+
+    The simulation thread submits snapshots into a single slot; a
+    snapshot that has not been drawn yet is replaced by a newer one,
+    so stale frames are dropped rather than queued. Frames are drawn
+    at most once per world.throttle_period.
+    """
+
+    def __init__(self, world):
+        super().__init__()
+        self.daemon = True  # allows program to exit without waiting for join
+        self.world = world
+        self.shadow = None
+        self.shadow_key = None
+        self.previous = None
+        self.slot = None
+        self.frames = 0
+        self.running = True
+        self.condition = threading.Condition()
+        # Held while drawing into the world's backend:
+        self.lock = threading.RLock()
+
+    def submit(self, world):
+        # The shadow is made here, on the simulation thread:
+        key = (len(world._robots), len(world.bulbs), world._walls_version)
+        if self.shadow is None or self.shadow_key != key:
+            self.make_shadow()
+            self.shadow_key = key
+        snapshot = take_snapshot(world, self.previous)
+        self.previous = snapshot
+        with self.condition:
+            self.slot = (self.shadow, snapshot)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.slot is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                shadow, snapshot = self.slot
+                self.slot = None
+            start_time = time.monotonic()
+            with self.lock:
+                self.draw(shadow, snapshot)
+            self.frames += 1
+            # Leave the simulation thread alone until the next frame is due:
+            sleep_time = self.world.throttle_period - (time.monotonic() - start_time)
+            if sleep_time > 0:
+                with self.condition:
+                    self.condition.wait_for(lambda: not self.running, sleep_time)
+
+    def make_shadow(self):
+        """
+        A copy of the world, used only for drawing, that shares the
+        original world's backend. Made with world.clone(), so it
+        doesn't seed the random number generator or make a backend.
+        """
+        world = self.world
+        copy_on_write = world._ground_copy_on_write
+        shadow = world.clone()
+        # The shadow draws the snapshots' ground, and never writes to
+        # the world's ground array:
+        world._ground_copy_on_write = copy_on_write
+        shadow.ground_array = None
+        shadow._ground_copy_on_write = False
+        shadow.backend = world.backend
+        self.shadow = shadow
+
+    def draw(self, shadow, snapshot):
+        time, draw_list, ground_image, ground_version, robots = snapshot
+        shadow.time = time
+        shadow.draw_list = draw_list
+        # Only drawn by the shadow, so no need for its ground_array:
+        shadow._ground_image = ground_image
+        shadow._ground_version = ground_version
+        for robot, state in zip(shadow._robots, robots):
+            (
+                robot.x,
+                robot.y,
+                robot.direction,
+                robot.stalled,
+                robot.color,
+                robot.trace_color,
+                robot.trace,
+                robot.text_trace,
+                devices,
+            ) = state
+            for device, values in zip(robot._devices, devices):
+                vars(device).update(values)
+        shadow.draw()
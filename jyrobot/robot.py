@@ -8,14 +8,31 @@
 #
 # *************************************
 
+import copy
 import importlib
 import math
 import re
+import time
+from itertools import chain
 
 from .datasets import get_dataset
-from .hit import Hit
+from .fields import Panorama, RayHits
 from .utils import Color, Line, Point, distance, intersect, intersect_hit
 
+# Numeric state saved by Robot.get_snapshot(), in order:
+SNAPSHOT_FIELDS = [
+    "x",
+    "y",
+    "direction",
+    "vx",
+    "vy",
+    "va",
+    "tvx",
+    "tvy",
+    "tva",
+    "stalled",
+]
+
 
 class Robot:
     """
@@ -75,6 +92,7 @@ class Robot:
 
         self.world = None
         self._devices = []
+        self._panorama = None
         self.initialize()
         self.from_json(config)
 
@@ -147,6 +165,7 @@ class Robot:
         self.text_trace = []
         self.pen_trace = []
         self.pen = (None, 0)
+        self.last_pen_position = None
         self.body = []
         self.max_trace_length = 10  # seconds
         self.x = 0  # cm
@@ -326,12 +345,19 @@ class Robot:
             * seconds: (number) the length of trace
         """
         self.max_trace_length = seconds
+        self._settings_changed()
 
     def set_color(self, color):
         """
         Set the color of a robot, and its trace.
         """
         self._set_color(color)
+        self._settings_changed()
+
+    def _settings_changed(self):
+        # See World.reset():
+        if self.world is not None:
+            self.world._settings_changed()
 
     def _set_color(self, color):
         if not isinstance(color, Color):
@@ -385,6 +411,8 @@ class Robot:
             self.trace[:] = []
             self.text_trace[:] = []
             self.pen_trace[:] = []
+        # Don't draw a line from where the robot was:
+        self.last_pen_position = None
         if x is not None:
             self.x = x
         if y is not None:
@@ -401,6 +429,7 @@ class Robot:
         if device in self._devices:
             device.robot = None
             self._devices.remove(device)
+            self._settings_changed()
         else:
             raise Exception("Device %r is not on robot." % device)
 
@@ -411,6 +440,7 @@ class Robot:
         if device not in self._devices:
             device.robot = self
             self._devices.append(device)
+            self._settings_changed()
             if self.world is not None:
                 self.world.update()  # request draw
         else:
@@ -448,6 +478,75 @@ class Robot:
         }
         return robot_json
 
+    def get_snapshot(self):
+        """
+        Get the robot's dynamic state: its pose, velocities, traces,
+        pen, state, and device readings. See World.get_snapshot().
+        """
+        return {
+            "pose": tuple(getattr(self, name) for name in SNAPSHOT_FIELDS),
+            "trace": list(self.trace),
+            "text_trace": list(self.text_trace),
+            "pen_trace": list(self.pen_trace),
+            "pen": self.pen,
+            "last_pen_position": self.last_pen_position,
+            "state": copy.deepcopy(self.state),
+            "devices": [
+                {
+                    key: value
+                    for key, value in vars(device).items()
+                    if isinstance(value, (bool, int, float))
+                }
+                for device in self._devices
+            ],
+        }
+
+    def set_snapshot(self, snapshot):
+        """
+        Restore the robot's dynamic state from Robot.get_snapshot().
+        """
+        for name, value in zip(SNAPSHOT_FIELDS, snapshot["pose"]):
+            setattr(self, name, value)
+        self.stalled = bool(self.stalled)
+        self.trace[:] = snapshot["trace"]
+        self.text_trace[:] = snapshot["text_trace"]
+        self.pen_trace[:] = snapshot["pen_trace"]
+        self.pen = snapshot["pen"]
+        self.last_pen_position = snapshot["last_pen_position"]
+        self.state = copy.deepcopy(snapshot["state"])
+        for device, values in zip(self._devices, snapshot["devices"]):
+            vars(device).update(values)
+        self.init_boundingbox()
+
+    def clone(self):
+        """
+        Copy the robot, sharing what doesn't change (its body and
+        image data) and copying its pose, traces, state, and devices.
+        The copy is not in a world. See World.clone().
+        """
+        robot = copy.copy(self)
+        robot.world = None
+        robot.trace = list(self.trace)
+        robot.text_trace = list(self.text_trace)
+        robot.pen_trace = list(self.pen_trace)
+        robot.state = copy.deepcopy(self.state)
+        robot.body = list(self.body)
+        robot.boundingbox = list(self.boundingbox)
+        robot.bounding_lines = [
+            Line(line.p1.copy(), line.p2.copy()) for line in self.bounding_lines
+        ]
+        if hasattr(self, "last_boundingbox"):
+            robot.last_boundingbox = [point.copy() for point in self.last_boundingbox]
+        robot._devices = []
+        for device in self._devices:
+            device = copy.copy(device)
+            for key, value in vars(device).items():
+                if isinstance(value, list):
+                    setattr(device, key, list(value))
+            device.robot = robot
+            robot._devices.append(device)
+        return robot
+
     def move(self, translate, rotate):
         """
         Set the target translate and rotate velocities.
@@ -563,14 +662,84 @@ class Robot:
         """
         return (self.x, self.y, (self.direction * 180 / math.pi) % 360)
 
-    def cast_ray(self, x1, y1, a, maxRange):
+    def get_panorama(self, x, y):
+        """
+        Get the robot's Panorama for casting rays from (x, y), if the
+        world uses them (see world.set_ray_engine()). It is made again
+        when the static walls change, or when rays start too far from
+        where it was made. It covers twice the size of the robot, so
+        the robot can turn in place, or move a little, and keep it.
+
+        Args:
+            * x: (number) the x coordinate of the start of rays, in CM
+            * y: (number) the y coordinate of the start of rays, in CM
+        """
+        resolution = self.world.panorama_resolution
+        if resolution is None:
+            return None
+        version = self.world._walls_version
+        panorama = self._panorama
+        if (
+            panorama is None
+            or panorama.version != version
+            or panorama.resolution != resolution
+            or not panorama.covers(x, y)
+        ):
+            if len(self.boundingbox) > 0:
+                min_x, min_y, max_x, max_y = self.boundingbox
+                radius = 2 * math.hypot(max(-min_x, max_x), max(-min_y, max_y))
+            else:
+                radius = 0.0
+            if distance(x, y, self.x, self.y) <= radius:
+                panorama = Panorama(self.x, self.y, radius, resolution)
+            else:  # rays from away from the robot
+                panorama = Panorama(x, y, radius, resolution)
+            panorama.build(self.world.walls, version)
+            self._panorama = panorama
+        return panorama
+
+    def cast_ray(self, x1, y1, a, maxRange, mode="all"):
         """
         Cast a ray into this world and see what it hits.
 
+        Args:
+            * x1: (number) the x coordinate of the start, in CM
+            * y1: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, in radians
+            * maxRange: (number) the length of the ray, in CM
+            * mode: (str) "all" hits, only the "closest" hit, or "any"
+                one hit, which stops at the first found (see RayHits)
+
         Returns list of hits, furthest away first (back to front)
         """
+        profiler = self.world.profiler
+        if profiler is None:
+            return self._cast_ray(x1, y1, a, maxRange, mode, None)
+        start = time.perf_counter()
+        hits = self._cast_ray(x1, y1, a, maxRange, mode, profiler)
+        profiler.add("rays", time.perf_counter() - start, self)
+        return hits
+
+    def _cast_ray(self, x1, y1, a, maxRange, mode, profiler):
+        robots = self.world._robots
+        table = self.world.get_depth_table()
+        if table is not None:
+            hits = table.cast_ray(x1, y1, a, maxRange, robots, self, mode, profiler)
+            if hits is not None:
+                return hits
+
+        grid = self.world.get_occupancy_grid()
+        if grid is not None:
+            return grid.cast_ray(x1, y1, a, maxRange, robots, self, mode, profiler)
+
+        panorama = self.get_panorama(x1, y1)
+        if panorama is not None:
+            return panorama.cast_ray(
+                x1, y1, a, maxRange, robots, self, mode, profiler
+            )
+
         # walls and robots
-        hits = []
+        query = RayHits(x1, y1, mode, profiler)
         x2 = math.sin(a) * maxRange + x1
         y2 = math.cos(a) * maxRange + y1
 
@@ -578,33 +747,17 @@ class Robot:
             # never detect hit with yourself
             if wall.robot is self:
                 continue
+            query.tested += len(wall.lines)
             for line in wall.lines:
                 p1 = line.p1
                 p2 = line.p2
                 pos = intersect_hit(x1, y1, x2, y2, p1.x, p1.y, p2.x, p2.y)
                 if pos is not None:
-                    dist = distance(pos[0], pos[1], x1, y1)
-                    height = 1.0 if wall.robot is None else wall.robot.height
-                    color = wall.robot.color if wall.robot else wall.color
-                    boundary = len(wall.lines) == 1
-                    hits.append(
-                        Hit(
-                            wall.robot,
-                            height,
-                            pos[0],
-                            pos[1],
-                            dist,
-                            color,
-                            x1,
-                            y1,
-                            boundary,
-                        )
-                    )
+                    query.add(pos, wall)
+                    if query.done:
+                        return query.get_hits()
 
-        hits.sort(
-            key=lambda a: a.distance, reverse=True
-        )  # further away first, back to front
-        return hits
+        return query.get_hits()
 
     def init_boundingbox(self):
         # First, find min/max points around robot (assumes box):
@@ -703,6 +856,9 @@ class Robot:
         Have the robot make one step in time. Check to see if it hits
         any obstacles.
         """
+        profiler = self.world.profiler
+        if profiler is not None:
+            start = time.perf_counter()
         # proposed acceleration:
         va = self.va + self._deltav(
             self.tva, self.va, self.va_max, self.va_ramp, time_step
@@ -733,6 +889,10 @@ class Robot:
         p1, p2, p3, p4 = self.compute_boundingbox(px, py, pdirection)
         # Set wall bounding boxes for collision detection:
         self.update_boundingbox(p1, p2, p3, p4)
+        if profiler is not None:
+            now = time.perf_counter()
+            profiler.add("kinematics", now - start, self)
+            start = now
 
         self.stalled = False
         # if intersection, can't move:
@@ -750,6 +910,8 @@ class Robot:
                 ):
                     self.stalled = True
                     break
+        if profiler is not None:
+            profiler.add("collision", time.perf_counter() - start, self)
 
         if not self.stalled:
             # if no intersection, make move
@@ -767,8 +929,18 @@ class Robot:
             self.vy = 0
 
         # Devices:
-        for device in self._devices:
-            device.step(time_step)
+        if profiler is None:
+            for device in self._devices:
+                device.step(time_step)
+        else:
+            for device in self._devices:
+                start = time.perf_counter()
+                device.step(time_step)
+                profiler.add(
+                    "device " + type(device).__name__,
+                    time.perf_counter() - start,
+                    self,
+                )
 
         # Update history:
         if self.do_trace:
@@ -778,7 +950,12 @@ class Robot:
         """
         Update the robot, and devices.
         """
+        profiler = self.world.profiler
+        if profiler is not None:
+            start = time.perf_counter()
         self.init_boundingbox()
+        if profiler is not None:
+            profiler.add("kinematics", time.perf_counter() - start, self)
         if self.world.debug and draw_list is not None:
             draw_list.append(("strokeStyle", (Color(255), 1)))
             draw_list.append(
@@ -830,8 +1007,18 @@ class Robot:
             )
 
         # Devices:
-        for device in self._devices:
-            device.update(draw_list)
+        if profiler is None:
+            for device in self._devices:
+                device.update(draw_list)
+        else:
+            for device in self._devices:
+                start = time.perf_counter()
+                device.update(draw_list)
+                profiler.add(
+                    "device " + type(device).__name__,
+                    time.perf_counter() - start,
+                    self,
+                )
 
         # Update recording info:
         if self.world.recording:
@@ -850,7 +1037,12 @@ class Robot:
                 self.pen_trace[:] = [(self.world.time, self.pen)]
 
         # Alter world:
-        self.update_ground_image(self.world.time)
+        if profiler is None:
+            self.update_ground_image(self.world.time)
+        else:
+            start = time.perf_counter()
+            self.update_ground_image(self.world.time)
+            profiler.add("ground", time.perf_counter() - start, self)
         return
 
     def rotate_around(self, x1, y1, length, angle):
@@ -885,25 +1077,34 @@ class Robot:
         data = self.get_current_pen_color(world_time)
         # time, (color, radius)
         if data is not None and data[1][0] is not None:
-            self.world.set_ground_color_at(self.x, self.y, data[1])
+            # Draw from the last pen position, so there are no gaps:
+            if self.last_pen_position is None:
+                self.last_pen_position = (self.x, self.y)
+            x, y = self.last_pen_position
+            self.world.set_ground_color_along(x, y, self.x, self.y, data[1])
+            self.last_pen_position = (self.x, self.y)
+        else:
+            self.last_pen_position = None
 
     def draw(self, backend):
         """
         Draw the robot.
         """
+        import numpy as np
+
         if self.do_trace:
             time_step = self.world.time_step if self.world is not None else 0.1
             max_trace_length = int(1.0 / time_step * self.max_trace_length)
-
-            backend.draw_lines(
-                [
-                    (point[0], point[1])
-                    for (point, direction) in self.trace[-max_trace_length:]
-                ],
-                stroke_style=self.trace_color,
-            )
             self.trace = self.trace[-max_trace_length:]
 
+            # One contiguous (N, 2) array, drawn as a single polyline:
+            points = np.fromiter(
+                chain.from_iterable((point.x, point.y) for (point, _) in self.trace),
+                dtype=float,
+                count=len(self.trace) * 2,
+            ).reshape(-1, 2)
+            backend.draw_lines(points, stroke_style=self.trace_color)
+
         backend.pushMatrix()
         backend.translate(self.x, self.y)
         backend.rotate(self.direction)
@@ -8,7 +8,7 @@
 #
 # *************************************
 
-import glob
+import hashlib
 import io
 import json
 import math
@@ -17,8 +17,13 @@ from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
 
+from .catalog import find_file, get_catalog
 from .color_data import COLORS
-from .config import get_jyrobot_search_paths
+from .config import (
+    get_jyrobot_cache_dir,
+    get_jyrobot_search_paths,
+    get_mmap_threshold,
+)
 
 
 def progress_bar(range, show_progress=True, progress_type="tqdm"):
@@ -148,66 +153,181 @@ def load_world(filename=None):
         worlds/w1.json
 
     """
-    from .world import World
-
     if filename is None:
         print("Searching for jyrobot config files...")
         for path in get_jyrobot_search_paths():
             print("Directory:", path)
             files = sorted(
-                glob.glob(os.path.join(path, "**", "*.json"), recursive=True),
-                key=lambda filename: (filename.count("/"), filename),
+                get_catalog(path).names("*.json"),
+                key=lambda filename: (filename.count(os.sep), filename),
             )
             if len(files) > 0:
                 for fname in files:
-                    basename = os.path.splitext(fname)[0]
-                    print("    %r" % basename[len(path) :])
+                    print("    %r" % os.path.splitext(fname)[0])
             else:
                 print("    no files found")
     else:
         if not filename.endswith(".json"):
             filename += ".json"
-        for path in get_jyrobot_search_paths():
-            path_filename = os.path.join(path, filename)
-            if os.path.exists(path_filename):
-                print("Loading %s..." % path_filename)
-                with open(path_filename) as fp:
-                    contents = fp.read()
-                    config = json.loads(contents)
-                    config["filename"] = path_filename
-                    world = World(**config)
-                    return world
+        path_filename = find_file(filename)
+        if path_filename is not None:
+            return _load_world_file(path_filename)
         print("No such world found: %r" % filename)
     return None
 
 
+def load_worlds(pattern="*"):
+    """
+    Load all of the worlds on the search paths with names that match
+    a pattern, like "test1/*". Where two search paths have a world with
+    the same name, the first one is used, like load_world().
+
+    Args:
+        * pattern: (str) a shell-style wildcard pattern
+
+    Returns a list of worlds, sorted by name.
+    """
+    found = {}
+    for path in get_jyrobot_search_paths():
+        catalog = get_catalog(path)
+        for name in catalog.names(pattern + ".json"):
+            if name not in found:
+                found[name] = catalog.entries[name].path
+    return [_load_world_file(found[name]) for name in sorted(found)]
+
+
+def _load_world_file(path_filename):
+    from .world import World
+
+    print("Loading %s..." % path_filename)
+    with open(path_filename) as fp:
+        config = json.load(fp)
+    config["filename"] = path_filename
+    return World(**config)
+
+
 def load_image(filename, width=None, height=None):
+    """
+    Load an image, optionally resized to (width, height).
+
+    Decoded images are kept in IMAGE_CACHE, keyed by the file's path,
+    modification time, and size, so loading the same image again
+    only makes a copy of it.
+
+    Args:
+        * filename: (str) the image file, found on the jyrobot search paths
+        * width: (int) width to resize the image to
+        * height: (int) height to resize the image to
+    """
+    image = _load_cached_image(filename, width, height)
+    if image is not None:
+        return image.copy()
+
+
+def _load_cached_image(filename, width=None, height=None):
+    """
+    Like load_image(), but returns the image in IMAGE_CACHE itself,
+    which must not be changed.
+    """
     from PIL import Image
 
     pathname = find_resource(filename)
     if pathname is not None:
+        stat = os.stat(pathname)
+        key = (pathname, stat.st_mtime_ns, stat.st_size, width, height)
+        image = IMAGE_CACHE.get(key)
+        if image is None:
+            image = Image.open(pathname)
+            if width is not None and height is not None:
+                image = image.resize((width, height))
+            image.load()
+            IMAGE_CACHE.put(key, image)
+        return image
+
+
+def load_image_array(filename, width=None, height=None, box=None):
+    """
+    Load an image as a NumPy array of RGB or RGBA pixels.
+
+    Large images (see config.set_mmap_threshold()) are converted to
+    RGBA once, saved in the jyrobot cache, and memory-mapped
+    copy-on-write from there. Processes loading the same image share
+    its memory pages, and writing into the array only copies the pages
+    that are written to.
+
+    Args:
+        * filename: (str) the image file, found on the jyrobot search paths
+        * width: (int) width to resize the image to
+        * height: (int) height to resize the image to
+        * box: (tuple) only get the (x1, y1, x2, y2) part of the image
+    """
+    import numpy as np
+    from PIL import Image
+
+    pathname = find_resource(filename)
+    if pathname is None:
+        return None
+    if width is None or height is None:
+        width, height = Image.open(pathname).size
+    if width * height * 4 < get_mmap_threshold():
+        # Cropping and np.array() copy the cached image:
+        image = _load_cached_image(filename, width, height)
+        if box is not None:
+            image = image.crop(box)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        return np.array(image)
+
+    stat = os.stat(pathname)
+    key = "%s:%s:%s:%sx%s" % (pathname, stat.st_mtime_ns, stat.st_size, width, height)
+    cache_filename = os.path.join(
+        get_jyrobot_cache_dir("images"),
+        hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy",
+    )
+    array = None
+    if not os.path.exists(cache_filename):
+        # Not through IMAGE_CACHE, which would keep the whole image:
         image = Image.open(pathname)
-        if width is not None and height is not None:
+        if image.size != (width, height):
             image = image.resize((width, height))
-        return image
+        pixels = np.asarray(image.convert("RGBA"))
+        del image
+        temp_filename = "%s.%s.tmp" % (cache_filename, os.getpid())
+        try:
+            with open(temp_filename, "wb") as fp:
+                np.save(fp, pixels)
+            os.replace(temp_filename, cache_filename)
+        except OSError:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            array = np.array(pixels)
+    if array is None:
+        array = np.load(cache_filename, mmap_mode="c")
+    if box is not None:
+        x1, y1, x2, y2 = box
+        array = array[y1:y2, x1:x2]
+    return array
 
 
 def find_resource(filename=None):
     if filename is None:
         print("Searching for jyrobot files...")
         for path in get_jyrobot_search_paths():
-            files = sorted(glob.glob(os.path.join(path, "*.*")))
+            files = sorted(
+                name
+                for name in get_catalog(path).names("*.*")
+                if os.sep not in name and not name.startswith(".")
+            )
             print("Directory:", path)
             if len(files) > 0:
                 for filename in files:
-                    print("    %r" % filename)
+                    print("    %r" % os.path.join(path, filename))
             else:
                 print("    no files found")
     else:
-        for path in get_jyrobot_search_paths():
-            path_filename = os.path.abspath(os.path.join(path, filename))
-            if os.path.exists(path_filename):
-                return path_filename
+        path_filename = find_file(filename)
+        if path_filename is not None:
+            return path_filename
         print("No such file found: %r" % filename)
     return None
 
@@ -389,6 +509,57 @@ class throttle(object):
         return wrapper
 
 
+class LRUCache:
+    """
+    A dictionary that holds values up to a total size of max_size,
+    dropping the least recently used values first.
+
+    Args:
+        * max_size: (number) the most the cache can hold
+        * size_of: (function) gives the size of a value; defaults to 1
+    """
+
+    def __init__(self, max_size, size_of=None):
+        self.max_size = max_size
+        self.size_of = size_of if size_of is not None else (lambda value: 1)
+        self.size = 0
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key][0]
+        return default
+
+    def put(self, key, value):
+        if key in self.items:
+            self.size -= self.items.pop(key)[1]
+        size = self.size_of(value)
+        if size > self.max_size:
+            return
+        self.items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            self.size -= self.items.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+
+
+# Decoded images, by (path, mtime, size, width, height); at most 256 MB:
+IMAGE_CACHE = LRUCache(
+    256 * 1024 * 1024,
+    lambda image: image.width * image.height * len(image.getbands()),
+)
+
+
 class Color:
     def __init__(self, red, green=None, blue=None, alpha=None):
         self.name = None
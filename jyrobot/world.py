@@ -8,6 +8,8 @@
 #
 # *************************************
 
+import copy
+import json
 import math
 import os
 import random
@@ -21,6 +23,8 @@ from numbers import Number
 
 from .backends import make_backend
 from .colors import BLACK_50, WHITE
+from .fields import HIT_TOLERANCE, DistanceField, LightField, OccupancyGrid
+from .profiler import Profiler
 from .robot import Robot
 from .utils import (
     Color,
@@ -30,12 +34,51 @@ from .utils import (
     distance_point_to_line,
     format_time,
     json_dump,
-    load_image,
+    load_image_array,
     progress_bar,
 )
 
 DEFAULT_HANDLER = signal.getsignal(signal.SIGINT)
 
+# Version of the World.save_snapshot() file format:
+SNAPSHOT_VERSION = 1
+
+# Versions of the static walls, unique across worlds:
+WALLS_VERSIONS = count()
+
+# Versions of the ground image, unique across worlds:
+GROUND_VERSIONS = count()
+
+# Versions of the settings (see World.reset()), unique across worlds:
+SETTINGS_VERSIONS = count()
+
+
+def encode_pen(pen):
+    color, radius = pen
+    return (str(color) if color is not None else None, radius)
+
+
+def decode_pen(pen):
+    color, radius = pen
+    return (Color(color) if color is not None else None, radius)
+
+
+def union_box(box1, box2):
+    """
+    The smallest (x1, y1, x2, y2) box that holds both boxes;
+    either may be None.
+    """
+    if box1 is None:
+        return box2
+    if box2 is None:
+        return box1
+    return (
+        min(box1[0], box2[0]),
+        min(box1[1], box2[1]),
+        max(box1[2], box2[2]),
+        max(box1[3], box2[3]),
+    )
+
 
 class Wall:
     """
@@ -191,10 +234,22 @@ class World:
         self.time_of_last_call = 0
         self.step_display = "tqdm"
         self.debug = False
+        self.profiler = None
         self.watchers = []
         self._robots = []
         self.backend = None
+        self.render_worker = None
         self.recording = False
+        self._batch_depth = 0
+        self._batch_pending = {}
+        self._reset_snapshot = None
+        self._walls_version = next(WALLS_VERSIONS)
+        self._settings_version = next(SETTINGS_VERSIONS)
+        self.distance_field = DistanceField()
+        self.light_field = None
+        self.occupancy_grid = None
+        self.panorama_resolution = None
+        self.depth_table = None
         self.config = config.copy()
         self.initialize()  # default values
         self.reset()  # from config
@@ -288,25 +343,68 @@ class World:
         self.ground_color = Color(0, 128, 0)
         self.ground_image_filename = None
         self.ground_image = None
-        self.ground_image_pixels = None
         self.walls = []
         self.bulbs = []
         self.complexity = 0
 
-    def reset(self):
+    def reset(self, show=True):
         """
         Reloads the config from initialization, or from
         last save.
+
+        If nothing but the dynamic state (see world.get_snapshot()) has
+        changed since the last reset, the world is restored from a
+        snapshot taken then, rather than being reloaded. Settings are
+        noticed when they are changed with the set_ methods of the
+        world, robots, and devices (and walls, bulbs, robots, and
+        devices when they are added or removed), but not when their
+        attributes are assigned directly.
+
+        Args:
+            * show: (bool) if False, don't draw the world afterwards,
+                which is most of the time a restore takes
         """
         self.reset_watchers()
-        self.from_json(self.config)
-        self.time = 0.0
-        for robot in self._robots:
-            robot.reset()
+        if (
+            self._reset_snapshot is not None
+            and self._reset_snapshot[0] is self.config
+            and self._reset_snapshot[1] == self._get_reset_key()
+        ):
+            self.set_seed(self.config.get("seed", 0))
+            # Also does the first of the two updates:
+            self.set_snapshot(self._reset_snapshot[2])
+        else:
+            self.from_json(self.config)
+            self.time = 0.0
+            for robot in self._robots:
+                robot.reset()
+            self._reset_snapshot = (
+                self.config,
+                self._get_reset_key(),
+                self.get_snapshot(),
+            )
+            self.update(show=False)  # twice to allow robots to see each other
         self.stop = False  # should stop?
-        self.update(show=False)  # twice to allow robots to see each other
         self.update(show=False)
-        self.draw()  # force
+        if show:
+            self.draw()  # force
+
+    def _get_reset_key(self):
+        """
+        The versions of what a snapshot doesn't include: the settings
+        of the world, robots, and devices (as in to_json()), and which
+        walls, bulbs, robots, and devices there are. If any of these
+        change, reset() must reload the config.
+        """
+        return (self._settings_version, self._walls_version)
+
+    def _settings_changed(self):
+        """
+        Note that a setting that to_json() saves (but a snapshot
+        doesn't) changed, or a bulb, robot, or device was added or
+        removed.
+        """
+        self._settings_version = next(SETTINGS_VERSIONS)
 
     def set_seed(self, seed):
         """
@@ -327,6 +425,15 @@ class World:
         """
         Load a json config file.
         """
+        with self.batch(show=False):
+            self._from_json(config)
+
+    def _from_json(self, config):
+        # Walls and bulbs from a previous load (but not the robots'
+        # walls) are replaced:
+        self.walls[:] = [wall for wall in self.walls if wall.robot is not None]
+        self._walls_changed()
+        self.bulbs[:] = []
         self.config = config
         seed = config.get("seed", 0)
         self.set_seed(seed)
@@ -389,7 +496,8 @@ class World:
         Remove any boundary walls.
         """
         self.walls[:] = [wall for wall in self.walls if len(wall.lines) > 1]
-        self.complexity = self.compute_complexity()
+        self._walls_changed()
+        self._update_complexity()
 
     def add_boundary_walls(self):
         """
@@ -409,7 +517,8 @@ class World:
                     Wall(self.boundary_wall_color, None, Line(p4, p1)),
                 ]
             )
-            self.complexity = self.compute_complexity()
+            self._walls_changed()
+            self._update_complexity()
 
     def to_json(self):
         """
@@ -459,6 +568,9 @@ class World:
         """
         Save the current state of the world as the config.
         """
+        if self._batch_depth > 0:
+            self._batch_pending["save"] = True
+            return
         self.config = self.to_json()
 
     def save_file(self):
@@ -488,11 +600,232 @@ class World:
         self.config["filename"] = filename
         # Now you can use save():
 
+    def clone(self):
+        """
+        Make a copy of the world, for trying things out (like a planner
+        searching ahead). The copy shares the static walls, bulbs, and
+        ground image with this world, and gets its own copies of the
+        robots, their devices, and traces. The ground is copied the
+        first time either world writes to it (like with a pen).
+
+        The copy has no backend or watchers, so it does not draw. Note
+        that both worlds use Python's global random number generator.
+        """
+        world = copy.copy(self)
+        world.backend = None
+        world.render_worker = None
+        world.watchers = []
+        world.profiler = None
+        # Each world rebuilds its own fields when its walls change:
+        for name in ["distance_field", "light_field", "occupancy_grid", "depth_table"]:
+            field = getattr(self, name)
+            if field is not None:
+                setattr(world, name, field.copy())
+        world._batch_depth = 0
+        world._batch_pending = {}
+        world._reset_snapshot = None
+        world.draw_list = list(self.draw_list)
+        world.bulbs = list(self.bulbs)
+        world.robots = RobotList(world)
+        clones = {}
+        for robot in self._robots:
+            clones[robot] = robot.clone()
+            clones[robot].world = world
+        world._robots = [clones[robot] for robot in self._robots]
+        world.walls = [
+            Wall(wall.color, clones[wall.robot], *clones[wall.robot].bounding_lines)
+            if wall.robot is not None
+            else wall
+            for wall in self.walls
+        ]
+        if self.ground_array is not None:
+            self._ground_copy_on_write = True
+            world._ground_copy_on_write = True
+            world._ground_image = None
+            world._ground_pixels = None
+            world._ground_dirty = None
+        return world
+
+    def get_snapshot(self):
+        """
+        Get the dynamic state of the world: the time, the random number
+        generator state, changes to the ground image, and each robot's
+        pose, velocities, traces, pen, and device readings. Restore it
+        with world.set_snapshot(), or save it with world.save_snapshot().
+        """
+        ground = None
+        if self._ground_modified is not None:
+            x1, y1, x2, y2 = self._ground_modified
+            ground = (x1, y1, self.ground_array[y1:y2, x1:x2].copy())
+        return {
+            "time": self.time,
+            "random": random.getstate(),
+            "ground": ground,
+            "robots": [robot.get_snapshot() for robot in self._robots],
+        }
+
+    def set_snapshot(self, snapshot):
+        """
+        Restore the world to a snapshot from world.get_snapshot(). The
+        world must have the same robots and devices as when the
+        snapshot was taken.
+
+        Args:
+            * snapshot: (dict) the snapshot
+        """
+        if len(snapshot["robots"]) != len(self._robots):
+            raise ValueError(
+                "snapshot has %s robots, but the world has %s"
+                % (len(snapshot["robots"]), len(self._robots))
+            )
+        self.time = snapshot["time"]
+        random.setstate(snapshot["random"])
+        self._restore_ground_region()
+        if snapshot["ground"] is not None:
+            self._own_ground_array()
+            x, y, pixels = snapshot["ground"]
+            height, width = pixels.shape[:2]
+            self.ground_array[y : y + height, x : x + width] = pixels
+            self._mark_ground_dirty(x, y, x + width, y + height)
+        for robot, robot_snapshot in zip(self._robots, snapshot["robots"]):
+            robot.set_snapshot(robot_snapshot)
+        self.update(show=False)
+
+    def save_snapshot(self, filename):
+        """
+        Save a snapshot of the world's dynamic state (see
+        world.get_snapshot()) as a compressed NumPy .npz file. The
+        world's config is saved with it, as JSON, under "config".
+
+        Args:
+            * filename: (str) the name of the file
+        """
+        import numpy as np
+
+        if not filename.endswith(".npz"):
+            filename = filename + ".npz"
+        snapshot = self.get_snapshot()
+        robots = snapshot["robots"]
+        random_version, random_state, random_gauss = snapshot["random"]
+        arrays = {
+            "version": np.array(SNAPSHOT_VERSION),
+            "time": np.array(snapshot["time"]),
+            "random_version": np.array(random_version),
+            "random_state": np.array(random_state, dtype=np.int64),
+            "random_gauss": np.array(
+                random_gauss if random_gauss is not None else math.nan
+            ),
+            "poses": np.array(
+                [robot["pose"] for robot in robots], dtype=float
+            ).reshape(len(robots), -1),
+            "traces": np.array(
+                [
+                    (point.x, point.y, direction)
+                    for robot in robots
+                    for point, direction in robot["trace"]
+                ],
+                dtype=float,
+            ).reshape(-1, 3),
+            "trace_lengths": np.array(
+                [len(robot["trace"]) for robot in robots], dtype=np.int64
+            ),
+            "robots": np.array(
+                json.dumps(
+                    [
+                        {
+                            "text_trace": robot["text_trace"],
+                            "pen_trace": [
+                                (time, encode_pen(pen))
+                                for (time, pen) in robot["pen_trace"]
+                            ],
+                            "pen": encode_pen(robot["pen"]),
+                            "last_pen_position": robot["last_pen_position"],
+                            "state": robot["state"],
+                            "devices": robot["devices"],
+                        }
+                        for robot in robots
+                    ]
+                )
+            ),
+            "config": np.array(json.dumps(self.to_json())),
+        }
+        if snapshot["ground"] is not None:
+            x, y, pixels = snapshot["ground"]
+            arrays["ground_offset"] = np.array([x, y])
+            arrays["ground"] = pixels
+        np.savez_compressed(filename, **arrays)
+
+    def load_snapshot(self, filename):
+        """
+        Restore the world to a snapshot saved with world.save_snapshot().
+        The world must have the same robots and devices as when the
+        snapshot was taken; World(**json.loads(str(np.load(filename)["config"])))
+        makes such a world.
+
+        Args:
+            * filename: (str) the name of the file
+        """
+        import numpy as np
+
+        if not filename.endswith(".npz"):
+            filename = filename + ".npz"
+        with np.load(filename) as data:
+            if int(data["version"]) != SNAPSHOT_VERSION:
+                raise ValueError(
+                    "unknown snapshot version: %s" % int(data["version"])
+                )
+            traces = data["traces"].tolist()
+            robots = []
+            start = 0
+            for pose, length, robot in zip(
+                data["poses"].tolist(),
+                data["trace_lengths"].tolist(),
+                json.loads(str(data["robots"])),
+            ):
+                last_pen_position = robot["last_pen_position"]
+                robots.append(
+                    {
+                        "pose": tuple(pose),
+                        "trace": [
+                            (Point(x, y), direction)
+                            for x, y, direction in traces[start : start + length]
+                        ],
+                        "text_trace": [tuple(item) for item in robot["text_trace"]],
+                        "pen_trace": [
+                            (time, decode_pen(pen)) for time, pen in robot["pen_trace"]
+                        ],
+                        "pen": decode_pen(robot["pen"]),
+                        "last_pen_position": tuple(last_pen_position)
+                        if last_pen_position is not None
+                        else None,
+                        "state": robot["state"],
+                        "devices": robot["devices"],
+                    }
+                )
+                start += length
+            random_gauss = float(data["random_gauss"])
+            ground = None
+            if "ground" in data.files:
+                x, y = data["ground_offset"].tolist()
+                ground = (x, y, data["ground"])
+            snapshot = {
+                "time": float(data["time"]),
+                "random": (
+                    int(data["random_version"]),
+                    tuple(data["random_state"].tolist()),
+                    random_gauss if not math.isnan(random_gauss) else None,
+                ),
+                "ground": ground,
+                "robots": robots,
+            }
+        self.set_snapshot(snapshot)
+
     def set_ground_image(self, filename, show=True):
         """
         Set the background image
         """
         self.ground_image_filename = filename
+        self._settings_changed()
         self.reset_ground_image()
         if show:
             self.update(show=False)
@@ -503,16 +836,136 @@ class World:
         Reset the ground image, in case it changed.
         """
         if self.ground_image_filename is not None:
-            self.ground_image = load_image(
-                self.ground_image_filename,
-                round(self.width * self.scale),
-                round(self.height * self.scale),
+            self.set_ground_array(
+                load_image_array(
+                    self.ground_image_filename,
+                    round(self.width * self.scale),
+                    round(self.height * self.scale),
+                )
             )
         else:
-            self.ground_image = None
+            self.set_ground_array(None)
+
+    def _restore_ground_region(self):
+        """
+        Put back the original pixels of the ground image, where it has
+        been changed since it was loaded.
+        """
+        if self._ground_modified is None or self.ground_image_filename is None:
+            return
+        self._own_ground_array()
+        x1, y1, x2, y2 = self._ground_modified
+        self.ground_array[y1:y2, x1:x2] = load_image_array(
+            self.ground_image_filename,
+            round(self.width * self.scale),
+            round(self.height * self.scale),
+            self._ground_modified,
+        )
+        self._mark_ground_dirty(x1, y1, x2, y2)
+        self._ground_modified = None
+
+    def set_ground_array(self, array):
+        """
+        Set the ground from an array of RGB or RGBA pixels, of size
+        (height * scale, width * scale). The array may be memory-mapped;
+        see utils.load_image_array().
+
+        Args:
+            * array: (numpy.ndarray) the pixels of the ground, or None
+        """
+        self.ground_array = array
+        self._ground_copy_on_write = False
+        self._ground_image = None
+        self._ground_shared = False
+        self._ground_pixels = None
+        self._ground_dirty = None
+        self._ground_version = next(GROUND_VERSIONS)
+        # Region changed since loaded, for snapshots:
+        self._ground_modified = None
+
+    @property
+    def ground_image(self):
+        """
+        The ground as a PIL image, or None. The ground is kept in
+        ground_array; the image is made on first use and brought up
+        to date when needed.
+        """
+        if self._ground_image is None and self.ground_array is not None:
+            from PIL import Image
+
+            # RGBA images share the array's memory, rather than copy it:
+            self._ground_image = Image.fromarray(self.ground_array)
+            self._ground_shared = bool(self._ground_image.readonly)
+            self._ground_dirty = None
+        elif self._ground_dirty is not None:
+            self._sync_ground_image()
+        return self._ground_image
+
+    @ground_image.setter
+    def ground_image(self, image):
+        if image is None:
+            self.set_ground_array(None)
+        else:
+            import numpy as np
 
-        if self.ground_image is not None:
-            self.ground_image_pixels = self.ground_image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            self.set_ground_array(np.array(image))
+        self._ground_image = image
+
+    @property
+    def ground_image_pixels(self):
+        """
+        PixelAccess of the ground image, for reading.
+        """
+        if self._ground_pixels is None or self._ground_dirty is not None:
+            image = self.ground_image
+            self._ground_pixels = image.load() if image is not None else None
+        return self._ground_pixels
+
+    def _own_ground_array(self):
+        """
+        Make a private copy of the ground array before writing to it,
+        if it is shared with a clone.
+        """
+        if not self._ground_copy_on_write:
+            return
+        import numpy as np
+
+        array = self.ground_array
+        if isinstance(array, np.memmap) and array.filename is not None:
+            # Map the file again; pages are copied as they are written:
+            self.ground_array = np.load(array.filename, mmap_mode="c")
+            if self._ground_modified is not None:
+                x1, y1, x2, y2 = self._ground_modified
+                self.ground_array[y1:y2, x1:x2] = array[y1:y2, x1:x2]
+        else:
+            self.ground_array = np.array(array)
+        self._ground_copy_on_write = False
+        self._ground_image = None
+        self._ground_pixels = None
+        self._ground_dirty = None
+
+    def _mark_ground_dirty(self, x1, y1, x2, y2):
+        self._ground_version = next(GROUND_VERSIONS)
+        self._ground_dirty = union_box(self._ground_dirty, (x1, y1, x2, y2))
+        self._ground_modified = union_box(self._ground_modified, (x1, y1, x2, y2))
+
+    def _sync_ground_image(self):
+        """
+        Copy the changed region of ground_array into the ground image.
+        """
+        from PIL import Image
+
+        x1, y1, x2, y2 = self._ground_dirty
+        self._ground_dirty = None
+        self._ground_pixels = None
+        # A shared image is already up to date, until it is written to:
+        if self._ground_shared and self._ground_image.readonly:
+            return
+        self._ground_image.paste(
+            Image.fromarray(self.ground_array[y1:y2, x1:x2]), (x1, y1)
+        )
 
     def paste_ground_image(self, image, x, y):
         """
@@ -524,8 +977,24 @@ class World:
             * x: (int) the x coordinate of upper lefthand corner
             * y: (int) the y coordinate of upper lefthand corner
         """
-        if self.ground_image:
-            self.ground_image.paste(image, (x, y))
+        import numpy as np
+
+        if self.ground_array is not None:
+            self._own_ground_array()
+            ground_image = self.ground_image
+            ground_image.paste(image, (x, y))
+            self._ground_version = next(GROUND_VERSIONS)
+            height, width = self.ground_array.shape[:2]
+            x1, y1 = max(x, 0), max(y, 0)
+            x2, y2 = min(x + image.width, width), min(y + image.height, height)
+            if x1 < x2 and y1 < y2:
+                self.ground_array[y1:y2, x1:x2] = np.asarray(
+                    ground_image.crop((x1, y1, x2, y2))
+                )
+                self._ground_modified = union_box(
+                    self._ground_modified, (x1, y1, x2, y2)
+                )
+            self._ground_pixels = None
 
     def set_ground_color_at(self, x, y, pen):
         """
@@ -537,13 +1006,66 @@ class World:
             * y: (int) the y coordinate
             * pen: (tuple) the (color, radius) to draw with
         """
-        if self.ground_image:
-            color, radius = pen
-            for i in range(-radius, radius + 1, 1):
-                for j in range(-radius, radius + 1, 1):
-                    self.ground_image_pixels[
-                        ((x * self.scale) + i, (y * self.scale) + j)
-                    ] = color.to_tuple()
+        self.set_ground_color_along(x, y, x, y, pen)
+
+    def set_ground_color_along(self, x1, y1, x2, y2, pen):
+        """
+        Set the pixels of the ground image along the line from (x1,y1)
+        to (x2,y2), as if the pen had been stamped at every pixel along
+        the way. Requires a ground image to have already been set.
+
+        Args:
+            * x1: (number) the x coordinate of the start
+            * y1: (number) the y coordinate of the start
+            * x2: (number) the x coordinate of the end
+            * y2: (number) the y coordinate of the end
+            * pen: (tuple) the (color, radius) to draw with
+        """
+        import numpy as np
+
+        if self.ground_array is None:
+            return
+
+        self._own_ground_array()
+        color, radius = pen
+        height, width, depth = self.ground_array.shape
+        value = np.array(color.to_tuple()[:depth], dtype=self.ground_array.dtype)
+        px1, py1 = x1 * self.scale, y1 * self.scale
+        px2, py2 = x2 * self.scale, y2 * self.scale
+        count = int(max(abs(px2 - px1), abs(py2 - py1)))
+        # The pixels the (2 * radius + 1) square pen is centered on:
+        t = np.arange(count + 1) / count if count > 0 else np.zeros(1)
+        xs = (px1 + (px2 - px1) * t).astype(int)
+        ys = (py1 + (py2 - py1) * t).astype(int)
+        # The stamps go in a straight line, so the ends bound them:
+        xmin, xmax = sorted((int(xs[0]), int(xs[-1])))
+        ymin, ymax = sorted((int(ys[0]), int(ys[-1])))
+        if (
+            min(xmin, ymin) - radius < 0
+            or xmax + radius >= width
+            or ymax + radius >= height
+        ):
+            # Leave out the stamps entirely off the ground:
+            on = (
+                (xs + radius >= 0)
+                & (xs - radius < width)
+                & (ys + radius >= 0)
+                & (ys - radius < height)
+            )
+            if not on.any():
+                return
+            xs, ys = xs[on], ys[on]
+            xmin, xmax = int(xs.min()), int(xs.max())
+            ymin, ymax = int(ys.min()), int(ys.max())
+        left, right = max(xmin - radius, 0), min(xmax + radius + 1, width)
+        upper, lower = max(ymin - radius, 0), min(ymax + radius + 1, height)
+        # Every pixel of every stamp, with the parts off the ground
+        # moved onto its edge, which the stamp covers too:
+        offsets = np.arange(-radius, radius + 1)
+        xs = (xs[:, np.newaxis] + offsets).clip(left, right - 1)
+        ys = (ys[:, np.newaxis] + offsets).clip(upper, lower - 1)
+        self.ground_array[ys[:, :, np.newaxis], xs[:, np.newaxis, :]] = value
+        self._mark_ground_dirty(left, upper, right, lower)
 
     def get_ground_color_at(self, x, y, radius=1):
         """
@@ -555,14 +1077,16 @@ class World:
             * y: (int) the y coordinate
             * radius: (int) size of area
         """
-        if self.ground_image:
+        if self.ground_array is not None:
             results = []
             for i in range(-radius, radius + 1, 1):
                 for j in range(-radius, radius + 1, 1):
                     results.append(
-                        self.ground_image_pixels[
-                            ((x + i) * self.scale, (y + j) * self.scale)
-                        ]
+                        tuple(
+                            self.ground_array[
+                                int((y + j) * self.scale), int((x + i) * self.scale)
+                            ].tolist()
+                        )
                     )
             return results
 
@@ -571,6 +1095,7 @@ class World:
         Change the scale of the rendered world.
         """
         self.scale = scale
+        self._settings_changed()
         self.backend.update_dimensions(self.width, self.height, self.scale)
         # Save with config
         self.config["scale"] = self.scale
@@ -582,6 +1107,30 @@ class World:
         self.update()
         return self.backend.watch()
 
+    def start_render_worker(self):
+        """
+        Draw the world in a background thread. The simulation hands the
+        render thread snapshots of the robots, and frames that can't be
+        drawn in time are dropped. This lets world.steps(real_time=False,
+        show=True) run at full speed while the display shows the latest
+        state.
+        """
+        from .render import RenderWorker
+
+        if self.render_worker is None:
+            self.render_worker = RenderWorker(self)
+            self.render_worker.start()
+        return self.render_worker
+
+    def stop_render_worker(self):
+        """
+        Stop drawing in the background, and go back to drawing in the
+        simulation loop.
+        """
+        if self.render_worker is not None:
+            self.render_worker.stop()
+            self.render_worker = None
+
     def record(self):
         from .watchers import Recorder
 
@@ -625,6 +1174,7 @@ class World:
 
     def add_bulb(self, bulb):
         self.bulbs.append(bulb)
+        self._settings_changed()
         self.update()  # request draw
 
     def add_wall(self, color, x1, y1, x2, y2):
@@ -640,7 +1190,8 @@ class World:
             Color(color), None, Line(p1, p2), Line(p2, p3), Line(p3, p4), Line(p4, p1)
         )
         self.walls.append(wall)
-        self.complexity = self.compute_complexity()
+        self._walls_changed()
+        self._update_complexity()
         self.update()  # request draw
 
     def del_robot(self, robot):
@@ -656,7 +1207,8 @@ class World:
         if robot in self._robots:
             robot.world = None
             self._robots.remove(robot)
-        self.complexity = self.compute_complexity()
+        self._settings_changed()
+        self._update_complexity()
         self.update()  # request draw
 
     def _find_random_pose(self, robot):
@@ -701,7 +1253,9 @@ class World:
                 print("WARNING: adding a robot with no body")
             wall = Wall(robot.color, robot, *robot.bounding_lines)
             self.walls.append(wall)
-            self.complexity = self.compute_complexity()
+            self._settings_changed()
+            robot.init_boundingbox()
+            self._update_complexity()
             self.update()
             self.save()
         else:
@@ -828,6 +1382,8 @@ class World:
                 if self.stop:
                     break
                 if function is not None:
+                    if self.profiler is not None:
+                        start = time.perf_counter()
                     if isinstance(function, (list, tuple)):
                         # Deterministically run robots round-robin:
                         stop = any(
@@ -839,6 +1395,8 @@ class World:
                         )
                     else:
                         stop = function(self)
+                    if self.profiler is not None:
+                        self.profiler.add("controllers", time.perf_counter() - start)
                     if stop:
                         break
                 self.step(time_step, show=show, real_time=real_time)
@@ -854,10 +1412,267 @@ class World:
         if show:
             self.draw()  # force to update any displays
 
+    def _walls_changed(self):
+        """
+        Note that the static walls (those that aren't robots) changed.
+        """
+        self._walls_version = next(WALLS_VERSIONS)
+
+    def set_distance_field(self, resolution=5.0, max_distance=200.0):
+        """
+        Set the grid used to find how far points are from the static
+        walls (see world.get_clearance()). The grid is computed when it
+        is first used, and again when the static walls change.
+
+        Args:
+            * resolution: (number) the size of a grid cell, in CM; use
+                None to not keep a grid
+            * max_distance: (number) how far out to compute distances, in CM
+        """
+        if resolution is None:
+            self.distance_field = None
+        else:
+            self.distance_field = DistanceField(resolution, max_distance)
+
+    def get_distance_field(self):
+        """
+        Get the world's DistanceField, up to date with its static
+        walls, or None.
+        """
+        field = self.distance_field
+        if field is not None:
+            version = (self._walls_version, self.width, self.height)
+            if field.version != version:
+                field.build(self.walls, self.width, self.height, version)
+        return field
+
+    def set_light_field(self, resolution=2.0):
+        """
+        Set the grid used to find which cells the bulbs' light reaches
+        past the static walls (see LightSensor). A bulb's grid is
+        computed when it is first used, and again when the static
+        walls change. There is no grid until this is called.
+
+        Args:
+            * resolution: (number) the size of a grid cell, in CM; None
+                to cast a ray to every bulb instead
+        """
+        if resolution is None:
+            self.light_field = None
+        else:
+            self.light_field = LightField(resolution)
+
+    def get_light_field(self):
+        """
+        Get the world's LightField, up to date with its static walls
+        and bulbs, or None if there isn't one.
+        """
+        field = self.light_field
+        if field is not None:
+            version = (self._walls_version, self.width, self.height)
+            field.update(self.walls, self.bulbs, self.width, self.height, version)
+        return field
+
+    def set_ray_engine(self, engine="exact", resolution=1.0):
+        """
+        Choose how robots cast rays (see robot.cast_ray()).
+
+        Args:
+            * engine: (str) "exact" to intersect every wall's lines,
+                "grid" to only intersect the walls in the cells of an
+                OccupancyGrid that a ray passes through, or "panorama"
+                to only intersect the walls in the direction of a ray
+                from around each robot (see robot.get_panorama()); the
+                last two are much faster in worlds with many walls
+            * resolution: (number) the size of a grid cell, in CM, or
+                of a slice of directions of a Panorama, in degrees
+        """
+        if engine == "exact":
+            self.occupancy_grid = None
+            self.panorama_resolution = None
+        elif engine == "grid":
+            self.occupancy_grid = OccupancyGrid(resolution)
+            self.panorama_resolution = None
+        elif engine == "panorama":
+            self.occupancy_grid = None
+            self.panorama_resolution = resolution
+        else:
+            raise ValueError("unknown ray engine: %r" % engine)
+
+    def get_occupancy_grid(self):
+        """
+        Get the world's OccupancyGrid, up to date with its static
+        walls, or None if rays are cast exactly.
+        """
+        grid = self.occupancy_grid
+        if grid is not None:
+            version = (self._walls_version, self.width, self.height)
+            if grid.version != version:
+                grid.build(self.walls, self.width, self.height, version)
+        return grid
+
+    def set_depth_table(self, table):
+        """
+        Look up what rays hit in a DepthTable baked from this world
+        (see bake.bake_world()), rather than intersecting the static
+        walls. Robots are still intersected exactly, and so are the
+        walls that a ray passes on the way to what the table sees.
+
+        Args:
+            * table: (DepthTable or str) the table, or the directory it
+                was saved in; None to stop using it
+        """
+        from .bake import DepthTable, get_walls_key
+
+        if isinstance(table, str):
+            table = DepthTable(table)
+        if table is not None:
+            if table.key != get_walls_key(self.walls, self.width, self.height):
+                raise ValueError("%r was baked from different walls" % table)
+            table.version = None
+        self.depth_table = table
+
+    def get_depth_table(self):
+        """
+        Get the world's DepthTable, or None if there isn't one or the
+        static walls have changed since it was baked.
+        """
+        table = self.depth_table
+        if table is None:
+            return None
+        if table.version != self._walls_version:
+            from .bake import get_walls_key
+
+            if table.key == get_walls_key(self.walls, self.width, self.height):
+                table.bind(self.walls, self.width, self.height, self._walls_version)
+            else:
+                table.static_walls = None
+                table.version = self._walls_version
+        return table if table.static_walls is not None else None
+
+    def get_clearance(self, x, y, robot=None):
+        """
+        Get a distance from a point that a ray can travel in any
+        direction without hitting a wall or another robot. This is never
+        more than the true distance, and is 0 if there is no distance
+        field.
+
+        Args:
+            * x: (number) the x coordinate, in CM
+            * y: (number) the y coordinate, in CM
+            * robot: (Robot) a robot to ignore, like the one casting rays
+        """
+        field = self.get_distance_field()
+        if field is None:
+            return 0.0
+        clearance = field.get_clearance(x, y)
+        for other in self._robots:
+            if other is robot:
+                continue
+            if len(other.boundingbox) == 0:
+                return float("-inf")
+            min_x, min_y, max_x, max_y = other.boundingbox
+            radius = math.hypot(max(-min_x, max_x), max(-min_y, max_y))
+            clearance = min(
+                clearance,
+                distance(x, y, other.x, other.y) - radius - HIT_TOLERANCE,
+            )
+        return clearance
+
+    def get_clear_distance(self, x, y, a, max_range, robot=None):
+        """
+        Step along a ray by the clearance at each point (sphere
+        tracing) to find how far it surely goes without hitting
+        anything. Returns max_range if nothing can be hit within it.
+
+        Args:
+            * x: (number) the x coordinate of the start, in CM
+            * y: (number) the y coordinate of the start, in CM
+            * a: (number) the direction of the ray, as in robot.cast_ray()
+            * max_range: (number) the length of the ray, in CM
+            * robot: (Robot) a robot to ignore, like the one casting the ray
+        """
+        field = self.get_distance_field()
+        if field is None:
+            return 0.0
+        dx, dy = math.sin(a), math.cos(a)
+        travelled = 0.0
+        while True:
+            clearance = self.get_clearance(
+                x + dx * travelled, y + dy * travelled, robot
+            )
+            if clearance >= max_range - travelled:
+                return max_range
+            if clearance < field.resolution / 2:
+                return travelled
+            travelled += clearance
+
     def compute_complexity(self):
         # Proxy for how much drawing
         return sum([len(wall.lines) for wall in self.walls])
 
+    def _update_complexity(self):
+        if self._batch_depth > 0:
+            self._batch_pending["complexity"] = True
+        else:
+            self.complexity = self.compute_complexity()
+
+    @contextmanager
+    def batch(self, show=True):
+        """
+        Make many changes to the world at once. Inside the with-block,
+        computing the complexity, updating, saving, and drawing are put
+        off until the end of the block, and then done only once.
+
+        Args:
+            * show: (bool) if False, don't draw at the end
+
+        Example:
+            with world.batch():
+                for x in range(10, 490, 10):
+                    world.add_wall("blue", x, 10, x + 5, 15)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+        if self._batch_depth == 0:
+            pending = self._batch_pending
+            self._batch_pending = {}
+            if pending.get("complexity"):
+                self.complexity = self.compute_complexity()
+            if "update" in pending:
+                self.update(show=pending["update"] and show)
+            if pending.get("save"):
+                self.save()
+            if pending.get("draw") and show:
+                self.draw()
+
+    @contextmanager
+    def profile(self):
+        """
+        Time the phases of each step of the world, for each robot and
+        device, and count the rays cast, in the with-block. Yields the
+        Profiler; print it, or see profiler.get_report(). Profiling
+        costs a little time of its own, so compare phases with each
+        other rather than with unprofiled runs.
+
+        Example:
+            with world.profile() as profiler:
+                world.steps(100, show=False)
+            print(profiler)
+        """
+        profiler = Profiler()
+        previous = self.profiler
+        self.profiler = profiler
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            self.profiler = previous
+
     def step(self, time_step=None, show=True, real_time=True):
         """
         Run the simulator for 1 step.
@@ -868,6 +1683,16 @@ class World:
             * real_time: (bool) if True, run in real time, even introducing a
                 delay if necessary
         """
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+            self._step(time_step, show, real_time)
+            profiler.steps += 1
+            profiler.add("step", time.perf_counter() - start)
+        else:
+            self._step(time_step, show, real_time)
+
+    def _step(self, time_step, show, real_time):
         if time_step is not None and not isinstance(time_step, Number):
             raise ValueError(
                 "Invalid time_step: %r; should be a number or None" % time_step
@@ -881,7 +1706,7 @@ class World:
         # So as not to overwhelm the system. We give 0.1 time
         # per robot. This can be optimized to reduce the load.
 
-        if self.backend.is_async():
+        if self.backend is not None and self.backend.is_async():
             self.throttle_period = self.backend.get_dynamic_throttle(self)
 
         time_step = time_step if time_step is not None else self.time_step
@@ -891,7 +1716,12 @@ class World:
         self.time += time_step
         self.time = round(self.time, self.time_decimal_places)
         self.update(show)
-        self.update_watchers()
+        if self.profiler is not None:
+            start = time.perf_counter()
+            self.update_watchers()
+            self.profiler.add("watchers", time.perf_counter() - start)
+        else:
+            self.update_watchers()
         if show:
             now = time.monotonic()
             time_passed = now - start_time
@@ -903,7 +1733,9 @@ class World:
                     # Sleep even more for slow-motion:
                     time.sleep(sleep_time)
                 # else it is already running slower than real time
-            elif not self.backend.is_async():
+            elif self.render_worker is None and not (
+                self.backend is not None and self.backend.is_async()
+            ):
                 # Goal is to keep time_passed less than % of throttle period:
                 if time_passed > self.throttle_period * self.show_throttle_percentage:
                     self.throttle_period += time_step
@@ -913,6 +1745,9 @@ class World:
         Update the world, robots, and devices. Optionally, draw the
         world.
         """
+        if self._batch_depth > 0:
+            self._batch_pending["update"] = self._batch_pending.get("update") or show
+            return
         ## Update robots:
         self.draw_list = []
         for robot in self._robots:
@@ -922,8 +1757,13 @@ class World:
 
     def request_draw(self):
         """
-        Draw the world. This function is throttled
+        Draw the world. This function is throttled, unless
+        drawing is done by the render worker.
         """
+        if self.render_worker is not None:
+            self.render_worker.submit(self)
+            return
+
         # Throttle:
         now = time.monotonic()
         time_since_last_call = now - self.time_of_last_call
@@ -940,12 +1780,29 @@ class World:
         """
         if self.backend is None:
             return
+        if self._batch_depth > 0:
+            self._batch_pending["draw"] = True
+            return
 
+        if self.profiler is not None:
+            start = time.perf_counter()
+        if self.render_worker is not None:
+            # Don't draw at the same time as the render worker:
+            with self.render_worker.lock:
+                self._draw()
+        else:
+            self._draw()
+        if self.profiler is not None:
+            self.profiler.add("draw", time.perf_counter() - start)
+
+    def _draw(self):
         with self.backend:
             self.backend.clear()
             self.backend.noStroke()
             if self.ground_image is not None:
-                self.backend.draw_image(self.ground_image, 0, 0)
+                self.backend.draw_image(
+                    self.ground_image, 0, 0, self._ground_version
+                )
             else:
                 self.backend.set_fill(self.ground_color)
                 self.backend.draw_rect(0, 0, self.width, self.height)
@@ -49,7 +49,7 @@ setup_args = dict(
     long_description_content_type="text/markdown",
     packages=setuptools.find_packages(),
     package_data={"jyrobot": ["worlds/*.json", "worlds/*.png"]},
-    install_requires=["Pillow"],
+    install_requires=["Pillow", "numpy"],
     extras_require={"jupyter": ["ipywidgets", "IPython", "bqplot"],},
     python_requires=">=3.6",
     license="BSD-3-Clause",
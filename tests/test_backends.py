@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import math
+
+import numpy as np
+
+import jyrobot
+from jyrobot.backends.pil import PILBackend
+from jyrobot.backends.record import RecordingBackend
+from jyrobot.backends.svg import SVGBackend
+from jyrobot.utils import Color
+
+
+def test_pil_transform():
+    backend = PILBackend(100, 50, 2.0)
+
+    assert backend.p(10, 5) == (20, 10)
+
+    backend.pushMatrix()
+    backend.translate(10, 20)
+    backend.rotate(math.pi / 2)
+    x, y = backend.p(1, 0)
+    assert round(x, 6) == 20 and round(y, 6) == 42
+
+    points = backend.transform_points([(1, 0), (0, 1)])
+    assert [round(v, 6) for v in points] == [20, 42, 18, 40]
+    backend.popMatrix()
+
+    assert backend.p(10, 5) == (20, 10)
+
+
+def test_pil_draw_lines():
+    backend = PILBackend(20, 20, 1.0)
+    backend.lineWidth(1)
+    backend.draw_lines(
+        np.array([[0, 0], [10, 0], [10, 10]]), stroke_style=Color("white")
+    )
+
+    # The last segment is drawn, too:
+    assert backend.image.getpixel((10, 8)) == (255, 255, 255)
+
+
+def test_svg_draw_lines():
+    backend = SVGBackend(20, 20, 1.0)
+    backend.set_fill_style(Color("black"))
+    backend.draw_lines(np.array([[0, 0], [10, 0], [10, 10]]), Color("white"))
+
+    assert 'points="0.0,0.0 10.0,0.0 10.0,10.0"' in backend.stack[0].tostring()
+
+
+def test_record_replay():
+    backend = RecordingBackend(100, 50, 2.0)
+    with backend:
+        backend.set_fill(Color("white"))
+        backend.draw_rect(10, 10, 20, 20)
+        backend.draw_lines(np.array([[0, 0], [50, 25]]), Color("red"))
+        backend.draw_polygon([(60, 5), (90, 5), (75, 40)])
+        backend.text("00:00:00.0", 5, 5)
+
+    assert len(backend.display_list) == 1
+
+    picture = backend.display_list.take_picture()
+    assert picture.size == (200, 100)
+    assert picture.getpixel((40, 40)) == (255, 255, 255)
+    assert picture.getpixel((150, 30)) == (255, 255, 255)  # the polygon
+
+    target = PILBackend(100, 50, 2.0)
+    backend.display_list.replay(target)
+    assert target.image.tobytes() == picture.tobytes()
+
+
+def test_record_ground_versions():
+    world = jyrobot.load_world("soccer")
+    world.backend = RecordingBackend(world.width, world.height, world.scale)
+    world.draw()
+    world.draw()
+    display_list = world.backend.display_list
+    assert len(display_list.images) == 1  # the same version is kept once
+
+    first = display_list.take_picture(frame=0)
+    world.set_ground_color_along(10, 10, 200, 100, (Color("red"), 3))
+    world.draw()
+
+    assert len(display_list.images) == 2
+    assert display_list.take_picture(frame=0).tobytes() == first.tobytes()
+    assert display_list.take_picture().tobytes() != first.tobytes()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import math
+
+import numpy as np
+import pytest
+
+import jyrobot
+from jyrobot.bake import bake_world
+
+
+def test_bake_world(tmp_path):
+    world = jyrobot.load_world("two-scribblers")
+    table = bake_world(world, str(tmp_path / "one"), 10.0, 90, processes=1)
+    other = bake_world(world, str(tmp_path / "two"), 10.0, 90, processes=2)
+    assert np.array_equal(table.walls, other.walls)
+
+    def get_hits():
+        hits = []
+        for robot in world.robots:
+            for device in robot._devices:
+                if isinstance(device, jyrobot.RangeSensor):
+                    device.update()
+                    hits.append(device.get_distance())
+            camera = robot["camera"]
+            camera._update()
+            for column in camera.hits:
+                hits.append([(hit.x, hit.y, hit.robot) for hit in column[-1:]])
+        return hits
+
+    exact = get_hits()
+    world.set_depth_table(str(tmp_path / "one"))
+    assert get_hits() == exact
+
+    world.add_wall("red", 10, 10, 20, 20)
+    assert world.get_depth_table() is None
+    with pytest.raises(ValueError):
+        world.set_depth_table(table)
+
+
+def test_depth_table_thin_wall(tmp_path):
+    world = jyrobot.World(width=300, height=300, boundary_wall=False, quiet=True)
+    world.add_wall("blue", 150, 150, 151, 150.5)  # between the table's rays
+    world.add_robot(jyrobot.Scribbler(x=20, y=20, a=0))
+    robot = world.robots[0]
+    table = bake_world(world, str(tmp_path / "table"), 10.0, 90, processes=1)
+    a = math.atan2(150.5 - 20, 150.2 - 20)
+    assert table.find_walls(20, 20, a) == {-1}
+
+    exact = [(hit.x, hit.y) for hit in robot.cast_ray(20, 20, a, 300)]
+    world.set_depth_table(table)
+    assert [(hit.x, hit.y) for hit in robot.cast_ray(20, 20, a, 300)] == exact
+    assert len(exact) == 2
+
+
+def test_depth_table_parallax(tmp_path):
+    # Boxes that the poses around a ray can see past, around their ends:
+    rng = np.random.RandomState(1)
+    world = jyrobot.World(width=150, height=150, quiet=True)
+    for x, y, w, h in rng.uniform([5, 5, 1, 1], [135, 135, 12, 12], (30, 4)):
+        world.add_wall("blue", x, y, x + w, y + h)
+    world.add_robot(jyrobot.Scribbler(x=2, y=2, a=0))
+    robot = world.robots[0]
+    table = bake_world(world, str(tmp_path / "table"), 10.0, 90, processes=1)
+    rays = rng.uniform([1, 1, 0], [149, 149, 2 * math.pi], (1000, 3))
+
+    def get_hits():
+        return [
+            [(hit.x, hit.y) for hit in robot.cast_ray(x, y, a, 150)[-1:]]
+            for x, y, a in rays
+        ]
+
+    exact = get_hits()
+    world.set_depth_table(table)
+    assert get_hits() == exact
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+from jyrobot import config
+from jyrobot.datasets import utils
+from jyrobot.datasets.utils import get_file, load_atlas
+
+
+def test_get_file_extracts_once(tmp_path, monkeypatch):
+    archive = tmp_path / "images.zip"
+    with zipfile.ZipFile(archive, "w") as fp:
+        fp.writestr("images/a.png", b"a")
+        fp.writestr("images/b.png", b"b")
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+
+    filename = get_file(
+        "images.zip", archive.as_uri(), extract=True, cache_dir=str(cache_dir)
+    )
+
+    assert (cache_dir / "datasets" / "images" / "b.png").read_bytes() == b"b"
+    assert (cache_dir / "datasets" / "images.zip.manifest.json").exists()
+
+    def extract(*args):
+        raise AssertionError("extracted again")
+
+    monkeypatch.setattr(utils, "_extract_archive", extract)
+    assert (
+        get_file("images.zip", "unused", extract=True, cache_dir=str(cache_dir))
+        == filename
+    )
+
+
+def test_extract_replaces_directories_last(tmp_path, monkeypatch):
+    path = tmp_path / "datasets"
+    path.mkdir()
+    (path / "images").mkdir()
+    (path / "images" / "old.png").write_bytes(b"old")
+    archive = tmp_path / "images.zip"
+    with zipfile.ZipFile(archive, "w") as fp:
+        fp.writestr("images/a.png", b"a")
+
+    removed = []
+    rmtree = utils.shutil.rmtree
+
+    def record_rmtree(target, *args, **kwargs):
+        # The old directory is only deleted once the new one is there:
+        removed.append((target, (path / "images" / "a.png").exists()))
+        rmtree(target, *args, **kwargs)
+
+    monkeypatch.setattr(utils.shutil, "rmtree", record_rmtree)
+    utils._extract_archive_once(str(archive), str(path))
+
+    assert all(ready for target, ready in removed)
+    assert sorted(name.name for name in path.iterdir()) == ["images"]
+    assert [name.name for name in (path / "images").iterdir()] == ["a.png"]
+
+
+def test_load_atlas(tmp_path):
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / ("obj1__%s.png" % i))
+        Image.new("RGB", (8, 6), (i, 0, 0)).save(filename)
+        filenames.append(filename)
+    config.set_jyrobot_cache_dir(str(tmp_path / "cache"))
+    try:
+        atlas = load_atlas("test-obj1", filenames)
+    finally:
+        config.set_jyrobot_cache_dir(None)
+        utils.ATLASES.clear()
+
+    assert isinstance(atlas, np.memmap)
+    assert atlas.shape == (3, 6, 8, 4)
+    assert atlas[2, 0, 0].tolist() == [2, 0, 0, 255]
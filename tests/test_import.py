@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# *************************************
+# jyrobot: Python robot simulator
+#
+# Copyright (c) 2020 Calysto Developers
+#
+# https://github.com/Calysto/jyrobot
+#
+# *************************************
+
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import jyrobot
+import_seconds = time.perf_counter() - start
+modules = sorted(sys.modules)
+start = time.perf_counter()
+world = jyrobot.World(quiet=True)
+world_seconds = time.perf_counter() - start
+world_modules = sorted(sys.modules)
+start = time.perf_counter()
+import numpy
+numpy_seconds = time.perf_counter() - start
+results = [import_seconds, modules, world_seconds, world_modules, numpy_seconds]
+print(json.dumps(results))
+"""
+
+
+def test_import_time(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path), JYROBOT_BACKEND="pil")
+    env.pop("JYROBOT_CACHE", None)
+    output = subprocess.check_output(
+        [sys.executable, "-c", SCRIPT],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        universal_newlines=True,
+    )
+    results = json.loads(output.split("\n")[-2])
+    import_seconds, modules, world_seconds, world_modules, numpy_seconds = results
+    print(
+        "import jyrobot: %.3f seconds; World(): %.3f seconds; import numpy: %.3f"
+        % (import_seconds, world_seconds, numpy_seconds)
+    )
+
+    # Deferred until first used:
+    for module in ["PIL", "jyrobot.backends.pil", "jyrobot.datasets.utils"]:
+        assert module not in modules
+    for module in ["numpy", "jyrobot.world", "jyrobot.devices"]:
+        assert module not in modules
+    # An empty world doesn't need numpy, which is most of the import
+    # time of everything else:
+    assert "numpy" not in world_modules
+    assert import_seconds < numpy_seconds
+    assert os.listdir(str(tmp_path)) == []
@@ -8,6 +8,9 @@
 #
 # *************************************
 
+import numpy as np
+from PIL import Image
+
 import jyrobot
 from jyrobot import Color, Robot, Scribbler, World
 
@@ -77,3 +80,59 @@ def test_robot_pen():
     pixels = world.get_ground_color_at(x, y, 1)
     assert len(pixels) == 3 ** 2
     assert pixels == [Color("blue").to_tuple() for i in range(9)]
+
+
+def test_robot_pen_no_gaps():
+    world = jyrobot.load_world("soccer")
+    robot = world.robots[0]
+    robot.set_pose(100, 100, 0)
+    robot.pen_down("blue", 1)
+    world.step(real_time=False)
+
+    robot.x = 110  # jump ahead 10 CM in one step
+    world.update(show=False)
+
+    for x in range(100, 111):
+        assert world.get_ground_color_at(x, 100, 0) == [Color("blue").to_tuple()]
+
+
+def test_ground_camera():
+    world = jyrobot.load_world("soccer")
+    robot = world.robots[0]
+    camera = jyrobot.GroundCamera()
+    robot.add_device(camera)
+    robot.set_pose(100, 100, 45)
+    world.set_ground_color_at(100, 100, (Color("blue"), 2))
+
+    picture = camera.take_picture()
+    array = camera.take_picture(as_array=True)
+
+    assert picture.size == (14, 14)
+    assert array.shape[:2] == (14, 14)
+    assert picture.getpixel((7, 7))[:3] == (0, 0, 255)
+    assert (array == np.asarray(picture)).all()
+
+
+def test_camera_sprites():
+    world = World(width=200, height=200, quiet=True)
+    robot = Scribbler(x=20, y=100, a=0)
+    other = Scribbler(x=80, y=100, a=90)
+    other.image_data = ["test", 1]
+    sprite = np.zeros((128, 128, 4), dtype=np.uint8)
+    sprite[32:, 16:112] = (255, 0, 0, 255)
+    sprite[32:, 16:32] = (0, 0, 255, 100)
+    other.get_dataset_image = lambda index, degrees: Image.fromarray(sprite)
+    world.add_robot(robot)
+    world.add_robot(other)
+    camera = jyrobot.Camera()
+    robot.add_device(camera)
+
+    picture = camera.take_picture()
+    expected = Image.fromarray(np.zeros((128, 256, 4), dtype=np.uint8))
+    camera.show_obstacles(expected)  # pasted with PIL
+    array = np.zeros((128, 256, 4), dtype=np.uint8)
+    camera.show_obstacles(array)
+
+    assert (np.asarray(expected) == array).all()
+    assert (array[..., 0] == 255).any()
+    assert (np.asarray(picture)[..., :3] == (255, 0, 0)).all(axis=-1).any()
@@ -8,9 +8,23 @@
 #
 # *************************************
 
+import json
 import math
 
-from jyrobot.utils import arange, distance
+import numpy as np
+
+from jyrobot import config
+from jyrobot.catalog import Catalog
+from jyrobot.config import set_jyrobot_path
+from jyrobot.utils import (
+    IMAGE_CACHE,
+    LRUCache,
+    arange,
+    distance,
+    load_image,
+    load_image_array,
+    load_worlds,
+)
 
 
 def test_distance():
@@ -26,3 +40,72 @@ def test_arange():
 
 def test_arange_neg():
     assert [5, 4, 3, 2, 1] == [x for x in arange(5, 1, -1)]
+
+
+def test_lru_cache():
+    cache = LRUCache(3, len)
+    cache.put("a", "x")
+    cache.put("b", "yy")
+    assert cache.get("a") == "x"  # now most recently used
+
+    cache.put("c", "z")
+    assert "b" not in cache
+    assert cache.get("a") == "x"
+    assert cache.size == 2
+
+
+def test_load_image_cache():
+    IMAGE_CACHE.clear()
+    image1 = load_image("soccer-640x401.png", 320, 200)
+    image2 = load_image("soccer-640x401.png", 320, 200)
+
+    assert len(IMAGE_CACHE) == 1
+    assert image1 is not image2
+    assert image1.tobytes() == image2.tobytes()
+
+
+def test_load_image_array_mapped(tmp_path):
+    IMAGE_CACHE.clear()
+    threshold = config.get_mmap_threshold()
+    config.set_jyrobot_cache_dir(str(tmp_path))
+    config.set_mmap_threshold(0)
+    try:
+        array = load_image_array("soccer-640x401.png", 320, 200)
+    finally:
+        config.set_jyrobot_cache_dir(None)
+        config.set_mmap_threshold(threshold)
+
+    assert isinstance(array, np.memmap)
+    # The decoded image isn't kept in memory next to the mapped one:
+    assert len(IMAGE_CACHE) == 0
+    image = load_image("soccer-640x401.png", 320, 200).convert("RGBA")
+    assert np.array_equal(array, np.asarray(image))
+
+
+def test_catalog(tmp_path):
+    (tmp_path / "w1.json").write_text(json.dumps({"width": 100, "robots": []}))
+    catalog = Catalog(str(tmp_path))
+
+    assert catalog.find("w1.json").get_header() == {"width": 100, "robots": 0}
+    assert catalog.find("test1/w2.json") is None
+
+    (tmp_path / "test1").mkdir()
+    (tmp_path / "test1" / "w2.json").write_text("{}")
+
+    assert catalog.find("test1/w2.json").path == str(tmp_path / "test1" / "w2.json")
+    assert sorted(catalog.names("*.json")) == ["test1/w2.json", "w1.json"]
+
+
+def test_load_worlds(tmp_path):
+    for name in ["w1", "w2", "other"]:
+        (tmp_path / (name + ".json")).write_text(json.dumps({"width": 100}))
+    set_jyrobot_path(str(tmp_path))
+    try:
+        worlds = load_worlds("w*")
+    finally:
+        set_jyrobot_path(None)
+
+    assert [world.filename for world in worlds] == [
+        str(tmp_path / "w1.json"),
+        str(tmp_path / "w2.json"),
+    ]
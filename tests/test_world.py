@@ -8,8 +8,16 @@
 #
 # *************************************
 
+import random
+import time
+
+import numpy as np
+import pytest
+
 import jyrobot
-from jyrobot import World
+from jyrobot import Color, World, config
+from jyrobot.fields import LightField
+from jyrobot.world import Bulb
 
 
 def test_world():
@@ -30,3 +38,449 @@ def test_soccer_world():
     picture = robot["camera"].take_picture()
 
     assert picture.size == (256, 128)
+
+
+def test_camera_sees_ground():
+    world = jyrobot.load_world("soccer")
+    robot = world.robots[0]
+    camera = robot["camera"]
+    # Paint the ground just in front of the robot:
+    x, y = robot.rotate_around(robot.x, robot.y, 3, robot.direction)
+    world.set_ground_color_at(x, y, (jyrobot.Color("red"), 9))
+    picture = camera.take_picture()
+
+    assert picture.getpixel((128, 127)) == (255, 0, 0, 255)
+    assert picture.getpixel((128, 127)) not in [
+        picture.getpixel((128, 64)),
+        picture.getpixel((128, 0)),
+    ]
+
+
+def test_render_worker():
+    world = World(seed=42, quiet=True)
+    robot = jyrobot.Scribbler(x=100, y=100)
+    world.add_robot(robot)
+    robot.move(1, 0)
+
+    worker = world.start_render_worker()
+    world.steps(20, real_time=False, show=True, quiet=True, show_progress=False)
+    for i in range(100):
+        if worker.frames > 0:
+            break
+        time.sleep(0.02)
+    world.stop_render_worker()
+
+    assert worker.frames > 0
+    assert not worker.is_alive()
+    assert world.render_worker is None
+
+
+def test_render_worker_leaves_simulation_alone(monkeypatch):
+    backends = []
+
+    def make_backend(*args):
+        backends.append(args)
+        return jyrobot.backends.make_backend(*args)
+
+    monkeypatch.setattr(jyrobot.world, "make_backend", make_backend)
+
+    def run(worker):
+        world = World(seed=42, quiet=True)
+        world.add_robot(jyrobot.Scribbler(x=100, y=100))
+        world.set_ground_array(np.zeros((world.height, world.width, 4), np.uint8))
+        robot = world.robots[0]
+        robot.pen_down("red")
+        if worker:
+            world.start_render_worker()
+
+        def controller(world):
+            robot.move(random.random(), random.random() - 0.5)
+            # Let the render worker draw a frame, in the middle of it:
+            for i in range(100):
+                if not worker or world.time == 0 or world.render_worker.frames:
+                    break
+                time.sleep(0.01)
+
+        world.steps(30, controller, real_time=False, quiet=True, show_progress=False)
+        if worker:
+            shadow = world.render_worker.shadow
+            snapshot = world.render_worker.previous
+            world.stop_render_worker()
+            assert shadow.ground_array is None
+            assert shadow.backend is world.backend
+            # The snapshot has its own copy of the ground:
+            assert not np.shares_memory(np.asarray(snapshot[2]), world.ground_array)
+        return robot.get_pose()
+
+    assert run(True) == run(False)
+    assert len(backends) == 2  # one for each world, none for the shadow
+
+
+def test_memory_mapped_ground(tmp_path):
+    threshold = config.get_mmap_threshold()
+    config.set_jyrobot_cache_dir(str(tmp_path))
+    config.set_mmap_threshold(0)
+    try:
+        world1 = jyrobot.load_world("soccer")
+        world2 = jyrobot.load_world("soccer")
+    finally:
+        config.set_jyrobot_cache_dir(None)
+        config.set_mmap_threshold(threshold)
+
+    assert isinstance(world1.ground_array, np.memmap)
+    assert len(list(tmp_path.glob("images/*.npy"))) == 1
+
+    world1.set_ground_color_at(100, 100, (Color("blue"), 2))
+
+    assert world1.get_ground_color_at(100, 100, 0) == [Color("blue").to_tuple()]
+    assert world2.get_ground_color_at(100, 100, 0) != [Color("blue").to_tuple()]
+    # The image shares the array, so sees the pen:
+    x, y = 100 * world1.scale, 100 * world1.scale
+    assert world1.ground_image.getpixel((x, y)) == Color("blue").to_tuple()
+
+
+def test_ground_stroke_off_edge():
+    world = jyrobot.load_world("soccer")
+    red = [Color("red").to_tuple()]
+    world.set_ground_color_along(-50, 10, -10, 10, (Color("red"), 1))
+    assert world.get_ground_color_at(0, 10, 0) != red
+
+    world.set_ground_color_along(-20, 10, 10, 20, (Color("red"), 1))
+    assert world.get_ground_color_at(0, 16.7, 0) == red
+    assert world.get_ground_color_at(10, 20, 0) == red
+    assert world.get_ground_color_at(0, 20, 0) != red
+
+
+def test_snapshot(tmp_path):
+    world = jyrobot.load_world("soccer")
+    robot = world.robots[0]
+    robot.pen_down("blue", 2)
+    robot.move(1, 0.3)
+    world.steps(10, real_time=False, show=False, quiet=True, show_progress=False)
+    snapshot = world.get_snapshot()
+    world.save_snapshot(str(tmp_path / "snapshot"))
+
+    def run():
+        robot.move(random.random(), random.random())
+        world.steps(10, real_time=False, show=False, quiet=True, show_progress=False)
+        return (robot.get_pose(), len(robot.trace), world.time, world.ground_array.sum())
+
+    expected = run()
+    world.set_snapshot(snapshot)
+    assert run() == expected
+    world.load_snapshot(str(tmp_path / "snapshot.npz"))
+    assert run() == expected
+
+
+def test_clone():
+    world = jyrobot.load_world("soccer")
+    robot = world.robots[0]
+    robot.move(1, 0)
+    world.steps(5, real_time=False, show=False, quiet=True, show_progress=False)
+    clone = world.clone()
+
+    assert clone.walls[0] is world.walls[0]  # static walls are shared
+    assert clone.ground_array is world.ground_array
+
+    clone.robots[0].pen_down("red", 3)
+    clone.steps(5, real_time=False, show=False, quiet=True, show_progress=False)
+
+    assert robot.get_pose() != clone.robots[0].get_pose()
+    assert len(robot.trace) == 5
+    assert len(clone.robots[0].trace) == 10
+    assert clone.ground_array is not world.ground_array
+    assert world.get_ground_color_at(robot.x, robot.y, 0) != [
+        Color("red").to_tuple()
+    ]
+
+
+def test_clone_fields():
+    world = jyrobot.load_world("two-scribblers")
+    world.set_ray_engine("grid", 2.0)
+    world.set_light_field(2.0)
+    world.update(show=False)
+    clone = world.clone()
+    clone.add_wall("red", 10, 10, 20, 20)
+    clone.update(show=False)
+
+    def get_arrays():
+        return [
+            world.get_distance_field().field,
+            world.get_light_field().grid.grid,
+            world.get_occupancy_grid().grid,
+        ]
+
+    arrays = get_arrays()
+    for i in range(3):
+        world.update(show=False)
+        clone.update(show=False)
+    # The original's fields were not rebuilt for the clone's walls:
+    assert all(a is b for a, b in zip(arrays, get_arrays()))
+    assert clone.get_occupancy_grid() is not world.get_occupancy_grid()
+    assert len(clone.get_occupancy_grid().walls) == len(
+        world.get_occupancy_grid().walls
+    ) + 1
+
+
+def test_batch():
+    world = World(width=500, height=500, quiet=True)
+    draws = []
+    world.draw = lambda: draws.append(world.complexity)
+    with world.batch():
+        for x in range(10, 490, 10):
+            world.add_wall("blue", x, 10, x + 5, 15)
+        assert world.complexity == 4
+        assert draws == []
+
+    assert world.complexity == 4 + 48 * 4
+    assert draws == [world.complexity]
+
+    world.save()
+    world.reset()
+    assert len(world.walls) == 4 + 48
+
+
+def test_reset_from_snapshot():
+    world = jyrobot.load_world("soccer")
+    world.reset()  # takes the snapshot
+
+    def run():
+        robot = world.robots[0]
+        robot.move(1, 0.5)
+        robot.pen_down("red", 2)
+        world.steps(10, real_time=False, show=False, quiet=True, show_progress=False)
+        robot.stop()
+        robot.pen_up()
+
+    run()
+    world._reset_snapshot = None
+    world.reset()
+    expected = world.get_snapshot()
+
+    run()
+    world.from_json = None  # not used
+    world.reset()
+    snapshot = world.get_snapshot()
+
+    assert snapshot["time"] == expected["time"] == 0.0
+    assert snapshot["random"] == expected["random"]
+    assert snapshot["ground"] is expected["ground"] is None
+    assert snapshot["robots"] == expected["robots"]
+
+
+def test_reset_restores_settings():
+    world = jyrobot.load_world("soccer")
+    world.reset()
+    robot = world.robots[0]
+    camera = robot["camera"]
+    expected = (world.to_json(), str(robot.color), list(camera.cameraShape))
+
+    for change in [
+        lambda: robot.set_color("purple"),
+        lambda: robot.set_max_trace_length(1),
+        lambda: camera.set_size(64, 32),
+        lambda: world.add_wall("red", 10, 10, 20, 20),
+    ]:
+        change()
+        world.reset()
+
+        assert robot is world.robots[0]
+        assert (world.to_json(), str(robot.color), camera.cameraShape) == expected
+
+    draws = []
+    world.draw = lambda: draws.append(world.time)
+    world.reset(show=False)
+    assert draws == []
+
+
+def test_distance_field():
+    world = World(width=100, height=100, quiet=True)
+    world.add_wall("blue", 40, 40, 60, 60)
+    field = world.get_distance_field()
+
+    assert field.get_distance(22.5, 52.5) == 17.5
+    assert field.get_distance(52.5, 52.5) == -7.5  # inside the wall
+    assert world.get_clearance(22.5, 52.5) < 17.5
+
+    world.add_wall("blue", 10, 45, 15, 55)
+    assert world.get_distance_field().get_distance(22.5, 52.5) == 7.5
+
+    # Walls added one at a time give the same field as all at once:
+    world.add_wall("blue", 70, 10, 90, 15)
+    field = world.get_distance_field().field
+    world.set_distance_field()
+    assert np.array_equal(world.get_distance_field().field, field)
+
+
+def test_range_sensors_with_distance_field():
+    worlds = [jyrobot.load_world("two-scribblers") for i in range(2)]
+    worlds[1].set_distance_field(None)
+    readings = []
+    for world in worlds:
+        random.seed(42)
+        for robot in world.robots:
+            robot.move(1, random.random() - 0.5)
+        world.steps(50, real_time=False, show=False, quiet=True, show_progress=False)
+        readings.append(
+            [device.distance for robot in world.robots for device in robot._devices[1:]]
+        )
+
+    assert readings[0] == readings[1]
+    assert min(readings[0]) < 100
+
+
+def test_grid_ray_engine():
+    world = jyrobot.load_world("two-scribblers")
+    robot = world.robots[0]
+    camera = robot["camera"]
+
+    def get_hits():
+        camera._update()
+        return [[(hit.x, hit.y, hit.robot) for hit in hits] for hits in camera.hits]
+
+    exact = get_hits()
+    world.set_ray_engine("grid", 2.0)
+    assert get_hits() == exact
+    assert any(hit[2] is not None for hits in exact for hit in hits)
+
+
+def test_light_field():
+    world = World(width=100, height=100, quiet=True)
+    world.add_wall("blue", 40, 20, 45, 80)
+    world.add_bulb(Bulb("yellow", 20, 50, 1, 1))
+    assert world.get_light_field() is None
+    world.set_light_field(2.0)
+    field = world.get_light_field()
+
+    assert field.get_light(10, 50, world.bulbs[0]) == LightField.LIT
+    assert field.get_light(70, 50, world.bulbs[0]) == LightField.DARK
+    assert field.get_light(41, 50, world.bulbs[0]) == LightField.CHECK  # the wall
+
+    world.add_bulb(Bulb("yellow", 70, 10, 1, 1))
+    assert world.get_light_field().get_light(70, 50, world.bulbs[1]) == LightField.LIT
+
+    world.add_robot(jyrobot.Scribbler(x=80, y=50, a=0))
+    world.add_robot(jyrobot.Scribbler(x=60, y=30, a=0))  # in the way of some
+    light = jyrobot.LightSensor()
+    world.robots[0].add_device(light)
+    readings = []
+    for resolution in [None, 2.0]:
+        world.set_light_field(resolution)
+        for x in range(50, 95, 3):
+            world.robots[0].set_pose(x, 50, 0)
+            light.update()
+            readings.append(light.get_reading())
+    assert readings[: len(readings) // 2] == readings[len(readings) // 2 :]
+    assert 0 < max(readings)
+
+
+def test_light_field_thin_walls():
+    world = World(width=100, height=100, quiet=True)
+    # Walls thinner than, and shorter than, a cell of the field:
+    world.add_wall("blue", 40, 40, 40.3, 40.3)
+    world.add_wall("blue", 50.5, 30, 51, 33)
+    world.add_wall("blue", 30, 61.2, 45, 61.4)
+    world.add_wall("blue", 60, 70, 60.5, 70.5)
+    world.add_bulb(Bulb("yellow", 20, 20, 1, 1))
+    world.add_bulb(Bulb("yellow", 80, 50, 1, 1))
+    world.add_robot(jyrobot.Scribbler(x=10, y=10, a=0))
+    light = jyrobot.LightSensor()
+    world.robots[0].add_device(light)
+    readings = []
+    for resolution in [None, 4.0]:
+        world.set_light_field(resolution)
+        for x in np.arange(25, 95, 0.7):
+            for y in [40.6, 41, 45, 62, 71, 80]:
+                world.robots[0].set_pose(x, y, 0)
+                light.update()
+                readings.append(light.get_reading())
+    assert readings[: len(readings) // 2] == readings[len(readings) // 2 :]
+
+
+def test_panorama_ray_engine():
+    world = jyrobot.load_world("two-scribblers")
+    robot = world.robots[0]
+    camera = robot["camera"]
+
+    def get_hits():
+        hits = []
+        for direction in range(0, 360, 45):
+            robot.set_pose(robot.x, robot.y, direction)
+            camera._update()
+            for column in camera.hits:
+                hits.append([(hit.x, hit.y, hit.robot) for hit in column])
+        return hits
+
+    exact = get_hits()
+    world.set_ray_engine("panorama", 2.0)
+    assert get_hits() == exact
+    panorama = robot.get_panorama(robot.x, robot.y)
+    assert panorama.version is not None
+
+    robot.set_pose(robot.x + 1, robot.y, 0)  # a small move keeps it
+    assert robot.get_panorama(robot.x, robot.y) is panorama
+    robot.set_pose(robot.x + 100, robot.y, 0)
+    assert robot.get_panorama(robot.x, robot.y) is not panorama
+
+
+def test_ray_query_modes():
+    world = jyrobot.load_world("two-scribblers")
+    robot = world.robots[0]
+    rays = [(robot.x, robot.y, a / 10, 300) for a in range(63)]
+    for engine in ["exact", "grid", "panorama"]:
+        world.set_ray_engine(engine)
+        for ray in rays:
+            hits = robot.cast_ray(*ray)
+            closest = robot.cast_ray(*ray, mode="closest")
+            assert [hit.distance for hit in closest] == [
+                hit.distance for hit in hits[-1:]
+            ]
+            found = robot.cast_ray(*ray, mode="any")
+            assert len(found) == min(len(hits), 1)
+
+    with pytest.raises(ValueError):
+        robot.cast_ray(*rays[0], mode="first")
+
+
+def test_profile():
+    world = jyrobot.load_world("two-scribblers")
+    for robot in world.robots:
+        robot.move(1, 0.1)
+    with world.profile() as profiler:
+        world.steps(5, real_time=False, show=False, quiet=True, show_progress=False)
+    world.steps(5, real_time=False, show=False, quiet=True, show_progress=False)
+    report = profiler.get_report()
+
+    assert world.profiler is None
+    assert report["steps"] == 5
+    assert report["phases"]["step"]["calls"] == 5
+    for phase in ["kinematics", "collision", "rays", "ground", "watchers"]:
+        assert report["phases"][phase]["seconds"] > 0
+    assert [totals["name"] for totals in report["robots"]] == [
+        robot.name for robot in world.robots
+    ]
+    for robot, totals in zip(world.robots, report["robots"]):
+        phases = totals["phases"]
+        for device in robot._devices:
+            assert "device " + type(device).__name__ in phases
+    counters = report["counters"]
+    assert report["phases"]["rays"]["calls"] <= counters["rays"]
+    assert 0 < counters["hits"] <= counters["segments"]
+    assert "5 steps" in str(profiler)
+
+
+def test_profile_same_names():
+    world = World(width=100, height=100, quiet=True)
+    world.add_robot(jyrobot.Scribbler(x=20, y=50, a=0))
+    world.add_robot(jyrobot.Scribbler(x=80, y=50, a=0))
+    world.robots[1].add_device(jyrobot.RangeSensor())
+    for robot in world.robots:
+        robot.name = "Robbie"
+    with world.profile() as profiler:
+        world.steps(3, real_time=False, show=False, quiet=True, show_progress=False)
+    report = profiler.get_report()
+
+    assert [totals["name"] for totals in report["robots"]] == ["Robbie", "Robbie"]
+    assert "device RangeSensor" not in report["robots"][0]["phases"]
+    calls = report["phases"]["device RangeSensor"]["calls"]
+    assert report["robots"][1]["phases"]["device RangeSensor"]["calls"] == calls